@@ -0,0 +1,824 @@
+#!/usr/bin/env python3
+
+
+"""
+asyncio version of the tolino cloud client. All the requests are sent with
+curl_cffi async sessions, so that many operations (on many accounts) can
+share one event loop without a thread per request.
+"""
+
+
+import asyncio
+import logging
+import time
+from pathlib import Path
+
+
+import curl_cffi
+
+
+from pytolino.tolino_cloud import (
+        Client,
+        PytolinoException,
+        token_headers,
+        )
+from pytolino.requests_keys import (
+        DELIVERABLE_ID, CONTENT_TYPE)
+from pytolino.inventory import Inventory, get_book_id
+from pytolino.inventory_stream import InventoryParser
+from pytolino.inventory_table import InventoryTable
+from pytolino.book import Book
+from pytolino.sync import SyncPlan, scan_directory, DELETE, REPLACE
+from pytolino.token_store import TokenStore
+from pytolino.transport import Transport, AUTH, BOSH, POOL_SIZE
+from pytolino.retry import RetryPolicy
+from pytolino.metrics import Metrics, TOKEN_REFRESH, TOKEN_ADOPTED
+from pytolino.multipart import MultipartEncoder
+from pytolino.upload_index import file_sha256
+
+
+class AsyncClient(Client):
+
+    """same as Client, but the methods that send requests are coroutines.
+
+    the client should be closed when not needed anymore::
+
+        async with AsyncClient(username) as client:
+            await client.login(password)
+            inventory = await client.get_inventory()
+
+    """
+
+    def __init__(
+            self,
+            username: str,
+            server_name='orellfuessli',
+            max_clients=10,
+            token_refresh_margin: float = None,
+            token_store: TokenStore = None,
+            metrics: Metrics = None,
+            transport_settings: dict = None,
+            retry_policy: RetryPolicy = None,
+            server_settings: dict = None,
+            ):
+        """
+        :username: str
+        :server_name: tolino partner
+        :max_clients: max number of concurrent requests of each session
+        :token_refresh_margin: if not None, the access token is renewed
+        before a request when it expires in less than this time (s)
+        :token_store: where the tokens are saved. if None, a
+        JsonFileTokenStore in the data folder of pytolino
+        :metrics: Metrics recording the requests and token refreshes. if
+        None, nothing is recorded
+        :transport_settings: dict of endpoint group (auth or bosh): dict of
+        settings replacing the ones of common_settings.toml. the pool_size
+        of every group is max_clients
+        :retry_policy: when the failed requests are sent again. if None, a
+        RetryPolicy with the settings of common_settings.toml
+        :server_settings: dict of settings replacing the ones of the partner
+        in servers_settings.toml
+
+        """
+        self._max_clients = max_clients
+        super().__init__(
+                username,
+                server_name,
+                token_refresh_margin=token_refresh_margin,
+                token_store=token_store,
+                metrics=metrics,
+                transport_settings=transport_settings,
+                retry_policy=retry_policy,
+                server_settings=server_settings,
+                )
+        self._async_token_lock = asyncio.Lock()
+        self._refresher_task = None
+
+    def _create_sessions(self):
+        """async session for BOSH requests and async session for auth
+        requests
+
+        """
+        groups_settings = {
+                group: {**settings, POOL_SIZE: self._max_clients}
+                for group, settings in self._groups_settings().items()}
+        self._transport = Transport(groups_settings, asynchronous=True)
+        self._session = self._transport.session(BOSH)
+        self._session_cffi = self._transport.session(AUTH)
+
+    async def _send(self, endpoint: str, send, url: str, **kwargs):
+        """send a request with the rate limiter of the host, and send it
+        again if the retry policy allows it
+
+        :endpoint: name of the endpoint
+        :send: coroutine method of a session (get, post...)
+        :url: str
+        :kwargs: arguments of send
+        :returns: the last response
+
+        """
+        streamed = kwargs.get('stream', False)
+        attempt = 0
+        while True:
+            attempt += 1
+            delay = self._rate_limit_delay(url)
+            if delay:
+                await asyncio.sleep(delay)
+            if attempt > 1:
+                self._rewind_body(kwargs)
+            try:
+                response = await send(url, **kwargs)
+                self._observe_response(response, endpoint, streamed)
+            except Exception as e:
+                delay = self._retry_delay(endpoint, attempt, error=e)
+                if delay is None:
+                    raise
+            else:
+                delay = self._retry_delay(endpoint, attempt, response)
+                if delay is None:
+                    return response
+                if streamed:
+                    await response.aclose()
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        """close the sessions of the client"""
+        await self.stop_token_refresher()
+        for session in self._transport.sessions():
+            await session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _get_auth_headers(self):
+        # the token is renewed by the coroutines before building the headers
+        return self._auth_headers()
+
+    async def _refresh_token_if_expiring(self):
+        """renew the access token if it expires soon. if several tasks
+        see it at the same time, only one sends the request and the others
+        wait for its result.
+
+        """
+        if not self._access_token_expiring():
+            return
+        async with self._async_token_lock:
+            if self._access_token_expiring():
+                logging.info('access token expires soon, renew it...')
+                await self._renew_access_token()
+
+    async def _token_refresher_loop(self):
+        while True:
+            margin = self._token_refresh_margin
+            delay = self._access_expiration_time - margin - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            try:
+                await self._refresh_token_if_expiring()
+            except Exception:
+                # a network error must not stop the refresher, retry later
+                logging.exception('background token refresh failed')
+                await asyncio.sleep(self.TOKEN_REFRESHER_RETRY_DELAY)
+
+    def start_token_refresher(self):
+        """renew the access token in a background task,
+        token_refresh_margin seconds before it expires. must be called
+        from the event loop.
+
+        """
+        if self._token_refresh_margin is None:
+            raise PytolinoException(
+                    'the client needs a token_refresh_margin')
+        if self._refresher_task is None:
+            self._refresher_task = asyncio.create_task(
+                    self._token_refresher_loop())
+
+    async def stop_token_refresher(self):
+        """stop the background task started by start_token_refresher"""
+        if self._refresher_task is None:
+            return
+        self._refresher_task.cancel()
+        try:
+            await self._refresher_task
+        except asyncio.CancelledError:
+            pass
+        self._refresher_task = None
+
+    @property
+    def inventory(self) -> Inventory:
+        """indexed view of the last downloaded inventory. get_inventory must
+        be awaited first, and again after an upload, a delete or a metadata
+        change made with this client.
+
+        """
+        with self._cache_lock:
+            books = self._inventory_books
+            inventory = self._inventory
+        if inventory is None:
+            if books is None:
+                raise PytolinoException(
+                        'the inventory must be downloaded first')
+            inventory = Inventory(books)
+            with self._cache_lock:
+                if self._inventory_books is books:
+                    self._inventory = inventory
+        return inventory
+
+    async def import_token(self, refresh_token: str, hardware_id: str):
+        """add manually a refresh token to GUI login
+
+        :refresh_token: obtained from tolino(?) or during a manual
+        login and inspector tool
+        :hardware_id:
+
+        """
+        self._refresh_token = refresh_token
+        self._hardware_id = hardware_id
+        try:
+            await self._renew_access_token(adopt_stored_token=False)
+        except PytolinoException as e:
+            logging.error(e)
+            logging.error('could not get a new access token with'
+                          ' this refresh token')
+
+    async def _renew_access_token(self, adopt_stored_token=True):
+        """get a new access and refresh tokens. the token store is locked
+        meanwhile, so that only one process sharing the account renews it.
+
+        :adopt_stored_token: if True and another client has already renewed
+        the token, its token is used instead of sending a request
+
+        """
+        lock = self._token_store.lock(self._token_key)
+        # the lock may block (file lock), so it is acquired in a thread
+        await asyncio.to_thread(lock.acquire)
+        try:
+            if adopt_stored_token and self._adopt_stored_token():
+                self._metrics.observe_event(self._server_name, TOKEN_ADOPTED)
+                return
+
+            with self._metrics.time_event(self._server_name, TOKEN_REFRESH):
+                headers = token_headers
+                data = self._refresh_token_data()
+                url = self._token_url
+                host_response = await self._send(
+                        'token',
+                        self._session_cffi.post,
+                        url,
+                        data=data,
+                        verify=True,
+                        allow_redirects=True,
+                        headers=headers,
+                        )
+                self._log_request(host_response, data)
+
+                self._read_and_store_token_response(host_response)
+            self._store_current_token()
+        finally:
+            lock.release()
+        self._log_new_token()
+
+    async def _get_auth_code_with_saved_cookies(self) -> str:
+        """try to get an auth code with the cookies of the last GUI login,
+        to avoid starting a browser.
+
+        :returns: auth code, or None if there are no valid cookies or if
+        they were rejected
+
+        """
+        cookies = self._valid_saved_cookies()
+        if not cookies:
+            return None
+        logging.info('try to login with the saved cookies...')
+        self._set_session_cookies(cookies)
+        try:
+            return await self._get_auth_code()
+        except PytolinoException as e:
+            logging.info(f'saved cookies were rejected: {e}')
+            self._clear_session_cookies()
+            self._login_cookies = []
+            return None
+
+    async def _get_auth_code(self):
+        url = self._auth_url
+        params = self._auth_code_params()
+        host_response = await self._send(
+                'auth',
+                self._session_cffi.get,
+                url,
+                params=params,
+                verify=True,
+                allow_redirects=False,
+                )
+        self._log_request(host_response, params)
+        return self._read_auth_code_response(host_response)
+
+    async def _get_token(self, auth_code: str):
+        data = self._token_data(auth_code)
+        headers = token_headers
+        url = self._token_url
+        host_response = await self._send(
+                'token',
+                self._session_cffi.post,
+                url,
+                data=data,
+                verify=True,
+                allow_redirects=False,
+                headers=headers,
+                )
+        self._log_request(host_response, data)
+        self._read_and_store_token_response(host_response)
+
+    async def _get_hardware_id(self):
+        url = self._devices_url
+        data, headers = self._hardware_id_request()
+        host_response = await self._send(
+                'devices',
+                self._session.post,
+                url,
+                data=data,
+                headers=headers,
+                )
+        self._log_request(host_response, data)
+        self._read_hardware_id_response(host_response)
+
+    async def login(self, password, allow_GUI_autologin=True,
+                    browser_pool=None):
+        """login to the partner and get access token. the cookies of the
+        last GUI login are tried before starting a browser. the GUI login (if
+        necessary) runs in a thread, since selenium is blocking.
+
+        :password: str
+        :allow_GUI_autologin: if False, a browser is never started
+        :browser_pool: BrowserLoginPool in which the GUI login is done.
+        if None, a new browser is started and closed
+
+        """
+        logged_in = False
+        get_a_new_token = self._token_is_renewable()
+
+        if get_a_new_token:
+            try:
+                logging.info('ask for new access token...')
+                await self._renew_access_token()
+            except PytolinoException as e:
+                logging.warning(e)
+                logging.warning('previous access token could not be renewed')
+            else:
+                logged_in = True
+
+        if not logged_in:
+            auth_code = await self._get_auth_code_with_saved_cookies()
+            if auth_code is None and allow_GUI_autologin:
+                await asyncio.to_thread(
+                        self._get_login_cookies, password, browser_pool)
+                auth_code = await self._get_auth_code()
+            if auth_code is not None:
+                await self._get_token(auth_code)
+                await self._get_hardware_id()
+                self._store_current_token()
+                logged_in = True
+        if not logged_in:
+            raise PytolinoException('could not login')
+
+    async def _request_inventory(self, params: dict, stream=False):
+        url = self._inventory_url
+        headers = self._get_auth_headers()
+        host_response = await self._send(
+                'inventory',
+                self._session.get,
+                url,
+                params=params,
+                headers=headers,
+                stream=stream,
+                )
+        try:
+            self._log_request(host_response, params, streamed=stream)
+        except PytolinoException:
+            if stream:
+                await host_response.aclose()
+            raise
+        return host_response
+
+    async def _iter_inventory_response(self, host_response, parser):
+        try:
+            async for chunk in host_response.aiter_content():
+                for item in parser.feed(chunk):
+                    yield item
+            for item in parser.close():
+                yield item
+        except ValueError as e:
+            raise PytolinoException(f'inventory list request failed: {e}')
+        finally:
+            await host_response.aclose()
+
+    async def get_inventory(self, incremental=False):
+        """download a list of the books on the cloud and their information
+
+        :incremental: if True, only the changes since the last incremental
+        call are downloaded, and merged with a local copy of the inventory
+        :returns: list of dict describing the book, with a epubMetaData dict
+
+        """
+        await self._refresh_token_if_expiring()
+        params = self._inventory_params(incremental)
+        host_response = await self._request_inventory(params)
+        publication_inventory = self._read_inventory_json(host_response)
+        inventory = self._read_inventory_books(
+                publication_inventory, publication_inventory, params,
+                incremental)
+        self._set_inventory_books(inventory)
+        return inventory
+
+    async def iter_inventory(self):
+        """download the books on the cloud one at a time (async generator):
+        each book is returned as soon as it is received, so the whole
+        inventory is never in memory. the local inventory and its cache are
+        not updated.
+
+        """
+        await self._refresh_token_if_expiring()
+        host_response = await self._request_inventory(
+                self._inventory_params(incremental=False), stream=True)
+        async for _, book in self._iter_inventory_response(
+                host_response, InventoryParser()):
+            yield book
+
+    async def get_books(self, keep_raw=True) -> list:
+        return [Book.from_dict(book, keep_raw)
+                async for book in self.iter_inventory()]
+
+    async def get_inventory_table(self) -> InventoryTable:
+        table = InventoryTable()
+        async for book in self.iter_inventory():
+            table.append(book)
+        return table
+
+    async def add_to_collection(self, book_id, collection_name):
+        """add a book to a collection on the cloud
+
+        :book_id: identify the book on the cloud
+        :collection_name: str name
+
+        """
+        await self._refresh_token_if_expiring()
+        data, headers = self._collection_request(book_id, collection_name)
+        url = self._sync_data_url
+        host_response = await self._send(
+                'sync_data',
+                self._session.patch,
+                url,
+                data=data,
+                headers=headers,
+                )
+        self._log_request(host_response, data)
+
+    async def _patch_sync_data(self, patches: list):
+        """send the patches in one request. if the server finds the payload
+        too large, it is sent again in two halves.
+
+        """
+        await self._refresh_token_if_expiring()
+        data, headers = self._sync_data_request(patches)
+        url = self._sync_data_url
+        host_response = await self._send(
+                'sync_data',
+                self._session.patch,
+                url,
+                data=data,
+                headers=headers,
+                )
+        if host_response.status_code == 413 and len(patches) > 1:
+            half = len(patches) // 2
+            await self._patch_sync_data(patches[:half])
+            await self._patch_sync_data(patches[half:])
+        else:
+            self._log_request(host_response, data)
+
+    async def _update_collections(self, op: str, items, max_patches: int,
+                                  max_bytes: int):
+        patches = [
+                self._collection_patch(op, book_id, collection_name)
+                for book_id, collection_name in items]
+        for chunk in self._chunk_patches(patches, max_patches, max_bytes):
+            await self._patch_sync_data(chunk)
+
+    async def add_to_collection_many(
+            self, items, max_patches=Client.MAX_PATCHES,
+            max_bytes=Client.MAX_PATCHES_BYTES):
+        """add many books to collections, with few requests
+
+        :items: iterable of (book_id, collection_name)
+        :max_patches: max number of books in one request
+        :max_bytes: max size of the patches in one request
+
+        """
+        await self._update_collections('add', items, max_patches, max_bytes)
+
+    async def remove_from_collection_many(
+            self, items, max_patches=Client.MAX_PATCHES,
+            max_bytes=Client.MAX_PATCHES_BYTES):
+        """remove many books from collections, with few requests
+
+        :items: iterable of (book_id, collection_name)
+        :max_patches: max number of books in one request
+        :max_bytes: max size of the patches in one request
+
+        """
+        await self._update_collections(
+                'remove', items, max_patches, max_bytes)
+
+    async def remove_from_collection(self, book_id, collection_name):
+        """remove a book from a collection on the cloud
+
+        :book_id: identify the book on the cloud
+        :collection_name: str name
+
+        """
+        await self.remove_from_collection_many([(book_id, collection_name)])
+
+    async def _update_metadata(self, book_id, new_metadata: dict):
+        """send new metadata of a book. the current metadata is downloaded
+        first, unless it is in the cache, so that the PUT keeps all the
+        other fields of the book.
+
+        :book_id: ref on the cloud of the book
+        :new_metadata: dict of metadata to change
+
+        """
+        await self._refresh_token_if_expiring()
+        url = self._meta_url
+        metadata = self._cached_metadata(book_id)
+        if metadata is None:
+            params = {DELIVERABLE_ID: book_id}
+            headers = self._get_auth_headers()
+            host_response = await self._send(
+                    'meta',
+                    self._session.get,
+                    url,
+                    params=params,
+                    headers=headers,
+                    )
+            self._log_request(host_response, params)
+            metadata = self._read_metadata_response(host_response)
+            self._cache_metadata(book_id, metadata)
+
+        metadata, data = self._merge_metadata(metadata, new_metadata)
+        headers = self._metadata_put_headers()
+        host_response = await self._send(
+                'meta',
+                self._session.put,
+                url,
+                data=data,
+                headers=headers,
+                )
+        self._log_request(host_response, data)
+        self._cache_metadata(book_id, metadata)
+        self._invalidate_inventory()
+
+    async def upload_metadata(self, book_id, **new_metadata):
+        """upload some metadata to a specific book on the cloud. the
+        current metadata is downloaded first, unless this client sent or
+        received it in the last META_CACHE_MAX_AGE seconds.
+
+        :book_id: ref on the cloud of the book
+        :**meta_data: dict of metadata than can be changed
+
+        """
+        await self._update_metadata(book_id, new_metadata)
+
+    async def update_metadata_many(self, updates, max_workers=4) -> dict:
+        """upload metadata of many books concurrently. the updates of a
+        book are merged in one PUT request, preceded by a GET of its current
+        metadata unless it is in the cache (see upload_metadata).
+
+        :updates: dict {book_id: dict of metadata}, or iterable of
+        (book_id, dict of metadata). several updates of the same book are
+        merged.
+        :max_workers: number of books updated at the same time
+        :returns: dict {book_id: None, or exception if the update failed}
+
+        """
+        merged_updates = self._merge_metadata_updates(updates)
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def update_one(book_id):
+            async with semaphore:
+                try:
+                    await self._update_metadata(
+                            book_id, merged_updates[book_id])
+                except Exception as e:
+                    logging.error(f'metadata update of {book_id} failed: {e}')
+                    return e
+
+        results = await asyncio.gather(
+                *(update_one(book_id) for book_id in merged_updates))
+        return dict(zip(merged_updates, results))
+
+    async def _get_cloud_ids(self) -> set:
+        """ids of the books on the cloud, see Client._get_cloud_ids"""
+        with self._cache_lock:
+            cloud_ids = self._cloud_ids
+        if cloud_ids is not None:
+            return cloud_ids
+        cloud_ids = {
+                get_book_id(book) for book in await self.get_inventory()}
+        with self._cache_lock:
+            if self._cloud_ids is None:
+                self._cloud_ids = cloud_ids
+            return self._cloud_ids
+
+    async def upload(
+            self,
+            file_path: Path or str,
+            name=None,
+            progress=None,
+            skip_uploaded=False,
+            ):
+        """upload an ebook to your cloud. the file is read from the disk by
+        libcurl while it is sent.
+
+        :file_path: str path to the ebook to upload
+        :name: str name of book if different from filename
+        :progress: function called with (bytes sent, total bytes)
+        :skip_uploaded: if True, the file is not sent when the upload index
+        shows that the same content is still on the cloud
+        :returns: epub_id on the server
+
+        """
+        await self._refresh_token_if_expiring()
+        file_path, name, mime = self._ebook_file_info(file_path, name)
+
+        sha256 = None
+        if skip_uploaded:
+            sha256 = await asyncio.to_thread(file_sha256, file_path)
+            book_id = self.upload_index.get(sha256)
+            if book_id is not None \
+                    and book_id in await self._get_cloud_ids():
+                logging.info(f'{file_path} is already on the cloud')
+                return book_id
+
+        url = self._upload_url
+        headers = self._get_auth_headers()
+        if progress is not None:
+            # the encoder reports the bytes read by libcurl
+            files = [('file', (name, file_path, mime))]
+            with MultipartEncoder(files=files, progress=progress) as body:
+                headers[CONTENT_TYPE] = body.content_type
+                host_response = await self._send(
+                        'upload',
+                        self._session.post,
+                        url,
+                        content=body,
+                        headers=headers,
+                        )
+        else:
+            multipart = curl_cffi.CurlMime()
+            multipart.addpart(
+                    'file',
+                    content_type=mime,
+                    filename=name,
+                    local_path=file_path,
+                    )
+            try:
+                host_response = await self._send(
+                        'upload',
+                        self._session.post,
+                        url,
+                        multipart=multipart,
+                        headers=headers,
+                        )
+            finally:
+                multipart.close()
+        self._log_request(host_response, name)
+        book_id = self._read_upload_response(host_response)
+        self._record_upload(book_id, sha256, name)
+        return book_id
+
+    async def upload_many(self, file_paths, max_workers=4, name_fn=None,
+                          skip_uploaded=False) -> list:
+        """upload several ebooks concurrently. a failed upload does not
+        stop the others.
+
+        :file_paths: iterable of Path to the ebooks to upload
+        :max_workers: number of uploads running at the same time
+        :name_fn: function that gives the name of a book from its path.
+        if None, the filename is used
+        :skip_uploaded: do not send the files that are already on the cloud
+        (see upload)
+        :returns: list of (file_path, epub_id or exception), in the order of
+        file_paths
+
+        """
+        file_paths = list(file_paths)
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def upload_one(file_path):
+            name = None if name_fn is None else name_fn(file_path)
+            async with semaphore:
+                try:
+                    return await self.upload(
+                            file_path, name=name, skip_uploaded=skip_uploaded)
+                except Exception as e:
+                    logging.error(f'upload of {file_path} failed: {e}')
+                    return e
+
+        results = await asyncio.gather(
+                *(upload_one(file_path) for file_path in file_paths))
+        return list(zip(file_paths, results))
+
+    async def delete_ebook(self, ebook_id):
+        """delete an ebook present on your cloud
+
+        :ebook_id: id of the ebook to delete.
+        :returns: None
+
+        """
+        await self._refresh_token_if_expiring()
+        url = self._delete_url
+        params = {DELIVERABLE_ID: ebook_id}
+        headers = self._get_auth_headers()
+        host_response = await self._send(
+                'delete',
+                self._session.get,
+                url,
+                params=params,
+                headers=headers,
+                )
+        self._log_request(host_response, params)
+        self._record_delete(ebook_id)
+
+    async def sync_directory(self, directory: Path or str, delete=False,
+                             dry_run=False, max_workers=4) -> SyncPlan:
+        """mirror a folder of ebooks on the cloud, see Client.sync_directory
+
+        """
+        directory = Path(directory).resolve()
+        local_files, missing = await asyncio.to_thread(
+                scan_directory, directory, self.sync_state, max_workers)
+        await self.get_inventory(incremental=True)
+        plan = self._plan_sync(directory, local_files, missing, delete)
+        if dry_run:
+            return plan
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def run_one(action):
+            async with semaphore:
+                try:
+                    if action.kind == DELETE:
+                        await self.delete_ebook(action.book_id)
+                        return None
+                    book_id = await self.upload(action.local_file.path)
+                    self._record_sync_upload(action, book_id)
+                    if action.kind == REPLACE:
+                        await self.delete_ebook(action.book_id)
+                    return book_id
+                except Exception as e:
+                    logging.error(f'sync of {action} failed: {e}')
+                    return e
+
+        results = await asyncio.gather(
+                *(run_one(action) for action in plan.actions))
+        for action, result in zip(plan.actions, results):
+            action.result = result
+        self._finish_sync(plan)
+        return plan
+
+    async def add_cover(self, book_id, filepath: Path or str, prepare=False):
+        """upload a a cover to a book on the cloud
+
+        :book_id: id of the book on the serveer
+        :filepath: path to the cover file, or to an epub
+        :prepare: if True, a big image is downscaled and recompressed first
+
+        """
+        await self._refresh_token_if_expiring()
+        filepath, filename, mime = await asyncio.to_thread(
+                self._cover_file_info, filepath, prepare)
+
+        url = self._cover_url
+        data = {DELIVERABLE_ID: book_id}
+        headers = self._get_auth_headers()
+        multipart = curl_cffi.CurlMime()
+        multipart.addpart(DELIVERABLE_ID, data=str(book_id).encode())
+        multipart.addpart(
+                'file',
+                content_type=mime,
+                filename=filename,
+                local_path=filepath,
+                )
+        try:
+            host_response = await self._send(
+                    'cover',
+                    self._session.post,
+                    url,
+                    multipart=multipart,
+                    headers=headers,
+                    )
+        finally:
+            multipart.close()
+        self._log_request(host_response, data)
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+
+
+"""
+benchmarks of the hot paths of the client, against a fake server running in
+another process (so that the memory and cpu of the server are not counted).
+the results are saved in a json file, and compared with a baseline: a
+change that makes a benchmark slower than the tolerance is reported.
+
+    python -m pytolino.benchmarks --quick
+    python -m pytolino.benchmarks --save-baseline
+"""
+
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+
+from pytolino.tolino_cloud import Client
+from pytolino.token_store import MemoryTokenStore
+from pytolino.retry import RetryPolicy, set_rate_limit
+from pytolino.inventory import get_book_id
+from pytolino.fake_server import server_settings
+
+
+RESULTS_FP = Path('benchmarks') / 'results.json'
+BASELINE_FP = Path('benchmarks') / 'baseline.json'
+TOLERANCE = 0.25
+
+MB = 1024 * 1024
+
+
+class ServerProcess(object):
+
+    """fake server in a subprocess"""
+
+    def __init__(self, books=0):
+        self._books = books
+        self._process = None
+        self.url = None
+        self.refresh_token = None
+        self.hardware_id = None
+
+    def start(self):
+        self._process = subprocess.Popen(
+                [sys.executable, '-m', 'pytolino.fake_server',
+                 '--port', '0', '--books', str(self._books)],
+                stdout=subprocess.PIPE,
+                text=True,
+                )
+        lines = [self._process.stdout.readline().strip() for _ in range(3)]
+        if not all(lines):
+            self.stop()
+            raise RuntimeError('the fake server did not start')
+        self.url = lines[0].rsplit(' ', 1)[-1]
+        self.refresh_token = lines[1].rsplit(' ', 1)[-1]
+        self.hardware_id = lines[2].rsplit(' ', 1)[-1]
+        # no client-side limit for the local server
+        set_rate_limit(self.url, rate=0, burst=1)
+        return self
+
+    def new_client(self) -> Client:
+        client = Client(
+                'benchmark',
+                token_store=MemoryTokenStore(),
+                server_settings=server_settings(self.url),
+                retry_policy=RetryPolicy(max_attempts=1),
+                )
+        client.import_token(self.refresh_token, self.hardware_id)
+        # the server rotates the refresh token
+        self.refresh_token = client.refresh_token
+        return client
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+            self._process.stdout.close()
+            self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def _percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, round(fraction * (len(values) - 1)))
+    return values[index]
+
+
+def bench_import_time(quick: bool) -> dict:
+    """time to import the client in a new interpreter"""
+    code = ('import time; start = time.perf_counter(); '
+            'import pytolino.tolino_cloud; '
+            'print(time.perf_counter() - start)')
+    durations = []
+    for _ in range(3 if quick else 7):
+        output = subprocess.run(
+                [sys.executable, '-c', code],
+                capture_output=True,
+                text=True,
+                check=True,
+                ).stdout
+        durations.append(float(output))
+    return {'import_s': min(durations)}
+
+
+def bench_token_refresh(quick: bool) -> dict:
+    """latency of the renewal of the access token"""
+    n = 20 if quick else 100
+    with ServerProcess() as server:
+        client = server.new_client()
+        durations = []
+        for _ in range(n):
+            start = time.perf_counter()
+            client._renew_access_token(adopt_stored_token=False)
+            durations.append(time.perf_counter() - start)
+    return {
+            'token_refresh_median_s': statistics.median(durations),
+            'token_refresh_p95_s': _percentile(durations, 0.95),
+            }
+
+
+def bench_upload(quick: bool) -> dict:
+    """upload throughput per file size and number of workers"""
+    sizes = (100 * 1024, MB) if quick else (100 * 1024, MB, 10 * MB)
+    workers = (1, 4) if quick else (1, 4, 8)
+    total_bytes = 4 * MB if quick else 40 * MB
+    results = {}
+    with ServerProcess() as server, \
+            tempfile.TemporaryDirectory() as directory:
+        client = server.new_client()
+        for size in sizes:
+            n = max(4, min(200, total_bytes // size))
+            paths = []
+            for i in range(n):
+                path = Path(directory) / f'{size}_{i}.epub'
+                path.write_bytes(os.urandom(size))
+                paths.append(path)
+            for max_workers in workers:
+                start = time.perf_counter()
+                for path, result in client.upload_many(
+                        paths, max_workers=max_workers):
+                    if isinstance(result, Exception):
+                        raise result
+                duration = time.perf_counter() - start
+                key = f'upload_{size // 1024}k_x{max_workers}'
+                results[f'{key}_mb_per_s'] = n * size / MB / duration
+    return results
+
+
+def bench_inventory(quick: bool) -> dict:
+    """time and peak memory to download and parse the inventory"""
+    sizes = (1000, 10000) if quick else (1000, 10000, 100000)
+    results = {}
+    for size in sizes:
+        with ServerProcess(books=size) as server:
+            client = server.new_client()
+            durations = []
+            for _ in range(2 if quick else 3):
+                start = time.perf_counter()
+                books = client.get_inventory()
+                durations.append(time.perf_counter() - start)
+                if len(books) != size:
+                    raise RuntimeError(f'{len(books)} books instead of {size}')
+            del books
+            tracemalloc.start()
+            client.get_inventory()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            tracemalloc.start()
+            for _ in client.iter_inventory():
+                pass
+            _, stream_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            tracemalloc.start()
+            table = client.get_inventory_table()
+            table_size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del table
+        key = f'inventory_{size // 1000}k'
+        results[f'{key}_s'] = min(durations)
+        results[f'{key}_peak_mb'] = peak / MB
+        results[f'{key}_stream_peak_mb'] = stream_peak / MB
+        results[f'{key}_table_mb'] = table_size / MB
+    return results
+
+
+def bench_batches(quick: bool) -> dict:
+    """throughput of the metadata and collection batches"""
+    n = 100 if quick else 500
+    with ServerProcess(books=n) as server:
+        client = server.new_client()
+        book_ids = [get_book_id(book) for book in client.get_inventory()]
+
+        updates = [(book_id, {'publisher': 'benchmark'})
+                   for book_id in book_ids]
+        start = time.perf_counter()
+        errors = [error for error in client.update_metadata_many(
+            updates, max_workers=4).values() if error is not None]
+        duration = time.perf_counter() - start
+        if errors:
+            raise errors[0]
+        results = {'metadata_batch_per_s': n / duration}
+
+        items = [(book_id, 'benchmark') for book_id in book_ids]
+        start = time.perf_counter()
+        client.add_to_collection_many(items)
+        duration = time.perf_counter() - start
+        results['collection_batch_per_s'] = n / duration
+    return results
+
+
+def bench_sync(quick: bool) -> dict:
+    """sync of a folder: first upload, then a sync of the unchanged folder"""
+    n = 1000 if quick else 10000
+    with ServerProcess() as server, \
+            tempfile.TemporaryDirectory() as directory:
+        client = server.new_client()
+        for i in range(n):
+            folder = Path(directory) / f'{i // 1000}'
+            folder.mkdir(exist_ok=True)
+            (folder / f'{i}.epub').write_bytes(os.urandom(1024))
+        start = time.perf_counter()
+        plan = client.sync_directory(directory, max_workers=8)
+        duration = time.perf_counter() - start
+        if plan.failed:
+            raise plan.failed[0].result
+        results = {'sync_upload_per_s': n / duration}
+        start = time.perf_counter()
+        plan = client.sync_directory(directory)
+        results['sync_unchanged_s'] = time.perf_counter() - start
+        if plan.actions:
+            raise RuntimeError(f'{len(plan.actions)} actions instead of 0')
+    return results
+
+
+BENCHMARKS = {
+        'import_time': bench_import_time,
+        'token_refresh': bench_token_refresh,
+        'upload': bench_upload,
+        'inventory': bench_inventory,
+        'batches': bench_batches,
+        'sync': bench_sync,
+        }
+
+
+def run(quick=False, only=None) -> dict:
+    """
+    :quick: smaller sizes and fewer repetitions
+    :only: list of names of benchmarks to run, all if None
+    :returns: dict of benchmark name: dict of metric: value
+
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as data_home:
+        # the local caches of the clients are not mixed with the user ones
+        previous = os.environ.get('XDG_DATA_HOME')
+        os.environ['XDG_DATA_HOME'] = data_home
+        try:
+            for name, benchmark in BENCHMARKS.items():
+                if only and name not in only:
+                    continue
+                print(f'{name}...', file=sys.stderr, flush=True)
+                results[name] = benchmark(quick)
+        finally:
+            if previous is None:
+                del os.environ['XDG_DATA_HOME']
+            else:
+                os.environ['XDG_DATA_HOME'] = previous
+    return results
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith('_per_s')
+
+
+def compare(results: dict, baseline: dict, tolerance=TOLERANCE) -> list:
+    """
+    :results: results of run
+    :baseline: results of a previous run
+    :tolerance: relative change that is not reported
+    :returns: list of str describing the regressions
+
+    """
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            reference = baseline.get(name, {}).get(metric)
+            if not reference:
+                continue
+            change = value / reference - 1
+            if higher_is_better(metric):
+                change = -change
+            if change > tolerance:
+                regressions.append(
+                        f'{name}.{metric}: {value:.4g} '
+                        f'(baseline {reference:.4g}, {change:+.0%} worse)')
+    return regressions
+
+
+def missing_from_baseline(results: dict, baseline: dict) -> list:
+    """
+    :returns: list of str describing the metrics that are not compared,
+    because the baseline has no value for them
+
+    """
+    return [f'{name}.{metric}: {value:.4g}'
+            for name, metrics in results.items()
+            for metric, value in metrics.items()
+            if baseline.get(name, {}).get(metric) is None]
+
+
+# the results depend on these, the others (commit, time) are informative
+COMPARED_ENVIRONMENT = ('python', 'machine', 'system', 'cpus')
+
+
+def environment_differences(environment: dict, baseline: dict) -> list:
+    """
+    :environment: environment of the run (see _environment)
+    :baseline: environment of the baseline
+    :returns: list of str describing the differences that make the
+    comparison meaningless. the python versions are compared without the
+    micro version
+
+    """
+    differences = []
+    for key in COMPARED_ENVIRONMENT:
+        value = environment.get(key)
+        reference = baseline.get(key)
+        if key == 'python':
+            value, reference = (
+                    None if version is None
+                    else '.'.join(str(version).split('.')[:2])
+                    for version in (value, reference))
+        if value != reference:
+            differences.append(f'{key}: {value} (baseline {reference})')
+    return differences
+
+
+def _environment() -> dict:
+    try:
+        commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'system': platform.system(),
+            'cpus': os.cpu_count(),
+            'commit': commit,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            }
+
+
+def _write(path: Path, results: dict, quick: bool):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {'environment': _environment(), 'quick': quick,
+            'results': results}
+    path.write_text(json.dumps(data, indent=2, sort_keys=True) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description='benchmarks of pytolino against a fake server')
+    parser.add_argument('--quick', action='store_true',
+                        help='smaller sizes, for a fast check')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS))
+    parser.add_argument('--output', type=Path, default=RESULTS_FP)
+    parser.add_argument('--baseline', type=Path, default=BASELINE_FP)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='save the results as the new baseline')
+    parser.add_argument('--ignore-environment', action='store_true',
+                        help='compare with a baseline of another machine')
+    args = parser.parse_args(argv)
+
+    results = run(quick=args.quick, only=args.only)
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            print(f'{name}.{metric}: {value:.4g}')
+    _write(args.output, results, args.quick)
+    if args.save_baseline:
+        _write(args.baseline, results, args.quick)
+        return 0
+
+    if not args.baseline.exists():
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get('quick') != args.quick:
+        print('the baseline was not run with the same --quick option,'
+              ' not compared', file=sys.stderr)
+        return 0
+    differences = environment_differences(
+            _environment(), baseline.get('environment', {}))
+    if differences:
+        print('the baseline was run in another environment ('
+              + ', '.join(differences) + ')', file=sys.stderr)
+        if not args.ignore_environment:
+            print('not compared, run with --save-baseline on this machine'
+                  ' or with --ignore-environment', file=sys.stderr)
+            return 0
+    for missing in missing_from_baseline(results, baseline['results']):
+        print(f'NO BASELINE {missing}')
+    regressions = compare(results, baseline['results'], args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+
+"""
+compact record of an inventory entry. an entry of get_inventory is a nested
+dict with many fields that are seldom read; a Book keeps the common fields
+in slots, and the whole entry as compact json that is decoded only when
+asked.
+"""
+
+
+import json
+
+
+from pytolino.requests_keys import EPUB_METADATA, IDENTIFIER
+
+
+def _authors(value) -> tuple:
+    if value is None:
+        return ()
+    if isinstance(value, (list, tuple)):
+        return tuple(str(author) for author in value)
+    return (str(value),)
+
+
+class Book(object):
+
+    """the common fields of an inventory entry. the missing fields are None
+    (authors is an empty tuple)
+
+    """
+
+    __slots__ = (
+            'book_id',
+            'title',
+            'authors',
+            'isbn',
+            'publisher',
+            'language',
+            'format',
+            'file_size',
+            '_raw',
+            )
+
+    # field name: key in epubMetaData
+    METADATA_KEYS = {
+            'book_id': IDENTIFIER,
+            'title': 'title',
+            'authors': 'author',
+            'isbn': 'isbn',
+            'publisher': 'publisher',
+            'language': 'language',
+            'format': 'format',
+            'file_size': 'fileSize',
+            }
+    FIELDS = tuple(METADATA_KEYS)
+
+    def __init__(self, book_id: str, title=None, authors=(), isbn=None,
+                 publisher=None, language=None, format=None, file_size=None,
+                 raw: bytes = None):
+        """
+        :raw: the entry of the inventory, encoded in json (see from_dict)
+
+        """
+        self.book_id = book_id
+        self.title = title
+        self.authors = _authors(authors)
+        self.isbn = isbn
+        self.publisher = publisher
+        self.language = language
+        self.format = format
+        self.file_size = file_size
+        self._raw = raw
+
+    @classmethod
+    def from_dict(cls, book: dict, keep_raw=True):
+        """
+        :book: dict of an inventory entry, as returned by get_inventory
+        :keep_raw: if False, the other fields are dropped, and raw is built
+        from the common fields
+        :returns: Book
+
+        """
+        metadata = book.get(EPUB_METADATA) or {}
+        raw = None
+        if keep_raw:
+            raw = json.dumps(
+                    book, ensure_ascii=False, separators=(',', ':')
+                    ).encode()
+        return cls(
+                **{field: metadata.get(key)
+                   for field, key in cls.METADATA_KEYS.items()},
+                raw=raw,
+                )
+
+    @property
+    def raw(self) -> dict:
+        """the inventory entry, decoded at each access"""
+        if self._raw is not None:
+            return json.loads(self._raw)
+        metadata = {}
+        for field, key in self.METADATA_KEYS.items():
+            value = getattr(self, field)
+            if field == 'authors':
+                value = list(value)
+            if value is not None:
+                metadata[key] = value
+        return {EPUB_METADATA: metadata}
+
+    @property
+    def has_raw(self) -> bool:
+        return self._raw is not None
+
+    def to_dict(self) -> dict:
+        """
+        :returns: dict of the common fields
+
+        """
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __eq__(self, other):
+        if not isinstance(other, Book):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field)
+                   for field in self.__slots__)
+
+    def __repr__(self):
+        return f'Book({self.book_id!r}, title={self.title!r})'
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+
+"""
+login to a tolino partner with a real browser to get the session cookies.
+
+selenium and seleniumbase take a long time to import and use a lot of
+memory, so this module is only imported by the client when a GUI login is
+necessary (refresh token expired).
+"""
+
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.wait import WebDriverWait
+from seleniumbase import SB
+
+
+from pytolino import server_settings_keys
+
+
+def fill_login_form(driver, server_settings: dict, username: str,
+                    password: str, timeout=5):
+    """open the login page of the partner, deny cookies and submit
+    the credentials
+
+    :driver: selenium webdriver
+    :server_settings: settings of the partner (from servers_settings.toml)
+    :username: str
+    :password: str
+    :timeout: time in s to wait for the elements of the page
+
+    """
+    driver.implicitly_wait(timeout)
+    url = server_settings[server_settings_keys.LOGIN_URL]
+    driver.get(url)
+
+    # deny cookies
+    shadow_host_id = server_settings[server_settings_keys.SHADOW_HOST_ID]
+    shadow_host = driver.find_element(By.ID, shadow_host_id)
+    shadow_root = shadow_host.shadow_root
+    css = server_settings[server_settings_keys.COOKIE_DENY_CSS]
+    wait = WebDriverWait(shadow_root, timeout)
+    deny_button = wait.until(
+            expected_conditions.element_to_be_clickable(
+                (By.CSS_SELECTOR, css)))
+    deny_button.click()
+
+    # fill credentials and submit
+    username_field_id = server_settings[
+            server_settings_keys.USERNAME_FIELD_ID]
+    username_field = driver.find_element(
+            By.ID, username_field_id,
+            )
+    password_field_id = server_settings[
+            server_settings_keys.PASSWORD_FIELD_ID]
+    password_field = driver.find_element(
+            By.ID, password_field_id,
+            )
+    css = server_settings[server_settings_keys.SUBMIT_CSS]
+    submit_button = driver.find_element(
+            By.CSS_SELECTOR, css,
+            )
+    username_field.send_keys(username)
+    password_field.send_keys(password)
+    wait = WebDriverWait(driver, timeout=timeout)
+    wait.until(
+            expected_conditions.element_to_be_clickable(
+                submit_button))
+    submit_button.click()
+
+
+def get_login_cookies(server_settings: dict, username: str, password: str,
+                      timeout=5):
+    """start a browser, login and collect the cookies of the session
+
+    :server_settings: settings of the partner (from servers_settings.toml)
+    :username: str
+    :password: str
+    :timeout: time in s to wait for the elements of the page
+    :returns: list of cookies (dict) and user agent of the browser
+
+    """
+    with SB(uc=True) as sb:
+        driver = sb.driver
+        fill_login_form(driver, server_settings, username, password, timeout)
+        cookies = driver.get_cookies()
+        user_agent = driver.get_user_agent()
+    return cookies, user_agent
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+
+"""
+pool of warm browsers for the GUI logins. starting a browser is most of the
+time of a GUI login, so when many accounts must login (for example after
+a password rotation), the browsers are kept open and reused.
+"""
+
+
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+from pytolino import server_settings_keys
+from pytolino.browser_login import fill_login_form
+from pytolino.tolino_cloud import servers_settings, PytolinoException
+
+
+def _new_driver():
+    from seleniumbase import Driver
+    return Driver(uc=True, incognito=True)
+
+
+class BrowserLoginPool(object):
+
+    """keep up to size browsers open and run the GUI logins of a partner in
+    them, at most size at the same time. the cookies of the browser are
+    cleared before and after each login.
+
+    """
+
+    def __init__(
+            self,
+            server_name='orellfuessli',
+            size: int = None,
+            timeout: float = None,
+            driver_factory=_new_driver,
+            ):
+        """
+        :server_name: tolino partner
+        :size: number of browsers. if None, browser_pool_size of the
+        servers settings
+        :timeout: time in s to wait for the elements of the login page.
+        if None, browser_timeout of the servers settings
+        :driver_factory: function that starts a new webdriver
+
+        """
+        if server_name not in servers_settings:
+            raise PytolinoException(
+                    f'the partner {server_name} was not found.')
+        self._server_settings = servers_settings[server_name]
+        if size is None:
+            size = self._server_settings[
+                    server_settings_keys.BROWSER_POOL_SIZE]
+        if timeout is None:
+            timeout = self._server_settings[
+                    server_settings_keys.BROWSER_TIMEOUT]
+        self._size = size
+        self._timeout = timeout
+        self._driver_factory = driver_factory
+        self._idle_drivers = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._drivers = []
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _start_driver(self):
+        driver = self._driver_factory()
+        with self._lock:
+            self._drivers.append(driver)
+        return driver
+
+    def _quit_driver(self, driver):
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.warning(f'could not quit browser: {e}')
+
+    def _clear_cookies(self, driver):
+        try:
+            driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        except Exception:
+            # not a chrome driver, clears only the current domain
+            driver.delete_all_cookies()
+
+    def warm_up(self):
+        """start all the browsers of the pool now"""
+        missing = self._size - len(self._drivers)
+        for _ in range(missing):
+            self._idle_drivers.put(self._start_driver())
+
+    def login(self, username: str, password: str):
+        """login in one of the browsers of the pool. waits if all the
+        browsers are busy.
+
+        :username: str
+        :password: str
+        :returns: list of cookies (dict) and user agent of the browser
+
+        """
+        if self._closed:
+            raise PytolinoException('the browser pool is closed')
+        with self._slots:
+            try:
+                driver = self._idle_drivers.get_nowait()
+            except queue.Empty:
+                driver = self._start_driver()
+            try:
+                self._clear_cookies(driver)
+                fill_login_form(
+                        driver,
+                        self._server_settings,
+                        username,
+                        password,
+                        self._timeout,
+                        )
+                cookies = driver.get_cookies()
+                user_agent = driver.get_user_agent()
+                self._clear_cookies(driver)
+            except Exception:
+                # the browser may be in a bad state, do not reuse it
+                self._quit_driver(driver)
+                raise
+            self._idle_drivers.put(driver)
+        return cookies, user_agent
+
+    def close(self):
+        """quit all the browsers"""
+        self._closed = True
+        with self._lock:
+            drivers = list(self._drivers)
+        for driver in drivers:
+            self._quit_driver(driver)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def login_many(clients_passwords, browser_pool: BrowserLoginPool,
+               allow_GUI_autologin=True):
+    """login many clients, with the GUI logins shared by a pool of browsers
+
+    :clients_passwords: iterable of (client, password)
+    :browser_pool: BrowserLoginPool of the partner of the clients
+    :allow_GUI_autologin: see Client.login
+    :returns: list of (client, None or exception if the login failed)
+
+    """
+    def login_one(client_password):
+        client, password = client_password
+        try:
+            client.login(
+                    password,
+                    allow_GUI_autologin=allow_GUI_autologin,
+                    browser_pool=browser_pool,
+                    )
+        except Exception as e:
+            logging.error(f'login of {client._username} failed: {e}')
+            return client, e
+        return client, None
+
+    # a few more threads than browsers, for the logins that only renew
+    # their token
+    max_workers = 2 * browser_pool.size
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(login_one, clients_passwords))
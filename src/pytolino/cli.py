@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+
+
+"""
+command line interface of pytolino. the commands use the token stored by
+the last login of the account, and send their requests in parallel with
+one client:
+
+    pytolino --username USERNAME login
+    pytolino --username USERNAME upload 'ebooks/**/*.epub' --jobs 8
+    pytolino --username USERNAME inventory --json > inventory.jsonl
+    pytolino --username USERNAME meta --from updates.jsonl
+
+the items can be given as arguments (glob patterns for the files) or as
+json lines with --from (- for stdin). with --json, one json object is
+printed per item, else one line of text.
+"""
+
+
+import argparse
+import getpass
+import glob
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+
+
+from pytolino.tolino_cloud import Client, PytolinoException, PARTNERS
+from pytolino.book import Book
+
+
+USERNAME_ENV = 'PYTOLINO_USERNAME'
+PASSWORD_ENV = 'PYTOLINO_PASSWORD'
+PARTNER_ENV = 'PYTOLINO_PARTNER'
+
+# exit codes
+OK = 0
+FAILED = 1
+
+
+class CliError(Exception):
+    """error in the arguments or input of a command"""
+
+
+def expand_paths(patterns) -> list:
+    """
+    :patterns: list of paths or glob patterns (** for subfolders)
+    :returns: list of Path, in the order of the patterns, without duplicates
+    :raises: CliError if a pattern matches nothing
+
+    """
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern] if os.path.exists(pattern) else []
+        if not matches:
+            raise CliError(f'no file matches {pattern}')
+        for match in matches:
+            if match not in seen:
+                seen.add(match)
+                paths.append(Path(match))
+    return paths
+
+
+def read_jsonl(source: str) -> list:
+    """
+    :source: path of a file of json lines, - for stdin
+    :returns: list of dict
+    :raises: CliError if a line is not a json object
+
+    """
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        try:
+            lines = Path(source).read_text().splitlines()
+        except OSError as e:
+            raise CliError(f'cannot read {source}: {e}')
+    items = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise CliError(f'{source}:{number}: {e}')
+        if not isinstance(item, dict):
+            raise CliError(f'{source}:{number}: not a json object')
+        items.append(item)
+    return items
+
+
+def _field(item: dict, *keys):
+    for key in keys:
+        if key in item:
+            return item[key]
+    raise CliError(f'{item} has no {" or ".join(keys)}')
+
+
+def _book_id(item: dict) -> str:
+    return _field(item, 'book_id', 'id', 'deliverableId')
+
+
+def parse_assignment(text: str) -> tuple:
+    """
+    :text: key=value, the value is json or a str
+    :returns: (key, value)
+
+    """
+    key, separator, value = text.partition('=')
+    if not separator or not key:
+        raise CliError(f'{text} is not key=value')
+    try:
+        value = json.loads(value)
+    except json.JSONDecodeError:
+        pass
+    return key, value
+
+
+class Output(object):
+
+    """prints the results, and the progress on stderr"""
+
+    def __init__(self, as_json=False, progress=False, stream=None):
+        self.as_json = as_json
+        self.progress = progress
+        self.stream = sys.stdout if stream is None else stream
+        self.failures = 0
+        self._done = 0
+        self._total = None
+
+    def start(self, total: int):
+        self._done = 0
+        self._total = total
+
+    def result(self, record: dict, text: str):
+        """
+        :record: json object of the result, with an error key if it failed
+        :text: line printed without --json
+
+        """
+        if 'error' in record:
+            self.failures += 1
+        if self.as_json:
+            print(json.dumps(record, default=str), file=self.stream)
+        else:
+            print(text, file=self.stream)
+        self.stream.flush()
+        self._done += 1
+        if self.progress:
+            total = '?' if self._total is None else self._total
+            print(f'[{self._done}/{total}]', file=sys.stderr, flush=True)
+
+    def outcome(self, record: dict, result, label: str, ok_text=None):
+        """print the result of one item
+
+        :result: exception if the item failed
+        :label: description of the item
+        :ok_text: line printed if the item succeeded, label + ok if None
+
+        """
+        if isinstance(result, Exception):
+            record['error'] = str(result)
+            text = f'{label}\terror: {result}'
+        else:
+            text = f'{label}\tok' if ok_text is None else ok_text
+        self.result(record, text)
+
+    @property
+    def exit_code(self) -> int:
+        return FAILED if self.failures else OK
+
+
+def cmd_login(client: Client, args, output: Output):
+    if args.refresh_token:
+        if not args.hardware_id:
+            raise CliError('--refresh-token needs --hardware-id')
+        client.import_token(args.refresh_token, args.hardware_id)
+    else:
+        password = os.environ.get(PASSWORD_ENV)
+        if password is None:
+            password = getpass.getpass(f'password of {args.username}: ')
+        client.login(password, allow_GUI_autologin=not args.no_gui)
+    output.result(
+            {'username': args.username, 'partner': args.partner,
+             'hardware_id': client.hardware_id},
+            f'logged in {args.username} ({args.partner})')
+
+
+def cmd_inventory(client: Client, args, output: Output):
+    if args.incremental:
+        books = client.get_inventory(incremental=True)
+    else:
+        books = client.iter_inventory()
+    for book in books:
+        summary = Book.from_dict(book, keep_raw=False)
+        record = book if args.raw else summary.to_dict()
+        output.result(
+                record,
+                f'{summary.book_id}\t{summary.title or ""}\t'
+                f'{", ".join(summary.authors)}')
+
+
+def _run_items(client: Client, function, items: list, args, output: Output,
+               describe, action: str):
+    """call function on each item with --jobs threads, and print the
+    results
+
+    :describe: function of an item returning its json object
+    :action: name of the operation
+
+    """
+    output.start(len(items))
+    for item, result in client.run_concurrently(
+            function, items, args.jobs, action):
+        record = describe(item)
+        label = '\t'.join(
+                [action] + [str(value) for value in record.values()])
+        output.outcome(record, result, label)
+
+
+def cmd_upload(client: Client, args, output: Output):
+    items = [{'path': str(path)} for path in expand_paths(args.paths)]
+    if args.from_file:
+        items += read_jsonl(args.from_file)
+    if not items:
+        raise CliError('no file to upload')
+
+    def upload(item):
+        return client.upload(
+                Path(_field(item, 'path')),
+                name=item.get('name'),
+                skip_uploaded=args.skip_uploaded,
+                )
+
+    output.start(len(items))
+    for item, result in client.run_concurrently(
+            upload, items, args.jobs, 'upload'):
+        record = {'path': item.get('path')}
+        if not isinstance(result, Exception):
+            record['book_id'] = result
+        output.outcome(
+                record, result, f'upload\t{item.get("path")}',
+                f'{result}\t{item.get("path")}')
+
+
+def cmd_delete(client: Client, args, output: Output):
+    book_ids = list(args.book_ids)
+    if args.from_file:
+        book_ids += [_book_id(item) for item in read_jsonl(args.from_file)]
+    if not book_ids:
+        raise CliError('no book to delete')
+    _run_items(client, client.delete_ebook, book_ids, args, output,
+               lambda book_id: {'book_id': book_id}, 'delete')
+
+
+def cmd_meta(client: Client, args, output: Output):
+    updates = []
+    if args.book_id:
+        if not args.set:
+            raise CliError('--set key=value is needed with a book id')
+        updates.append(
+                (args.book_id, dict(map(parse_assignment, args.set))))
+    if args.from_file:
+        for item in read_jsonl(args.from_file):
+            metadata = item.get('metadata')
+            if metadata is None:
+                metadata = {key: value for key, value in item.items()
+                            if key not in ('book_id', 'id', 'deliverableId')}
+            updates.append((_book_id(item), metadata))
+    if not updates:
+        raise CliError('no metadata to upload')
+    results = client.update_metadata_many(updates, max_workers=args.jobs)
+    output.start(len(results))
+    for book_id, error in results.items():
+        output.outcome({'book_id': book_id}, error, f'meta\t{book_id}')
+
+
+def cmd_cover(client: Client, args, output: Output):
+    items = []
+    if args.book_id:
+        if not args.image:
+            raise CliError('an image is needed with a book id')
+        items.append({'book_id': args.book_id, 'path': args.image})
+    if args.from_file:
+        items += read_jsonl(args.from_file)
+    if not items:
+        raise CliError('no cover to upload')
+
+    def add_cover(item):
+        client.add_cover(
+                _book_id(item), Path(_field(item, 'path')),
+                prepare=args.prepare)
+
+    _run_items(client, add_cover, items, args, output,
+               lambda item: {'book_id': _book_id(item),
+                             'path': item.get('path')},
+               'cover')
+
+
+def cmd_collection(client: Client, args, output: Output):
+    items = [(book_id, args.name) for book_id in args.book_ids]
+    if args.from_file:
+        for item in read_jsonl(args.from_file):
+            collection = item.get('collection', args.name)
+            if collection is None:
+                raise CliError(f'{item} has no collection')
+            items.append((_book_id(item), collection))
+    if not items:
+        raise CliError('no book to add or remove')
+    if args.action == 'add':
+        update = client.add_to_collection_many
+    else:
+        update = client.remove_from_collection_many
+    output.start(1)
+    try:
+        update(items)
+    except PytolinoException as e:
+        result = e
+    else:
+        result = None
+    output.outcome(
+            {'action': args.action, 'books': len(items)},
+            result,
+            f'collection {args.action}\t{len(items)} books')
+
+
+def _add_from(parser, help_text):
+    parser.add_argument('--from', dest='from_file', metavar='JSONL',
+                        help=help_text + ' (json lines, - for stdin)')
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+            prog='pytolino',
+            description='client of the tolino cloud')
+    parser.add_argument(
+            '--username', default=os.environ.get(USERNAME_ENV),
+            help=f'account (default: ${USERNAME_ENV})')
+    parser.add_argument(
+            '--partner', default=os.environ.get(PARTNER_ENV, 'orellfuessli'),
+            choices=sorted(PARTNERS),
+            help=f'tolino partner (default: ${PARTNER_ENV} or orellfuessli)')
+    parser.add_argument('--verbose', '-v', action='count', default=0)
+    # options of every command
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--json', action='store_true',
+                        help='print one json object per line')
+    common.add_argument('--jobs', '-j', type=int, default=4,
+                        help='number of requests sent at the same time')
+    common.add_argument('--progress', action='store_true',
+                        help='print the progress on stderr')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_command(name, **kwargs):
+        return commands.add_parser(name, parents=[common], **kwargs)
+
+    login = add_command(
+            'login',
+            help=f'login and store the token (password from ${PASSWORD_ENV}'
+            ' or prompted)')
+    login.add_argument('--no-gui', action='store_true',
+                       help='do not start a browser')
+    login.add_argument('--refresh-token',
+                       help='import this token instead of logging in')
+    login.add_argument('--hardware-id')
+    login.set_defaults(function=cmd_login)
+
+    inventory = add_command('inventory', help='list the books')
+    inventory.add_argument(
+            '--incremental', action='store_true',
+            help='download only the changes since the last call')
+    inventory.add_argument('--raw', action='store_true',
+                           help='print the whole entries')
+    inventory.set_defaults(function=cmd_inventory)
+
+    upload = add_command('upload', help='upload ebooks')
+    upload.add_argument('paths', nargs='*', help='files or glob patterns')
+    _add_from(upload, 'objects with path and optionally name')
+    upload.add_argument('--skip-uploaded', action='store_true',
+                        help='do not send a file already on the cloud')
+    upload.set_defaults(function=cmd_upload)
+
+    delete = add_command('delete', help='delete books')
+    delete.add_argument('book_ids', nargs='*')
+    _add_from(delete, 'objects with book_id')
+    delete.set_defaults(function=cmd_delete)
+
+    meta = add_command('meta', help='change the metadata of books')
+    meta.add_argument('book_id', nargs='?')
+    meta.add_argument('--set', action='append', metavar='KEY=VALUE',
+                      help='metadata, the value can be json')
+    _add_from(meta, 'objects with book_id and metadata (or the fields)')
+    meta.set_defaults(function=cmd_meta)
+
+    cover = add_command('cover', help='upload covers')
+    cover.add_argument('book_id', nargs='?')
+    cover.add_argument('image', nargs='?', help='image, or epub')
+    _add_from(cover, 'objects with book_id and path')
+    cover.add_argument('--prepare', action='store_true',
+                       help='downscale and recompress the big images')
+    cover.set_defaults(function=cmd_cover)
+
+    collection = add_command(
+            'collection', help='add books to a collection, or remove them')
+    collection.add_argument('action', choices=('add', 'remove'))
+    collection.add_argument('name', nargs='?', help='collection')
+    collection.add_argument('book_ids', nargs='*')
+    _add_from(collection, 'objects with book_id and optionally collection')
+    collection.set_defaults(function=cmd_collection)
+    return parser
+
+
+def new_client(args) -> Client:
+    return Client(
+            args.username,
+            server_name=args.partner,
+            token_refresh_margin=60,
+            )
+
+
+def main(argv=None, client_factory=new_client) -> int:
+    """
+    :argv: arguments, sys.argv[1:] if None
+    :client_factory: function of the parsed arguments returning a Client
+    :returns: exit code
+
+    """
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if not args.username:
+        parser.error(f'--username or ${USERNAME_ENV} is required')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    level = (logging.WARNING, logging.INFO, logging.DEBUG)[
+            min(args.verbose, 2)]
+    logging.basicConfig(level=level, format='%(levelname)s %(message)s')
+
+    output = Output(as_json=args.json, progress=args.progress)
+    try:
+        client = client_factory(args)
+        args.function(client, args, output)
+    except CliError as e:
+        parser.error(str(e))
+    except PytolinoException as e:
+        print(f'pytolino: {e}', file=sys.stderr)
+        return FAILED
+    return output.exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+
+
+"""
+preparation of the covers before their upload. the cover of an epub is
+found in the manifest of its package document (opf), the format of an image
+is detected from its first bytes (not from its extension), and a big image
+is downscaled and recompressed in jpeg with Pillow, if it is installed. the
+prepared covers are cached by content hash, so that the same image is never
+processed twice.
+"""
+
+
+import hashlib
+import io
+import logging
+import os
+import posixpath
+import tempfile
+import zipfile
+from pathlib import Path
+from urllib.parse import unquote
+from xml.etree import ElementTree
+
+
+from pytolino.storage import get_data_dir
+
+
+# tolino e-readers have screens of up to 1264 x 1680 pixels
+MAX_SIZE = (1264, 1680)
+MAX_BYTES = 500 * 1024
+QUALITY = 85
+MIN_QUALITY = 50
+
+JPEG = 'jpeg'
+PNG = 'png'
+GIF = 'gif'
+WEBP = 'webp'
+
+# format: extension, mime type
+IMAGE_TYPES = {
+        JPEG: ('.jpg', 'image/jpeg'),
+        PNG: ('.png', 'image/png'),
+        GIF: ('.gif', 'image/gif'),
+        WEBP: ('.webp', 'image/webp'),
+        }
+# formats that can be uploaded without conversion
+UPLOAD_FORMATS = (JPEG, PNG)
+
+ZIP_SIGNATURE = b'PK\x03\x04'
+CONTAINER_PATH = 'META-INF/container.xml'
+_CONTAINER_NS = '{urn:oasis:names:tc:opendocument:xmlns:container}'
+_OPF_NS = '{http://www.idpf.org/2007/opf}'
+
+
+class CoverError(ValueError):
+    pass
+
+
+def detect_image_format(data: bytes) -> str:
+    """
+    :data: the first bytes of an image (12 are enough)
+    :returns: jpeg, png, gif or webp, None if the format is unknown
+
+    """
+    if data.startswith(b'\xff\xd8\xff'):
+        return JPEG
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return PNG
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return GIF
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return WEBP
+    return None
+
+
+def detect_file_format(file_path: Path) -> str:
+    """
+    :returns: format of the image file, see detect_image_format
+
+    """
+    with open(file_path, 'rb') as f:
+        return detect_image_format(f.read(12))
+
+
+def is_epub(file_path: Path) -> bool:
+    with open(file_path, 'rb') as f:
+        return f.read(4) == ZIP_SIGNATURE
+
+
+def _opf_path(epub: zipfile.ZipFile) -> str:
+    try:
+        container = ElementTree.fromstring(epub.read(CONTAINER_PATH))
+    except KeyError:
+        raise CoverError(f'no {CONTAINER_PATH} in the epub')
+    rootfile = container.find(f'.//{_CONTAINER_NS}rootfile')
+    if rootfile is None or not rootfile.get('full-path'):
+        raise CoverError('no package document in the epub')
+    return rootfile.get('full-path')
+
+
+def find_cover_href(opf: bytes) -> str:
+    """find the cover image in the manifest of a package document: the
+    item with the cover-image property (epub 3), the item named by the
+    cover meta (epub 2), or an image item with cover in its id or href
+
+    :opf: content of the package document
+    :returns: href of the cover, relative to the package document. None if
+    there is no cover
+
+    """
+    package = ElementTree.fromstring(opf)
+    items = [item for item in package.iter(f'{_OPF_NS}item')
+             if item.get('href')]
+    images = [item for item in items
+              if item.get('media-type', '').startswith('image/')]
+    for item in images:
+        if 'cover-image' in item.get('properties', '').split():
+            return item.get('href')
+    for meta in package.iter(f'{_OPF_NS}meta'):
+        if meta.get('name') == 'cover':
+            for item in items:
+                if item.get('id') == meta.get('content'):
+                    return item.get('href')
+    for item in images:
+        if 'cover' in (item.get('id', '') + item.get('href')).lower():
+            return item.get('href')
+    return None
+
+
+def extract_epub_cover(epub_path: Path or str) -> bytes:
+    """
+    :epub_path: Path of the epub
+    :returns: content of the cover image
+    :raises: CoverError if the epub has no cover
+
+    """
+    try:
+        with zipfile.ZipFile(epub_path) as epub:
+            opf_path = _opf_path(epub)
+            try:
+                href = find_cover_href(epub.read(opf_path))
+            except (KeyError, ElementTree.ParseError) as e:
+                raise CoverError(f'invalid package document {opf_path}: {e}')
+            if href is None:
+                raise CoverError(f'no cover in {epub_path}')
+            cover_path = posixpath.normpath(posixpath.join(
+                    posixpath.dirname(opf_path), unquote(href)))
+            try:
+                return epub.read(cover_path)
+            except KeyError:
+                raise CoverError(f'the cover {cover_path} is not in the epub')
+    except zipfile.BadZipFile as e:
+        raise CoverError(f'{epub_path} is not an epub: {e}')
+
+
+def _load_pillow():
+    """
+    :returns: the Image module of Pillow, None if it is not installed
+
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def _flatten(image, Image):
+    """
+    :returns: the image in RGB, the transparent parts on white
+
+    """
+    if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        background.alpha_composite(image)
+        image = background
+    return image.convert('RGB')
+
+
+def _encode_jpeg(image, quality: int) -> bytes:
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=quality, optimize=True,
+               progressive=True)
+    return output.getvalue()
+
+
+def process_cover(data: bytes, max_size=MAX_SIZE, max_bytes=MAX_BYTES,
+                  quality=QUALITY) -> bytes:
+    """downscale and recompress an image that is too big, or in a format
+    other than jpeg and png. the quality, then the dimensions, are reduced
+    until the image fits in max_bytes. without Pillow, the image is returned
+    unchanged.
+
+    :data: content of the image
+    :max_size: max (width, height) in pixels
+    :max_bytes: max size of the result in bytes, None for no limit
+    :quality: jpeg quality of the recompressed image
+    :returns: content of the image to upload
+    :raises: CoverError if the image cannot be read
+
+    """
+    image_format = detect_image_format(data)
+    Image = _load_pillow()
+    if Image is None:
+        logging.warning('Pillow is not installed, the cover is not resized')
+        return data
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise CoverError(f'invalid image: {e}')
+    width, height = image.size
+    fits = (width <= max_size[0] and height <= max_size[1]
+            and (max_bytes is None or len(data) <= max_bytes))
+    if fits and image_format in UPLOAD_FORMATS:
+        return data
+
+    image = _flatten(image, Image)
+    image.thumbnail(max_size, Image.LANCZOS)
+    while True:
+        for current_quality in range(quality, MIN_QUALITY - 1, -10):
+            result = _encode_jpeg(image, current_quality)
+            if max_bytes is None or len(result) <= max_bytes:
+                return result
+        if min(image.size) <= 64:
+            return result
+        image = image.resize(
+                (image.width * 4 // 5, image.height * 4 // 5), Image.LANCZOS)
+
+
+class CoverCache(object):
+
+    """folder of the prepared covers, named by the hash of the source image
+    and of the settings. it can be shared between threads and processes: a
+    cover is written in a temporary file, then renamed.
+
+    """
+
+    def __init__(self, directory: Path or str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def default(cls):
+        """
+        :returns: CoverCache in the data folder of pytolino
+
+        """
+        return cls(get_data_dir() / 'covers')
+
+    def get(self, key: str) -> Path:
+        """
+        :key: hash of the source and settings
+        :returns: Path of the cached cover, None if it is not cached
+
+        """
+        for extension, _ in IMAGE_TYPES.values():
+            path = self.directory / f'{key}{extension}'
+            if path.exists():
+                return path
+        return None
+
+    def put(self, key: str, data: bytes) -> Path:
+        """
+        :key: hash of the source and settings
+        :data: content of the prepared cover
+        :returns: Path of the cached cover
+
+        """
+        extension, _ = IMAGE_TYPES.get(
+                detect_image_format(data), IMAGE_TYPES[JPEG])
+        path = self.directory / f'{key}{extension}'
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return path
+
+
+def prepare_cover(source: Path or str, cache: CoverCache = None,
+                  max_size=MAX_SIZE, max_bytes=MAX_BYTES,
+                  quality=QUALITY) -> Path:
+    """extract the cover of an epub, or read an image, and process it (see
+    process_cover). the result is cached by content hash.
+
+    :source: Path of an image or of an epub
+    :cache: CoverCache, the default one if None
+    :returns: Path of the prepared cover, in the cache
+    :raises: CoverError
+
+    """
+    if cache is None:
+        cache = CoverCache.default()
+    if is_epub(source):
+        data = extract_epub_cover(source)
+    else:
+        data = Path(source).read_bytes()
+    settings = f'{max_size[0]}x{max_size[1]} {max_bytes} {quality}'
+    key = hashlib.sha256(data + settings.encode()).hexdigest()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    if detect_image_format(data) is None:
+        raise CoverError(f'the cover of {source} is not a known image')
+    return cache.put(key, process_cover(data, max_size, max_bytes, quality))
@@ -0,0 +1,676 @@
+#!/usr/bin/env python3
+
+
+"""
+local stand-in for the auth server of a partner and the BOSH api of the
+tolino cloud, to test and benchmark the clients without credentials nor
+network. the library is kept in memory. latency and errors can be injected
+per endpoint. a client is pointed at the server with its settings:
+
+    with FakeTolinoServer() as server:
+        client = Client('user', server_settings=server.server_settings())
+        client.import_token(server.new_refresh_token(), server.hardware_id)
+"""
+
+
+import json
+import random
+import secrets
+import socket
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+
+from pytolino import server_settings_keys
+from pytolino.requests_keys import (
+        ACCESS_TOKEN,
+        REFRESH_TOKEN,
+        EXPIRES_IN,
+        REFRESH_EXPIRES_IN,
+        AUTHORIZATION_CODE,
+        T_AUTH_TOKEN,
+        HARDWARE_ID,
+        DEVICE_LIST_RESPONSE,
+        DEVICES,
+        DEVICE_LAST_USAGE,
+        DEVICE_ID,
+        DELIVERABLE_ID,
+        UPLOAD_METADATA,
+        PUBLICATION_INVENTORY,
+        EDATA,
+        EBOOK,
+        REVISION,
+        DELETED,
+        EPUB_METADATA,
+        IDENTIFIER,
+        )
+
+
+# endpoint names, as in the metrics of the clients
+AUTH = 'auth'
+TOKEN = 'token'
+DEVICES_LIST = 'devices'
+UPLOAD = 'upload'
+META = 'meta'
+COVER = 'cover'
+SYNC_DATA = 'sync_data'
+DELETE = 'delete'
+INVENTORY = 'inventory'
+
+_ROUTES = {
+        ('GET', '/auth/oauth2/autologin'): AUTH,
+        ('POST', '/auth/oauth2/token'): TOKEN,
+        ('POST', '/bosh/rest/handshake/devices/list'): DEVICES_LIST,
+        ('POST', '/bosh/rest/upload'): UPLOAD,
+        ('GET', '/bosh/rest/meta'): META,
+        ('PUT', '/bosh/rest/meta'): META,
+        ('POST', '/bosh/rest/cover'): COVER,
+        ('PATCH', '/bosh/rest/sync-data'): SYNC_DATA,
+        ('GET', '/bosh/rest/deletecontent'): DELETE,
+        ('GET', '/bosh/rest/inventory/delta'): INVENTORY,
+        }
+
+SESSION_COOKIE = 'fake_session'
+
+_TITLE_WORDS = (
+        'der', 'die', 'das', 'le', 'la', 'the', 'night', 'garden', 'river',
+        'stadt', 'winter', 'sommer', 'geheimnis', 'reise', 'histoire',
+        'mord', 'licht', 'shadow', 'letters', 'zeit', 'insel', 'berge',
+        )
+_AUTHORS = (
+        'Max Frisch', 'Friedrich Dürrenmatt', 'Jeremias Gotthelf',
+        'Annemarie Schwarzenbach', 'Robert Walser', 'Johanna Spyri',
+        'Gottfried Keller', 'Patricia Highsmith', 'Agota Kristof',
+        )
+
+
+class HttpError(Exception):
+
+    """error response of the fake server"""
+
+    def __init__(self, status: int, message: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def parse_multipart(content_type: str, body: bytes) -> dict:
+    """
+    :content_type: value of the content-type header
+    :body: multipart/form-data body
+    :returns: dict of name: (filename or None, bytes)
+
+    """
+    boundary = None
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.strip().partition('=')
+        if key == 'boundary':
+            boundary = value.strip('"')
+    if not boundary:
+        raise HttpError(400, 'no boundary in content-type')
+    fields = {}
+    for part in body.split(b'--' + boundary.encode())[1:]:
+        if part.startswith(b'--'):
+            break
+        header, _, content = part[2:].partition(b'\r\n\r\n')
+        name = filename = None
+        for line in header.decode('utf-8', 'replace').split('\r\n'):
+            if not line.lower().startswith('content-disposition'):
+                continue
+            for param in line.split(';')[1:]:
+                key, _, value = param.strip().partition('=')
+                if key == 'name':
+                    name = value.strip('"')
+                elif key == 'filename':
+                    filename = value.strip('"')
+        if name is not None:
+            fields[name] = (filename, content[:-2])
+    return fields
+
+
+def server_settings(url: str) -> dict:
+    """
+    :url: base url of a fake server
+    :returns: dict of the urls of the servers settings, pointing to it
+
+    """
+    keys = server_settings_keys
+    return {
+            keys.AUTH_URL: f'{url}/auth/oauth2/autologin?',
+            keys.TOKEN_URL: f'{url}/auth/oauth2/token',
+            keys.LOGIN_URL: f'{url}/auth/login?',
+            keys.DEVICES_URL: f'{url}/bosh/rest/handshake/devices/list',
+            keys.UPLOAD_URL: f'{url}/bosh/rest/upload',
+            keys.META_URL: f'{url}/bosh/rest/meta',
+            keys.COVER_URL: f'{url}/bosh/rest/cover',
+            keys.SYNC_DATA_URL: (
+                f'{url}/bosh/rest/sync-data?paths=publications,audiobooks'),
+            keys.DELETE_URL: f'{url}/bosh/rest/deletecontent',
+            keys.INVENTORY_URL: f'{url}/bosh/rest/inventory/delta',
+            }
+
+
+class FakeLibrary(object):
+
+    """books of the account, and the revisions of the changes"""
+
+    def __init__(self, seed=None):
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.revision = 1
+        self.books = {}
+        self.purchased = set()
+        self.covers = {}
+        self.deleted = []
+
+    def _new_id(self) -> str:
+        return f'{self._random.getrandbits(48):012x}'
+
+    def _random_metadata(self, book_id: str) -> dict:
+        words = self._random.sample(_TITLE_WORDS, 3)
+        return {
+                IDENTIFIER: book_id,
+                'title': ' '.join(words).capitalize(),
+                'author': [self._random.choice(_AUTHORS)],
+                'isbn': f'978{self._random.randrange(10**10):010d}',
+                'publisher': 'Fake Verlag',
+                'language': 'de',
+                'format': 'EPUB',
+                'fileSize': self._random.randrange(10**5, 10**7),
+                'publicationDate': 1600000000000,
+                }
+
+    def _add(self, metadata: dict, purchased=False) -> dict:
+        book_id = metadata[IDENTIFIER]
+        self.revision += 1
+        book = {
+                EPUB_METADATA: metadata,
+                'creationDate': round(time.time() * 1000),
+                'tags': [],
+                REVISION: self.revision,
+                }
+        self.books[book_id] = book
+        if purchased:
+            self.purchased.add(book_id)
+        return book
+
+    def add_random_books(self, n: int, purchased=False) -> list:
+        """
+        :n: number of books
+        :purchased: if True, the books are in the ebook (purchased) list
+        instead of the edata (uploaded) list
+        :returns: ids of the books
+
+        """
+        with self._lock:
+            ids = []
+            for _ in range(n):
+                book_id = self._new_id()
+                self._add(self._random_metadata(book_id), purchased)
+                ids.append(book_id)
+            return ids
+
+    def upload(self, filename: str, size: int) -> dict:
+        with self._lock:
+            book_id = self._new_id()
+            metadata = self._random_metadata(book_id)
+            stem = filename.rsplit('.', 1)[0]
+            metadata.update(title=stem, fileSize=size, author=[])
+            metadata['format'] = 'PDF' if filename.endswith('.pdf') else 'EPUB'
+            return self._add(metadata)[EPUB_METADATA]
+
+    def metadata(self, book_id: str) -> dict:
+        with self._lock:
+            book = self.books.get(book_id)
+            if book is None:
+                raise HttpError(404, f'unknown book {book_id}')
+            return dict(book[EPUB_METADATA], deliverableId=book_id)
+
+    def _changed(self, book_id: str) -> dict:
+        book = self.books.get(book_id)
+        if book is None:
+            raise HttpError(404, f'unknown book {book_id}')
+        self.revision += 1
+        book[REVISION] = self.revision
+        return book
+
+    def update_metadata(self, book_id: str, metadata: dict):
+        with self._lock:
+            book = self._changed(book_id)
+            metadata = {key: value for key, value in metadata.items()
+                        if key != DELIVERABLE_ID}
+            book[EPUB_METADATA].update(metadata)
+            book[EPUB_METADATA][IDENTIFIER] = book_id
+
+    def set_cover(self, book_id: str, cover: bytes):
+        with self._lock:
+            self._changed(book_id)
+            self.covers[book_id] = cover
+
+    def patch_tags(self, patches: list):
+        with self._lock:
+            for patch in patches:
+                parts = patch.get('path', '').strip('/').split('/')
+                if len(parts) != 3 or parts[0] != 'publications':
+                    raise HttpError(400, f'invalid path {patch.get("path")}')
+                book = self._changed(parts[1])
+                tag = patch['value']
+                names = [t['name'] for t in book['tags']]
+                if patch['op'] == 'add' and tag['name'] not in names:
+                    book['tags'].append(tag)
+                elif patch['op'] == 'remove':
+                    book['tags'] = [
+                            t for t in book['tags']
+                            if t['name'] != tag['name']]
+
+    def delete(self, book_id: str):
+        with self._lock:
+            if self.books.pop(book_id, None) is None:
+                raise HttpError(404, f'unknown book {book_id}')
+            self.purchased.discard(book_id)
+            self.covers.pop(book_id, None)
+            self.revision += 1
+            self.deleted.append((self.revision, book_id))
+
+    def inventory(self, since: int = None) -> dict:
+        """
+        :since: revision of the last sync of the client. if None, the full
+        inventory
+        :returns: PublicationInventory dict
+
+        """
+        with self._lock:
+            uploaded = []
+            purchased = []
+            for book_id, book in self.books.items():
+                if since is not None and book[REVISION] <= since:
+                    continue
+                entry = {key: value for key, value in book.items()
+                         if key != REVISION}
+                if book_id in self.purchased:
+                    purchased.append(entry)
+                else:
+                    uploaded.append(entry)
+            publication_inventory = {
+                    EDATA: uploaded,
+                    EBOOK: purchased,
+                    REVISION: self.revision,
+                    }
+            if since is not None:
+                publication_inventory[DELETED] = [
+                        book_id for revision, book_id in self.deleted
+                        if revision > since]
+            return publication_inventory
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # the headers and the body are written separately: without
+        # TCP_NODELAY, the delayed ack of the client adds 40 ms per request
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b''.join(chunks)
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length)
+
+    def _send(self, status: int, body=None, headers: dict = None):
+        if body is None:
+            data = b''
+        elif isinstance(body, bytes):
+            data = body
+        else:
+            data = json.dumps(body).encode()
+        self.send_response(status)
+        if body is not None and not isinstance(body, bytes):
+            self.send_header('Content-Type', 'application/json')
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values
+                  in parse_qs(url.query).items()}
+        endpoint = _ROUTES.get((self.command, url.path))
+        body = self._read_body()
+        if endpoint is None:
+            self._send(404, {'error': f'no route {self.command} {url.path}'})
+            return
+        try:
+            status, rsp_body, headers = fake.handle(
+                    endpoint, self.command, params, self.headers, body)
+        except HttpError as e:
+            status, rsp_body, headers = e.status, {'error': str(e)}, e.headers
+        self._send(status, rsp_body, headers)
+
+    do_GET = do_POST = do_PUT = do_PATCH = _handle
+
+
+class FakeTolinoServer(object):
+
+    """http server with the endpoints used by the clients, running in a
+    thread
+
+    """
+
+    def __init__(
+            self,
+            host='127.0.0.1',
+            port=0,
+            latency=0.0,
+            error_rate=0.0,
+            error_status=503,
+            access_expires_in=3600,
+            refresh_expires_in=36000,
+            max_patches_bytes=None,
+            seed=None,
+            ):
+        """
+        :host: address to listen to
+        :port: port, a free one if 0
+        :latency: time in s before each response, or dict of endpoint
+        name: time
+        :error_rate: probability that a request fails with error_status
+        :error_status: status of the random errors
+        :access_expires_in: lifetime in s of the access tokens
+        :refresh_expires_in: lifetime in s of the refresh tokens
+        :max_patches_bytes: a larger sync-data payload is refused with 413
+        :seed: seed of the random books, ids and errors
+
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.access_expires_in = access_expires_in
+        self.refresh_expires_in = refresh_expires_in
+        self.max_patches_bytes = max_patches_bytes
+        self.library = FakeLibrary(seed)
+        self.hardware_id = secrets.token_hex(8)
+        self.session_cookie = secrets.token_hex(16)
+        self.requests = deque(maxlen=10000)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._auth_codes = set()
+        self._access_tokens = {}
+        self._refresh_tokens = {}
+        self._forced_errors = {}
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def server_settings(self) -> dict:
+        """
+        :returns: dict of the urls of the servers settings, pointing to this
+        server
+
+        """
+        return server_settings(self.url)
+
+    def login_cookies(self) -> list:
+        """
+        :returns: cookies of a GUI login on this server, as saved by the
+        clients
+
+        """
+        return [{'name': SESSION_COOKIE, 'value': self.session_cookie}]
+
+    def _new_tokens(self) -> dict:
+        now = time.time()
+        access_token = secrets.token_urlsafe(24)
+        refresh_token = secrets.token_urlsafe(24)
+        self._access_tokens[access_token] = now + self.access_expires_in
+        self._refresh_tokens[refresh_token] = now + self.refresh_expires_in
+        return {
+                ACCESS_TOKEN: access_token,
+                REFRESH_TOKEN: refresh_token,
+                EXPIRES_IN: self.access_expires_in,
+                REFRESH_EXPIRES_IN: self.refresh_expires_in,
+                'token_type': 'Bearer',
+                'scope': 'ebook_library',
+                }
+
+    def new_refresh_token(self) -> str:
+        """
+        :returns: a valid refresh token, to import in a client
+
+        """
+        with self._lock:
+            return self._new_tokens()[REFRESH_TOKEN]
+
+    def fail_next(self, endpoint: str, *statuses, retry_after=None):
+        """the next requests to the endpoint fail with these statuses
+
+        :endpoint: name of the endpoint (upload, meta...)
+        :statuses: http statuses, one per request
+        :retry_after: value of the Retry-After header of the errors
+
+        """
+        headers = {} if retry_after is None else {
+                'Retry-After': str(retry_after)}
+        with self._lock:
+            queue = self._forced_errors.setdefault(endpoint, deque())
+            queue.extend((status, headers) for status in statuses)
+
+    def _injected_error(self, endpoint: str):
+        with self._lock:
+            queue = self._forced_errors.get(endpoint)
+            if queue:
+                return queue.popleft()
+            if self.error_rate and self._random.random() < self.error_rate:
+                return self.error_status, {}
+        return None
+
+    def _check_access_token(self, headers):
+        token = headers.get(T_AUTH_TOKEN)
+        with self._lock:
+            expiration_time = self._access_tokens.get(token)
+        if expiration_time is None or expiration_time < time.time():
+            raise HttpError(401, 'invalid or expired access token')
+
+    def _check_device(self, headers):
+        self._check_access_token(headers)
+        if headers.get(HARDWARE_ID) != self.hardware_id:
+            raise HttpError(403, 'unknown hardware id')
+
+    def handle(self, endpoint: str, method: str, params: dict, headers,
+               body: bytes):
+        """
+        :returns: status, body (json value or bytes) and headers of the
+        response
+
+        """
+        self.requests.append((endpoint, method, len(body)))
+        latency = self.latency
+        if isinstance(latency, dict):
+            latency = latency.get(endpoint, 0)
+        if latency:
+            time.sleep(latency)
+        error = self._injected_error(endpoint)
+        if error is not None:
+            status, error_headers = error
+            raise HttpError(status, 'injected error', error_headers)
+        handler = getattr(self, f'_{endpoint}')
+        return handler(method, params, headers, body)
+
+    def _auth(self, method, params, headers, body):
+        cookies = headers.get('Cookie', '')
+        if f'{SESSION_COOKIE}={self.session_cookie}' not in cookies:
+            # not logged in: redirected to the login page
+            return 302, None, {'Location': f'{self.url}/auth/login'}
+        code = secrets.token_urlsafe(16)
+        with self._lock:
+            self._auth_codes.add(code)
+        redirect_uri = params.get('redirect_uri', self.url)
+        location = f'{redirect_uri}?{urlencode({"code": code})}'
+        return 302, None, {'Location': location}
+
+    def _token(self, method, params, headers, body):
+        form = {key: values[0] for key, values
+                in parse_qs(body.decode()).items()}
+        grant_type = form.get('grant_type')
+        with self._lock:
+            if grant_type == AUTHORIZATION_CODE:
+                if form.get('code') not in self._auth_codes:
+                    raise HttpError(400, 'invalid_grant')
+                self._auth_codes.discard(form['code'])
+            elif grant_type == REFRESH_TOKEN:
+                # the refresh tokens are used only once
+                expiration_time = self._refresh_tokens.pop(
+                        form.get(REFRESH_TOKEN), None)
+                if expiration_time is None or expiration_time < time.time():
+                    raise HttpError(400, 'invalid_grant')
+            else:
+                raise HttpError(400, 'unsupported_grant_type')
+            return 200, self._new_tokens(), {}
+
+    def _devices(self, method, params, headers, body):
+        self._check_access_token(headers)
+        devices = [
+                {
+                    DEVICE_ID: secrets.token_hex(8),
+                    DEVICE_LAST_USAGE: 1500000000000,
+                    'deviceName': 'old reader',
+                    },
+                {
+                    DEVICE_ID: self.hardware_id,
+                    DEVICE_LAST_USAGE: round(time.time() * 1000),
+                    'deviceName': 'webreader',
+                    },
+                ]
+        return 200, {DEVICE_LIST_RESPONSE: {DEVICES: devices}}, {}
+
+    def _upload(self, method, params, headers, body):
+        self._check_device(headers)
+        fields = parse_multipart(headers.get('Content-Type', ''), body)
+        if 'file' not in fields:
+            raise HttpError(400, 'no file in upload')
+        filename, content = fields['file']
+        metadata = self.library.upload(filename or 'unknown', len(content))
+        return 200, {'metadata': dict(
+            metadata, deliverableId=metadata[IDENTIFIER])}, {}
+
+    def _meta(self, method, params, headers, body):
+        self._check_device(headers)
+        if method == 'GET':
+            metadata = self.library.metadata(params.get(DELIVERABLE_ID))
+            return 200, {'metadata': metadata}, {}
+        try:
+            metadata = json.loads(body)[UPLOAD_METADATA]
+        except (ValueError, KeyError):
+            raise HttpError(400, 'invalid metadata')
+        book_id = (params.get(DELIVERABLE_ID) or metadata.get(DELIVERABLE_ID)
+                   or metadata.get(IDENTIFIER))
+        self.library.update_metadata(book_id, metadata)
+        return 200, {'metadata': self.library.metadata(book_id)}, {}
+
+    def _cover(self, method, params, headers, body):
+        self._check_device(headers)
+        fields = parse_multipart(headers.get('Content-Type', ''), body)
+        try:
+            book_id = fields[DELIVERABLE_ID][1].decode()
+            cover = fields['file'][1]
+        except KeyError:
+            raise HttpError(400, 'no deliverableId or file in cover upload')
+        self.library.set_cover(book_id, cover)
+        return 200, {}, {}
+
+    def _sync_data(self, method, params, headers, body):
+        self._check_device(headers)
+        if self.max_patches_bytes and len(body) > self.max_patches_bytes:
+            raise HttpError(413, 'payload too large')
+        try:
+            patches = json.loads(body)['patches']
+        except (ValueError, KeyError):
+            raise HttpError(400, 'invalid sync-data payload')
+        self.library.patch_tags(patches)
+        return 200, {REVISION: self.library.revision}, {}
+
+    def _delete(self, method, params, headers, body):
+        self._check_device(headers)
+        self.library.delete(params.get(DELIVERABLE_ID))
+        return 200, {}, {}
+
+    def _inventory(self, method, params, headers, body):
+        self._check_device(headers)
+        since = params.get(REVISION)
+        since = None if since is None else int(since)
+        inventory = self.library.inventory(since)
+        return 200, {PUBLICATION_INVENTORY: inventory}, {}
+
+    def start(self):
+        """serve in a daemon thread"""
+        self._thread = threading.Thread(
+                target=self._httpd.serve_forever,
+                kwargs=dict(poll_interval=0.05),
+                daemon=True,
+                )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    """run a fake server until interrupted"""
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=8080,
+                        help='0 for a free port')
+    parser.add_argument('--books', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeTolinoServer(
+            port=args.port, latency=args.latency, error_rate=args.error_rate)
+    server.library.add_random_books(args.books)
+    print(f'fake tolino server on {server.url}')
+    print(f'refresh token: {server.new_refresh_token()}')
+    print(f'hardware id: {server.hardware_id}', flush=True)
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server._httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+
+
+"""
+inventory of the cloud: indexed view of the books, and local copy to
+download only what changed since the last sync
+"""
+
+
+import json
+import sqlite3
+import threading
+import unicodedata
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from collections.abc import Sequence
+
+
+from pytolino.storage import get_account_path
+from pytolino.book import Book
+from pytolino.requests_keys import EDATA, EBOOK, EPUB_METADATA, IDENTIFIER
+
+
+def get_book_id(book: dict) -> str:
+    """
+    :book: dict of an inventory entry, or Book
+    :returns: id of the book on the cloud (deliverableId)
+
+    """
+    if isinstance(book, Book):
+        return book.book_id
+    return book[EPUB_METADATA][IDENTIFIER]
+
+
+def normalize(text) -> str:
+    """normalize a title or an author for the lookups: lower case, without
+    accents and with single spaces
+
+    """
+    if text is None:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    stripped = ''.join(
+            char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+def normalize_isbn(isbn) -> str:
+    if isbn is None:
+        return ''
+    return ''.join(char for char in str(isbn) if char.isalnum()).upper()
+
+
+class Inventory(Sequence):
+
+    """books of the cloud (dict like the ones of get_inventory, or Book)
+    with hash indexes on the id, isbn, title and author, and a title search.
+    the indexes are built once, the inventory should not be modified.
+
+    """
+
+    _SEPARATOR = '\x00'
+
+    def __init__(self, books: list):
+        """
+        :books: list of dict, as returned by get_inventory, or of Book
+
+        """
+        self._books = list(books)
+        self._by_id = {}
+        self._by_isbn = defaultdict(list)
+        self._by_title = defaultdict(list)
+        self._by_author = defaultdict(list)
+        titles = []
+        for index, book in enumerate(self._books):
+            if isinstance(book, Book):
+                book_id, isbn, title, authors = (
+                        book.book_id, book.isbn, book.title, book.authors)
+            else:
+                metadata = book.get(EPUB_METADATA, {})
+                book_id = metadata.get(IDENTIFIER)
+                isbn = metadata.get('isbn')
+                title = metadata.get('title')
+                authors = metadata.get('author')
+                if not isinstance(authors, list):
+                    authors = [authors]
+            if book_id is not None:
+                self._by_id[book_id] = book
+            isbn = normalize_isbn(isbn)
+            if isbn:
+                self._by_isbn[isbn].append(book)
+            title = normalize(title)
+            self._by_title[title].append(book)
+            titles.append((title, index))
+            for author in authors:
+                self._by_author[normalize(author)].append(book)
+
+        # sorted titles for the prefix search
+        titles.sort()
+        self._sorted_titles = [title for title, _ in titles]
+        self._sorted_indexes = [index for _, index in titles]
+
+        # all titles in one string for the substring search
+        self._title_starts = []
+        position = 0
+        for title, _ in titles:
+            self._title_starts.append(position)
+            position += len(title) + len(self._SEPARATOR)
+        self._title_text = self._SEPARATOR.join(self._sorted_titles)
+
+    def __getitem__(self, index):
+        return self._books[index]
+
+    def __len__(self):
+        return len(self._books)
+
+    def get(self, book_id: str, default=None) -> dict:
+        """
+        :book_id: id of the book on the cloud
+        :returns: the book with this id, or default
+
+        """
+        return self._by_id.get(book_id, default)
+
+    def has_book(self, book_id: str) -> bool:
+        return book_id in self._by_id
+
+    def find_isbn(self, isbn: str) -> list:
+        """
+        :returns: list of the books with this isbn (dashes are ignored)
+
+        """
+        return list(self._by_isbn.get(normalize_isbn(isbn), []))
+
+    def find_title(self, title: str) -> list:
+        """
+        :returns: list of the books with this title (case and accents
+        are ignored)
+
+        """
+        return list(self._by_title.get(normalize(title), []))
+
+    def find_author(self, author: str) -> list:
+        """
+        :returns: list of the books of this author (case and accents
+        are ignored)
+
+        """
+        return list(self._by_author.get(normalize(author), []))
+
+    def search_title(self, text: str, prefix=False) -> list:
+        """search the books whose title contains a text
+
+        :text: str to search (case and accents are ignored)
+        :prefix: if True, the title must start with the text
+        :returns: list of books, sorted by title
+
+        """
+        text = normalize(text)
+        if prefix:
+            start = bisect_left(self._sorted_titles, text)
+            stop = bisect_left(
+                    self._sorted_titles, text + '\U0010ffff', lo=start)
+            positions = range(start, stop)
+        else:
+            positions = []
+            found = self._title_text.find(text)
+            while found != -1:
+                position = bisect_right(self._title_starts, found) - 1
+                positions.append(position)
+                # go to the next title
+                if position + 1 >= len(self._title_starts):
+                    break
+                found = self._title_text.find(
+                        text, self._title_starts[position + 1])
+        return [self._books[self._sorted_indexes[position]]
+                for position in positions]
+
+
+class InventoryCache(object):
+
+    """inventory of an account stored in sqlite, with the revision of the
+    last sync. the books are also kept in memory, so that applying a delta
+    costs time in proportion of the number of changed books.
+
+    """
+
+    KINDS = (EDATA, EBOOK)
+
+    def __init__(self, db_path):
+        """
+        :db_path: path of the sqlite file (or ':memory:')
+
+        """
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+                str(db_path),
+                check_same_thread=False,
+                timeout=30,
+                )
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                    'CREATE TABLE IF NOT EXISTS books ('
+                    'id TEXT PRIMARY KEY, '
+                    'kind TEXT NOT NULL, '
+                    'book TEXT NOT NULL)')
+            self._connection.execute(
+                    'CREATE TABLE IF NOT EXISTS state ('
+                    'key TEXT PRIMARY KEY, value TEXT)')
+        self._load()
+
+    @classmethod
+    def for_account(cls, server_name: str, username: str):
+        """open the cache of an account, in the data folder of pytolino
+
+        :server_name: tolino partner
+        :username: str
+        :returns: InventoryCache
+
+        """
+        db_path = get_account_path(
+                server_name, username, '.inventory.sqlite')
+        return cls(db_path)
+
+    def _load(self):
+        with self._lock:
+            row = self._connection.execute(
+                    'SELECT value FROM state WHERE key = ?',
+                    ('revision',),
+                    ).fetchone()
+            self._revision = None if row is None else json.loads(row[0])
+            self._books = {kind: {} for kind in self.KINDS}
+            rows = self._connection.execute(
+                    'SELECT id, kind, book FROM books ORDER BY rowid')
+            for book_id, kind, book in rows:
+                self._books[kind][book_id] = json.loads(book)
+
+    @property
+    def revision(self):
+        """revision of the inventory at the last sync, None if the cache
+        was never filled
+
+        """
+        return self._revision
+
+    def books(self) -> list:
+        """
+        :returns: list of the uploaded books followed by the purchased books
+
+        """
+        with self._lock:
+            books = []
+            for kind in self.KINDS:
+                books.extend(self._books[kind].values())
+        return books
+
+    def book_ids(self, kind: str) -> set:
+        """
+        :kind: edata (uploaded) or ebook (purchased)
+        :returns: set of the ids of the books of this kind
+
+        """
+        with self._lock:
+            return set(self._books[kind])
+
+    def _write_books(self, kind: str, books: list):
+        rows = []
+        for book in books:
+            book_id = get_book_id(book)
+            self._books[kind][book_id] = book
+            rows.append((book_id, kind, json.dumps(book)))
+        self._connection.executemany(
+                'INSERT OR REPLACE INTO books (id, kind, book) '
+                'VALUES (?, ?, ?)',
+                rows,
+                )
+
+    def _write_revision(self, revision):
+        self._revision = revision
+        self._connection.execute(
+                'INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)',
+                ('revision', json.dumps(revision)),
+                )
+
+    def replace(self, uploaded: list, purchased: list, revision=None):
+        """replace the whole inventory
+
+        :uploaded: list of uploaded books (edata)
+        :purchased: list of purchased books (ebook)
+        :revision: revision of this inventory
+
+        """
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM books')
+            self._books = {kind: {} for kind in self.KINDS}
+            self._write_books(EDATA, uploaded)
+            self._write_books(EBOOK, purchased)
+            self._write_revision(revision)
+
+    def apply_delta(self, uploaded: list, purchased: list, deleted: list,
+                    revision):
+        """update the inventory with the changes since the last revision
+
+        :uploaded: list of new or changed uploaded books (edata)
+        :purchased: list of new or changed purchased books (ebook)
+        :deleted: list of ids (or books) that were removed
+        :revision: new revision
+
+        """
+        with self._lock, self._connection:
+            for kind, books in ((EDATA, uploaded), (EBOOK, purchased)):
+                for book in books:
+                    book_id = get_book_id(book)
+                    for other_kind in self.KINDS:
+                        self._books[other_kind].pop(book_id, None)
+                self._write_books(kind, books)
+            deleted_ids = [
+                    item if isinstance(item, str) else get_book_id(item)
+                    for item in deleted]
+            for book_id in deleted_ids:
+                for kind in self.KINDS:
+                    self._books[kind].pop(book_id, None)
+            self._connection.executemany(
+                    'DELETE FROM books WHERE id = ?',
+                    [(book_id,) for book_id in deleted_ids],
+                    )
+            self._write_revision(revision)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
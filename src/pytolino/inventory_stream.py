@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+
+"""
+incremental parser of the inventory response. the body is fed chunk by
+chunk while it is downloaded, and each book of the edata and ebook lists is
+returned as soon as it is complete, so the whole response (and the whole
+json tree) is never in memory. the other fields of the PublicationInventory
+(revision, deleted...) are kept in InventoryParser.fields.
+"""
+
+
+import codecs
+import json
+import re
+
+
+from pytolino.requests_keys import PUBLICATION_INVENTORY, EDATA, EBOOK
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# a number or literal followed by one of these (or by nothing) may continue
+# in the next chunk
+_NUMBER_CHARS = frozenset('0123456789.eE+-')
+_DELIMITED = (dict, list, str)
+
+_MORE = object()
+
+
+class InventoryParser(object):
+
+    """push parser of {"PublicationInventory": {"edata": [...], "ebook":
+    [...], ...}}. feed returns the books that were completed by the chunk,
+    as (list name, book) tuples.
+
+    """
+
+    def __init__(self, lists=(EDATA, EBOOK)):
+        """
+        :lists: names of the lists of PublicationInventory that are streamed
+
+        """
+        self._lists = frozenset(lists)
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._parser = self._parse()
+        self._found = False
+        self.fields = {}
+        self.seen_lists = set()
+
+    def feed(self, chunk: bytes) -> list:
+        """
+        :chunk: next bytes of the response body
+        :returns: list of (list name, book) completed by the chunk
+
+        """
+        text = self._text_decoder.decode(chunk)
+        if self._pos:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        self._buffer += text
+        return self._pump()
+
+    def close(self) -> list:
+        """end of the body
+
+        :returns: list of the last (list name, book)
+        :raises: ValueError if the body is not a complete inventory
+
+        """
+        self._buffer += self._text_decoder.decode(b'', final=True)
+        self._eof = True
+        items = self._pump()
+        missing = self._lists - self.seen_lists
+        if missing:
+            raise ValueError(f'no {", ".join(sorted(missing))} in inventory')
+        return items
+
+    def _pump(self) -> list:
+        items = []
+        for item in self._parser:
+            if item is _MORE:
+                break
+            items.append(item)
+        return items
+
+    def _error(self, expected: str):
+        found = self._buffer[self._pos:self._pos + 20] or 'end of body'
+        return ValueError(f'expected {expected} in inventory, got {found!r}')
+
+    def _skip_whitespace(self):
+        """generator returning the next character that is not a space"""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if self._eof:
+                return ''
+            yield _MORE
+
+    def _expect(self, char: str):
+        found = yield from self._skip_whitespace()
+        if found != char:
+            raise self._error(repr(char))
+        self._pos += 1
+
+    def _value(self):
+        """generator returning the next json value"""
+        yield from self._skip_whitespace()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(
+                        self._buffer, self._pos)
+            except json.JSONDecodeError as e:
+                if self._eof:
+                    raise ValueError(f'json error in inventory: {e}')
+            else:
+                complete = isinstance(value, _DELIMITED) or (
+                        end < len(self._buffer)
+                        and self._buffer[end] not in _NUMBER_CHARS)
+                if complete or self._eof:
+                    self._pos = end
+                    return value
+            yield _MORE
+
+    def _members(self):
+        """generator of (key, first character of the value) of an object,
+        whose opening brace was read. the value must be read by the caller
+
+        """
+        char = yield from self._skip_whitespace()
+        if char == '}':
+            self._pos += 1
+            return
+        while True:
+            key = yield from self._value()
+            if not isinstance(key, str):
+                raise self._error('a key')
+            yield from self._expect(':')
+            char = yield from self._skip_whitespace()
+            yield key, char
+            char = yield from self._skip_whitespace()
+            if char not in ('}', ','):
+                raise self._error("',' or '}'")
+            self._pos += 1
+            if char == '}':
+                return
+
+    def _parse(self):
+        yield from self._expect('{')
+        members = self._members()
+        for member in members:
+            if member is _MORE:
+                yield member
+                continue
+            key, char = member
+            if key == PUBLICATION_INVENTORY and char == '{':
+                self._pos += 1
+                yield from self._publication_inventory()
+            else:
+                yield from self._value()
+        char = yield from self._skip_whitespace()
+        if char:
+            raise self._error('end of body')
+        if not self._found:
+            raise ValueError(f'no {PUBLICATION_INVENTORY} in inventory')
+
+    def _publication_inventory(self):
+        self._found = True
+        for member in self._members():
+            if member is _MORE:
+                yield member
+                continue
+            key, char = member
+            if key in self._lists and char == '[':
+                self._pos += 1
+                self.seen_lists.add(key)
+                yield from self._list(key)
+            else:
+                self.fields[key] = yield from self._value()
+
+    def _list(self, name: str):
+        char = yield from self._skip_whitespace()
+        if char == ']':
+            self._pos += 1
+            return
+        while True:
+            book = yield from self._value()
+            yield name, book
+            char = yield from self._skip_whitespace()
+            if char not in (']', ','):
+                raise self._error("',' or ']'")
+            self._pos += 1
+            if char == ']':
+                return
+
+
+def iter_inventory_books(chunks, lists=(EDATA, EBOOK)):
+    """
+    :chunks: iterable of bytes of an inventory response
+    :lists: names of the lists that are streamed
+    :returns: generator of (list name, book). the parser, with the other
+    fields, is the value of the StopIteration
+
+    """
+    parser = InventoryParser(lists)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+    return parser
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+
+"""
+columnar inventory, for the very large accounts. the fields of the books
+are stored by column: the ids, titles and isbns packed in strings with an
+array of offsets, the publishers, languages, formats and authors as codes in
+a table of distinct values, and the file sizes in an array. a book costs
+about a hundred bytes instead of a few kilobytes of dicts, and a filter on
+a coded column evaluates its condition once per distinct value.
+"""
+
+
+from array import array
+from collections.abc import Sequence
+
+
+from pytolino.book import Book
+
+
+class _TextColumn(object):
+
+    """strings packed in blocks of BLOCK_SIZE rows. the empty string is
+    returned as None
+
+    """
+
+    BLOCK_SIZE = 1024
+
+    def __init__(self):
+        self._blocks = []
+        self._ends = array('I')
+        self._pending = []
+
+    def append(self, value):
+        self._pending.append('' if value is None else str(value))
+        if len(self._pending) == self.BLOCK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        end = 0
+        for value in self._pending:
+            end += len(value)
+            self._ends.append(end)
+        self._blocks.append(''.join(self._pending))
+        self._pending = []
+
+    def __len__(self):
+        return len(self._ends) + len(self._pending)
+
+    def __getitem__(self, row: int):
+        block, position = divmod(row, self.BLOCK_SIZE)
+        if block < len(self._blocks):
+            start = self._ends[row - 1] if position else 0
+            value = self._blocks[block][start:self._ends[row]]
+        else:
+            value = self._pending[position]
+        return value or None
+
+
+class _CodedColumn(object):
+
+    """values stored as codes in a table of distinct values"""
+
+    def __init__(self):
+        self.values = []
+        self._codes_of_values = {}
+        self.codes = array('I')
+
+    def append(self, value):
+        code = self._codes_of_values.get(value)
+        if code is None:
+            code = self._codes_of_values[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row: int):
+        return self.values[self.codes[row]]
+
+    def matching_codes(self, condition) -> set:
+        """
+        :condition: value, or function of a value returning a bool
+        :returns: set of the codes of the values matching the condition
+
+        """
+        if callable(condition):
+            return {code for code, value in enumerate(self.values)
+                    if condition(value)}
+        code = self._codes_of_values.get(condition)
+        return set() if code is None else {code}
+
+
+class _IntColumn(object):
+
+    """int values in an array, None is stored as -1"""
+
+    def __init__(self):
+        self._values = array('q')
+
+    def append(self, value):
+        self._values.append(-1 if value is None else int(value))
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, row: int):
+        value = self._values[row]
+        return None if value == -1 else value
+
+
+class InventoryTable(Sequence):
+
+    """books of the cloud stored by column. the items are Book without the
+    raw entry. the table can only grow, with append.
+
+    """
+
+    TEXT_FIELDS = ('book_id', 'title', 'isbn')
+    CODED_FIELDS = ('authors', 'publisher', 'language', 'format')
+    INT_FIELDS = ('file_size',)
+
+    def __init__(self, books=()):
+        """
+        :books: iterable of dict (as returned by get_inventory or
+        iter_inventory) or of Book
+
+        """
+        self._columns = {}
+        for field in self.TEXT_FIELDS:
+            self._columns[field] = _TextColumn()
+        for field in self.CODED_FIELDS:
+            self._columns[field] = _CodedColumn()
+        for field in self.INT_FIELDS:
+            self._columns[field] = _IntColumn()
+        for book in books:
+            self.append(book)
+
+    def append(self, book):
+        """
+        :book: dict of an inventory entry, or Book
+
+        """
+        if not isinstance(book, Book):
+            book = Book.from_dict(book, keep_raw=False)
+        for field, column in self._columns.items():
+            column.append(getattr(book, field))
+
+    def __len__(self):
+        return len(self._columns['book_id'])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[row] for row in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('InventoryTable index out of range')
+        return Book(**{field: column[index]
+                       for field, column in self._columns.items()})
+
+    def column(self, field: str, rows=None) -> list:
+        """
+        :field: name of a field of Book
+        :rows: indexes of the rows, all if None
+        :returns: list of the values of the field
+
+        """
+        column = self._columns[field]
+        if rows is None:
+            rows = range(len(self))
+        return [column[row] for row in rows]
+
+    def where(self, **conditions) -> list:
+        """find the books matching all the conditions
+
+        :conditions: field name: value, or function of a value returning a
+        bool. functions are called once per distinct value of the coded
+        fields (authors, publisher, language, format)
+        :returns: list of the indexes of the matching rows
+
+        """
+        rows = None
+        # the coded columns first, they are the cheapest to scan
+        fields = sorted(
+                conditions, key=lambda field: field not in self.CODED_FIELDS)
+        for field in fields:
+            condition = conditions[field]
+            column = self._columns[field]
+            candidates = range(len(self)) if rows is None else rows
+            if field in self.CODED_FIELDS:
+                codes = column.matching_codes(condition)
+                column_codes = column.codes
+                rows = [row for row in candidates
+                        if column_codes[row] in codes]
+            elif callable(condition):
+                rows = [row for row in candidates if condition(column[row])]
+            else:
+                rows = [row for row in candidates
+                        if column[row] == condition]
+        return list(range(len(self))) if rows is None else rows
+
+    def take(self, rows) -> 'InventoryTable':
+        """
+        :rows: indexes of rows
+        :returns: new InventoryTable with these rows
+
+        """
+        return InventoryTable(self[row] for row in rows)
+
+    def filter(self, **conditions) -> 'InventoryTable':
+        """
+        :conditions: see where
+        :returns: new InventoryTable with the matching books
+
+        """
+        return self.take(self.where(**conditions))
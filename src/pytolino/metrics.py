@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+
+"""
+metrics of the clients: latency, status, bytes and retries of the requests
+of each endpoint, and the duration of the token refreshes and browser
+logins. a client is given a Metrics object, that can be the in-memory
+collector below, exported in the prometheus text format, or any other
+implementation of the interface.
+"""
+
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+
+# seconds. the logins and uploads of big ebooks take several seconds
+DEFAULT_BUCKETS = (
+        0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+TOKEN_REFRESH = 'token_refresh'
+TOKEN_ADOPTED = 'token_adopted'
+BROWSER_LOGIN = 'browser_login'
+
+
+class Metrics(object):
+
+    """interface of the metrics recorders. the methods do nothing, so an
+    instance is used by the clients when no metrics are wanted. the methods
+    can be called from many threads.
+
+    """
+
+    def observe_request(self, partner: str, endpoint: str, method: str,
+                        status: int, seconds: float, bytes_sent: int,
+                        bytes_received: int):
+        """a response was received
+
+        :partner: server name of the client
+        :endpoint: name of the endpoint (token, inventory, upload...)
+        :method: http method
+        :status: http status code
+        :seconds: time until the response was received
+        :bytes_sent: size of the request body
+        :bytes_received: size of the response body
+
+        """
+
+    def observe_retry(self, partner: str, endpoint: str):
+        """a request to the endpoint is sent again"""
+
+    def observe_event(self, partner: str, event: str, seconds: float = None,
+                      ok: bool = True):
+        """something happened that is not a single request
+
+        :event: name of the event (token_refresh, browser_login...)
+        :seconds: duration of the event, if any
+        :ok: False if the event failed
+
+        """
+
+    @contextmanager
+    def time_event(self, partner: str, event: str):
+        """context manager that observes the duration of the event, failed
+        if an exception is raised
+
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe_event(
+                    partner, event, time.perf_counter() - start, ok=False)
+            raise
+        self.observe_event(partner, event, time.perf_counter() - start)
+
+
+class Histogram(object):
+
+    """cumulative histogram with fixed buckets, like prometheus"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> list:
+        """
+        :returns: list of (upper bound, number of values <= bound), the last
+        bound is inf
+
+        """
+        bounds = self.buckets + (float('inf'),)
+        total = 0
+        cumulative = []
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+
+class InMemoryMetrics(Metrics):
+
+    """keep the metrics in memory, for all the clients sharing it"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        :buckets: upper bounds in seconds of the latency histograms
+
+        """
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+        self.bytes_sent = {}
+        self.bytes_received = {}
+        self.retries = {}
+        self.event_durations = {}
+        self.events = {}
+
+    def _histogram(self, histograms: dict, key) -> Histogram:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(self._buckets)
+        return histogram
+
+    @staticmethod
+    def _increment(counters: dict, key, value=1):
+        counters[key] = counters.get(key, 0) + value
+
+    def observe_request(self, partner, endpoint, method, status, seconds,
+                        bytes_sent, bytes_received):
+        with self._lock:
+            self._histogram(
+                    self.latencies, (partner, endpoint, method)
+                    ).observe(seconds)
+            self._increment(self.statuses, (partner, endpoint, status))
+            self._increment(self.bytes_sent, (partner, endpoint), bytes_sent)
+            self._increment(
+                    self.bytes_received, (partner, endpoint), bytes_received)
+
+    def observe_retry(self, partner, endpoint):
+        with self._lock:
+            self._increment(self.retries, (partner, endpoint))
+
+    def observe_event(self, partner, event, seconds=None, ok=True):
+        with self._lock:
+            outcome = 'ok' if ok else 'error'
+            self._increment(self.events, (partner, event, outcome))
+            if seconds is not None:
+                self._histogram(
+                        self.event_durations, (partner, event)
+                        ).observe(seconds)
+
+    def snapshot(self) -> dict:
+        """
+        :returns: dict of copies of the counters, and the (count, sum) of the
+        histograms, with tuples of labels as keys
+
+        """
+        with self._lock:
+            return {
+                    'latencies': {
+                        key: (histogram.count, histogram.sum)
+                        for key, histogram in self.latencies.items()},
+                    'statuses': dict(self.statuses),
+                    'bytes_sent': dict(self.bytes_sent),
+                    'bytes_received': dict(self.bytes_received),
+                    'retries': dict(self.retries),
+                    'event_durations': {
+                        key: (histogram.count, histogram.sum)
+                        for key, histogram in self.event_durations.items()},
+                    'events': dict(self.events),
+                    }
+
+    def to_prometheus(self) -> str:
+        """
+        :returns: the metrics in the prometheus text exposition format
+
+        """
+        with self._lock:
+            return to_prometheus(self)
+
+
+def _escape(value) -> str:
+    return (str(value).replace('\\', '\\\\').replace('\n', '\\n')
+            .replace('"', '\\"'))
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _histogram_lines(name, label_names, histograms) -> list:
+    lines = [f'# TYPE {name} histogram']
+    for key, histogram in sorted(histograms.items()):
+        for bound, count in histogram.cumulative_counts():
+            labels = _labels(label_names, key, [('le', _format_bound(bound))])
+            lines.append(f'{name}_bucket{{{labels}}} {count}')
+        labels = _labels(label_names, key)
+        lines.append(f'{name}_sum{{{labels}}} {histogram.sum!r}')
+        lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+def _counter_lines(name, label_names, counters) -> list:
+    lines = [f'# TYPE {name} counter']
+    for key, value in sorted(counters.items()):
+        lines.append(f'{name}{{{_labels(label_names, key)}}} {value}')
+    return lines
+
+
+def to_prometheus(metrics: InMemoryMetrics, prefix='pytolino') -> str:
+    """
+    :metrics: InMemoryMetrics
+    :prefix: prefix of the names of the metrics
+    :returns: the metrics in the prometheus text exposition format
+
+    """
+    lines = []
+    lines += _histogram_lines(
+            f'{prefix}_request_duration_seconds',
+            ('partner', 'endpoint', 'method'),
+            metrics.latencies)
+    lines += _counter_lines(
+            f'{prefix}_requests_total',
+            ('partner', 'endpoint', 'status'),
+            metrics.statuses)
+    lines += _counter_lines(
+            f'{prefix}_request_bytes_sent_total',
+            ('partner', 'endpoint'),
+            metrics.bytes_sent)
+    lines += _counter_lines(
+            f'{prefix}_request_bytes_received_total',
+            ('partner', 'endpoint'),
+            metrics.bytes_received)
+    lines += _counter_lines(
+            f'{prefix}_request_retries_total',
+            ('partner', 'endpoint'),
+            metrics.retries)
+    lines += _histogram_lines(
+            f'{prefix}_event_duration_seconds',
+            ('partner', 'event'),
+            metrics.event_durations)
+    lines += _counter_lines(
+            f'{prefix}_events_total',
+            ('partner', 'event', 'outcome'),
+            metrics.events)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+
+"""
+streaming multipart/form-data body for the uploads. requests builds the
+whole multipart body in memory when files are given with files=, which is
+a problem for big ebooks. The encoder below reads the files from the disk
+only while the body is sent, chunk by chunk.
+"""
+
+
+import os
+import secrets
+from bisect import bisect_right
+from pathlib import Path
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _quote(value: str) -> str:
+    """escape a header parameter value (like the filename)"""
+    return (str(value).replace('"', '%22')
+            .replace('\r', '%0D').replace('\n', '%0A'))
+
+
+class MultipartEncoder(object):
+
+    """file-like object for a multipart/form-data body. It can be given as
+    data to requests (or as content to curl_cffi), that will read it by
+    chunks. Only one file is open at a time, and the memory used does not
+    depend on the size of the files.
+
+    """
+
+    def __init__(
+            self,
+            fields: dict = None,
+            files: list = None,
+            progress=None,
+            chunk_size=CHUNK_SIZE,
+            boundary: str = None,
+            ):
+        """
+        :fields: dict of name: value of the text fields
+        :files: list of (name, (filename, file_path, mime)), like the files
+        argument of requests but with a path instead of an open file
+        :progress: function called with (bytes sent, total bytes) after
+        each chunk is read
+        :chunk_size: size in bytes of the chunks when iterating
+        :boundary: str, random if None
+
+        """
+        if boundary is None:
+            boundary = secrets.token_hex(16)
+        self.boundary = boundary
+        self._progress = progress
+        self._chunk_size = chunk_size
+        self._filenames = []
+
+        self._segments = []
+        self._offsets = []
+        self._length = 0
+        if fields:
+            for name, value in fields.items():
+                header = (
+                        f'--{boundary}\r\n'
+                        f'Content-Disposition: form-data; '
+                        f'name="{_quote(name)}"\r\n\r\n')
+                self._add_segment(header.encode())
+                self._add_segment(str(value).encode())
+                self._add_segment(b'\r\n')
+        if files:
+            for name, (filename, file_path, mime) in files:
+                file_path = Path(file_path)
+                self._filenames.append(filename)
+                header = (
+                        f'--{boundary}\r\n'
+                        f'Content-Disposition: form-data; '
+                        f'name="{_quote(name)}"; '
+                        f'filename="{_quote(filename)}"\r\n'
+                        f'Content-Type: {mime}\r\n\r\n')
+                self._add_segment(header.encode())
+                self._add_segment(file_path, os.path.getsize(file_path))
+                self._add_segment(b'\r\n')
+        self._add_segment(f'--{boundary}--\r\n'.encode())
+
+        self._position = 0
+        self._open_index = None
+        self._open_file = None
+
+    def _add_segment(self, source, length=None):
+        if length is None:
+            length = len(source)
+        self._offsets.append(self._length)
+        self._segments.append(source)
+        self._length += length
+
+    @property
+    def content_type(self) -> str:
+        """value of the content-type header to send with the body"""
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self._length
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(files={self._filenames}, '
+                f'length={self._length})')
+
+    def _read_file(self, index: int, start: int, size: int) -> bytes:
+        if self._open_index != index:
+            self.close()
+            self._open_file = open(self._segments[index], 'rb')
+            self._open_index = index
+        if self._open_file.tell() != start:
+            self._open_file.seek(start)
+        return self._open_file.read(size)
+
+    def read(self, size=-1) -> bytes:
+        """read the next bytes of the body
+
+        :size: max number of bytes. if negative, read until the end
+        :returns: bytes (empty at the end of the body)
+
+        """
+        if size is None or size < 0:
+            size = self._length - self._position
+        chunks = []
+        remaining = size
+        while remaining > 0 and self._position < self._length:
+            index = bisect_right(self._offsets, self._position) - 1
+            source = self._segments[index]
+            offset = self._offsets[index]
+            next_offset = (self._offsets[index + 1]
+                           if index + 1 < len(self._offsets)
+                           else self._length)
+            start = self._position - offset
+            n = min(remaining, next_offset - self._position)
+            if isinstance(source, bytes):
+                chunk = source[start:start + n]
+            else:
+                chunk = self._read_file(index, start, n)
+                if not chunk:
+                    raise OSError(f'{source} changed size while uploading')
+            chunks.append(chunk)
+            self._position += len(chunk)
+            remaining -= len(chunk)
+        data = b''.join(chunks)
+        if data and self._progress is not None:
+            self._progress(self._position, self._length)
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self._chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def tell(self) -> int:
+        return self._position
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence=os.SEEK_SET) -> int:
+        """move in the body, to send it again (retry, redirect...)"""
+        if whence == os.SEEK_SET:
+            position = offset
+        elif whence == os.SEEK_CUR:
+            position = self._position + offset
+        elif whence == os.SEEK_END:
+            position = self._length + offset
+        else:
+            raise ValueError(f'invalid whence: {whence}')
+        self._position = max(0, position)
+        return self._position
+
+    def close(self):
+        """close the file that is being read, if any"""
+        if self._open_file is not None:
+            self._open_file.close()
+        self._open_file = None
+        self._open_index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+
+"""
+one log record per http request. the record is built only if its level is
+enabled, the response body is truncated without decoding all of it, and the
+tokens, cookies and passwords are replaced by *** before anything is
+formatted.
+"""
+
+
+import json
+import logging
+import re
+from collections.abc import Mapping
+
+
+BODY_MAX_BYTES = 2048
+RECORD_MAX_CHARS = 8192
+REDACTED = '***'
+STREAMED = '[streamed]'
+
+SECRET_KEYS = frozenset((
+        't_auth_token',
+        'auth_token',
+        'refresh_token',
+        'access_token',
+        'id_token',
+        'authorization',
+        'cookie',
+        'set-cookie',
+        'password',
+        'code',
+        ))
+
+# key=value (form, query, location) or "key": "value" (json) in a text
+_SECRET_PATTERN = re.compile(
+        r'(?P<key>["\']?\b(?:' + '|'.join(
+            re.escape(key) for key in sorted(SECRET_KEYS)) +
+        r')\b["\']?\s*[:=]\s*["\']?)(?P<value>[^"\'&,;\s}]+)',
+        re.IGNORECASE,
+        )
+
+
+def redact_text(text: str) -> str:
+    """replace the values of the secret keys found in a text"""
+    return _SECRET_PATTERN.sub(
+            lambda match: match.group('key') + REDACTED, text)
+
+
+def redact(value):
+    """copy of value with the secrets replaced
+
+    :value: mapping, list, str, bytes or other object
+    :returns: json-like value
+
+    """
+    if isinstance(value, Mapping) or hasattr(value, 'items'):
+        return {
+                key: (REDACTED if str(key).lower() in SECRET_KEYS
+                      else redact(item))
+                for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, bytes):
+        value = value[:BODY_MAX_BYTES].decode('utf-8', 'replace')
+    if isinstance(value, str):
+        return redact_text(truncate(value, BODY_MAX_BYTES))
+    if value is None or isinstance(value, (int, float, bool)):
+        return value
+    return redact_text(truncate(repr(value), BODY_MAX_BYTES))
+
+
+def truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f'{text[:max_chars]}...[{len(text) - max_chars} more]'
+
+
+def _response_body(rsp) -> str:
+    """first bytes of the body, without decoding the whole response"""
+    content = rsp.content or b''
+    body = content[:BODY_MAX_BYTES].decode('utf-8', 'replace')
+    if len(content) > BODY_MAX_BYTES:
+        body += f'...[{len(content) - BODY_MAX_BYTES} more bytes]'
+    return redact_text(body)
+
+
+def request_record(rsp, data=None, streamed=False) -> dict:
+    """fields of the log record of a request
+
+    :rsp: requests or curl_cffi response
+    :data: what was sent (form data, params, json text, encoder...)
+    :streamed: the body is read later by the caller, it is not logged
+    :returns: dict of json values
+
+    """
+    request = rsp.request
+    return {
+            'method': request.method,
+            'url': redact_text(str(rsp.url)),
+            'status': rsp.status_code,
+            'data': redact(data),
+            'request_headers': redact(request.headers),
+            'response_headers': redact(rsp.headers),
+            'body': STREAMED if streamed else _response_body(rsp),
+            }
+
+
+def log_request(rsp, data=None, logger=logging.root, streamed=False):
+    """log a request with one record, at DEBUG if the response is ok, else
+    at ERROR. nothing is read from the response if the level is disabled.
+    the fields are also given to the handlers as record.request
+
+    :rsp: requests or curl_cffi response
+    :data: what was sent
+    :logger: logging.Logger
+    :streamed: the body is not read
+
+    """
+    level = logging.DEBUG if rsp.ok else logging.ERROR
+    if not logger.isEnabledFor(level):
+        return
+    record = request_record(rsp, data, streamed)
+    message = truncate(json.dumps(record, default=str), RECORD_MAX_CHARS)
+    logger.log(level, 'request %s', message, extra={'request': record})
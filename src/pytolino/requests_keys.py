@@ -18,3 +18,10 @@ UPLOAD_METADATA = 'uploadMetaData'
 CONTENT_TYPE = 'content-type'
 CLIENT_TYPE = 'client_type'
 AUTHORIZATION_CODE = 'authorization_code'
+PUBLICATION_INVENTORY = 'PublicationInventory'
+EDATA = 'edata'
+EBOOK = 'ebook'
+REVISION = 'revision'
+DELETED = 'deleted'
+EPUB_METADATA = 'epubMetaData'
+IDENTIFIER = 'identifier'
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+
+"""
+retries of the failed requests and client-side rate limiting. a request is
+sent again after a transient error with an exponential backoff and jitter,
+or after the delay asked by the server with Retry-After. the requests that
+are not idempotent (an upload would create a second book) are sent again
+only when the server did not process them. every client sending requests to
+the same host waits for the same token bucket.
+"""
+
+
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+
+import requests
+import urllib3
+from curl_cffi.requests import exceptions as curl_exceptions
+
+
+# the server did not process the request, whatever the operation
+REJECTED_STATUSES = frozenset((429,))
+# the request may have been processed, retried only if idempotent
+TRANSIENT_STATUSES = frozenset((500, 502, 503, 504))
+
+# the connection was not established, the request was not sent
+_NOT_SENT_ERRORS = (
+        requests.exceptions.ConnectTimeout,
+        curl_exceptions.ConnectTimeout,
+        curl_exceptions.DNSError,
+        )
+# the request may have been sent
+_TRANSIENT_ERRORS = (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        curl_exceptions.ConnectionError,
+        curl_exceptions.Timeout,
+        )
+
+
+def _was_not_sent(error: Exception) -> bool:
+    if isinstance(error, _NOT_SENT_ERRORS):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0] if error.args else None, 'reason', None)
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+    return False
+
+
+def parse_retry_after(value: str, now: float = None) -> float:
+    """
+    :value: value of a Retry-After header, seconds or http date
+    :now: current time, time.time() if None
+    :returns: delay in s, or None if value is invalid
+
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if now is None:
+        now = time.time()
+    return max(0.0, date.timestamp() - now)
+
+
+class RetryPolicy(object):
+
+    """when and after how long a request is sent again"""
+
+    def __init__(
+            self,
+            max_attempts: int = 4,
+            backoff: float = 0.5,
+            max_backoff: float = 30.0,
+            max_retry_after: float = 120.0,
+            ):
+        """
+        :max_attempts: number of times a request is sent at most
+        :backoff: base delay in s, doubled after each attempt
+        :max_backoff: max delay in s of the backoff
+        :max_retry_after: a longer Retry-After is not waited, the request
+        fails
+
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+
+    def should_retry(self, attempt: int, idempotent: bool, response=None,
+                     error: Exception = None) -> bool:
+        """
+        :attempt: number of times the request was sent
+        :idempotent: if False, the request is sent again only if the server
+        did not process it
+        :response: response of the last attempt, if any
+        :error: exception of the last attempt, if any
+        :returns: True if the request should be sent again
+
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if error is not None:
+            if _was_not_sent(error):
+                return True
+            return idempotent and isinstance(error, _TRANSIENT_ERRORS)
+        status = response.status_code
+        if status in REJECTED_STATUSES:
+            return True
+        return idempotent and status in TRANSIENT_STATUSES
+
+    def delay(self, attempt: int, response=None) -> float:
+        """
+        :attempt: number of times the request was sent
+        :response: response of the last attempt, if any
+        :returns: time in s to wait before the next attempt: the Retry-After
+        of the response, else a random time up to the exponential backoff
+        (full jitter). None if the server asks to wait too long
+
+        """
+        if response is not None:
+            headers = getattr(response, 'headers', None) or {}
+            retry_after = parse_retry_after(headers.get('Retry-After'))
+            if retry_after is not None:
+                if retry_after > self.max_retry_after:
+                    return None
+                return retry_after
+        backoff = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return random.uniform(0, backoff)
+
+
+class TokenBucket(object):
+
+    """rate limiter: rate requests per second on average, with bursts of
+    up to burst requests. no limit if rate is 0
+
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """take a token, possibly in advance
+
+        :returns: time in s to wait before sending the request
+
+        """
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                    self.burst, self._tokens + (now - self._time) * self.rate)
+            self._time = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """wait until a request can be sent"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def set_rate_limit(url: str, rate: float, burst: int) -> TokenBucket:
+    """replace the rate limiter of a host, for example to remove the limit
+    of a local test server
+
+    :url: url of a request, or host[:port]
+    :rate: requests per second, 0 for no limit
+    :burst: max number of requests sent at once
+    :returns: the new TokenBucket of the host
+
+    """
+    host = urlparse(url).netloc or url
+    with _buckets_lock:
+        bucket = _buckets[host] = TokenBucket(rate, burst)
+    return bucket
+
+
+def rate_limiter(url: str, rate: float, burst: int) -> TokenBucket:
+    """
+    :url: url of a request
+    :rate: requests per second, used if the bucket of the host is created
+    :burst: max number of requests sent at once, idem
+    :returns: TokenBucket shared by all the clients sending requests to the
+    host of url
+
+    """
+    host = urlparse(url).netloc
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = _buckets[host] = TokenBucket(rate, burst)
+    return bucket
@@ -15,3 +15,6 @@ COVER_URL = 'cover_url'
 META_URL = 'meta_url'
 SYNC_DATA_URL = 'sync_data_url'
 INVENTORY_URL = 'inventory_url'
+DEVICES_URL = 'devices_url'
+BROWSER_POOL_SIZE = 'browser_pool_size'
+BROWSER_TIMEOUT = 'browser_timeout'
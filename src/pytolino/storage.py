@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+
+"""
+location of the data that pytolino keeps on the disk (indexes, caches...)
+"""
+
+
+import os
+from pathlib import Path
+
+
+APP_NAME = 'pytolino'
+
+
+def get_data_dir() -> Path:
+    """folder (in XDG data home) where pytolino stores its local data.
+    it is created if necessary.
+
+    :returns: Path of the folder
+
+    """
+    data_home = os.environ.get('XDG_DATA_HOME')
+    if not data_home:
+        data_home = Path.home() / '.local' / 'share'
+    data_dir = Path(data_home) / APP_NAME
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir
+
+
+def get_account_path(server_name: str, username: str, suffix: str) -> Path:
+    """path of a file that belongs to one account of a partner
+
+    :server_name: tolino partner
+    :username: str
+    :suffix: extension of the file, like '.sqlite'
+    :returns: Path
+
+    """
+    return get_data_dir() / f'{server_name}.{username}{suffix}'
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+
+
+"""
+mirror of a local folder of ebooks on the cloud. the local files are
+matched with the books of the cloud by content hash (upload index), then by
+the file that was synced at the same path, then by title and file size
+(uploaded books only). the plan uploads the new files, replaces the changed
+ones and optionally deletes the books whose file was removed; a purchased
+book is never replaced or deleted. the hashes are cached by path, size and
+mtime, so an unchanged folder is scanned without reading the files.
+"""
+
+
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+from pytolino.storage import get_account_path
+from pytolino.upload_index import file_sha256
+from pytolino.inventory import get_book_id
+from pytolino.book import Book
+from pytolino.requests_keys import EPUB_METADATA
+
+
+EBOOK_SUFFIXES = ('.epub', '.pdf')
+
+UPLOAD = 'upload'
+REPLACE = 'replace'
+DELETE = 'delete'
+
+
+class SyncState(object):
+
+    """sqlite table of the synced files: path, size, mtime and hash of the
+    file, and id of its book on the cloud (None if not synced yet)
+
+    """
+
+    def __init__(self, db_path: Path or str):
+        """
+        :db_path: path of the sqlite file (or ':memory:')
+
+        """
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+                str(db_path),
+                check_same_thread=False,
+                timeout=30,
+                )
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                    'CREATE TABLE IF NOT EXISTS files ('
+                    'path TEXT PRIMARY KEY, '
+                    'size INTEGER NOT NULL, '
+                    'mtime_ns INTEGER NOT NULL, '
+                    'sha256 TEXT NOT NULL, '
+                    'book_id TEXT)')
+
+    @classmethod
+    def for_account(cls, server_name: str, username: str):
+        """open the sync state of an account, in the data folder of pytolino
+
+        :server_name: tolino partner
+        :username: str
+        :returns: SyncState
+
+        """
+        db_path = get_account_path(server_name, username, '.sync.sqlite')
+        return cls(db_path)
+
+    def files(self, directory: Path) -> dict:
+        """
+        :directory: absolute Path
+        :returns: dict of path str: (size, mtime_ns, sha256, book_id) of the
+        files in directory and its subfolders
+
+        """
+        prefix = os.path.join(str(directory), '')
+        pattern = (prefix.replace('\\', '\\\\').replace('%', '\\%')
+                   .replace('_', '\\_') + '%')
+        with self._lock:
+            rows = self._connection.execute(
+                    'SELECT path, size, mtime_ns, sha256, book_id '
+                    "FROM files WHERE path LIKE ? ESCAPE '\\'",
+                    (pattern,),
+                    ).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def update(self, rows: list):
+        """
+        :rows: list of (path str, size, mtime_ns, sha256, book_id)
+
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                    'INSERT OR REPLACE INTO files '
+                    '(path, size, mtime_ns, sha256, book_id) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    rows,
+                    )
+
+    def remove(self, paths: list):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                    'DELETE FROM files WHERE path = ?',
+                    [(path,) for path in paths],
+                    )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class LocalFile(object):
+
+    """an ebook of the local folder"""
+
+    __slots__ = ('path', 'size', 'mtime_ns', 'sha256', 'book_id', 'hashed')
+
+    def __init__(self, path: Path, size: int, mtime_ns: int, sha256: str,
+                 book_id: str = None):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sha256 = sha256
+        # book of the cloud synced with this path
+        self.book_id = book_id
+        # True if the hash was not in the sync state
+        self.hashed = False
+
+    def row(self, book_id=None) -> tuple:
+        return (str(self.path), self.size, self.mtime_ns, self.sha256,
+                book_id)
+
+
+def list_ebooks(directory: Path, suffixes=EBOOK_SUFFIXES) -> list:
+    """
+    :directory: Path
+    :suffixes: extensions of the files to list (case is ignored)
+    :returns: sorted list of the Path of the ebooks in directory and its
+    subfolders, hidden files excluded
+
+    """
+    paths = []
+    for root, folders, files in os.walk(directory):
+        folders[:] = [folder for folder in folders
+                      if not folder.startswith('.')]
+        for name in files:
+            if name.startswith('.'):
+                continue
+            if name.lower().endswith(suffixes):
+                paths.append(Path(root) / name)
+    paths.sort()
+    return paths
+
+
+def scan_directory(directory: Path, state: SyncState,
+                   max_workers=4) -> tuple:
+    """stat the ebooks of a folder, and hash the ones that changed since
+    the last scan
+
+    :directory: absolute Path
+    :state: SyncState
+    :max_workers: number of files hashed at the same time
+    :returns: list of LocalFile, dict of path str: state row of the files
+    that were synced but are not in the folder anymore
+
+    """
+    known = state.files(directory)
+    files = []
+    to_hash = []
+    for path in list_ebooks(directory):
+        stat = path.stat()
+        row = known.pop(str(path), None)
+        if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            files.append(LocalFile(path, *row))
+            continue
+        book_id = None if row is None else row[3]
+        local_file = LocalFile(
+                path, stat.st_size, stat.st_mtime_ns, None, book_id)
+        files.append(local_file)
+        to_hash.append(local_file)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        hashes = executor.map(
+                file_sha256, [local_file.path for local_file in to_hash])
+        for local_file, sha256 in zip(to_hash, hashes):
+            local_file.sha256 = sha256
+            local_file.hashed = True
+    return files, known
+
+
+class SyncAction(object):
+
+    """one operation of a plan. result is set when the plan is run: the id
+    of the uploaded book (None for a delete), or the exception
+
+    """
+
+    __slots__ = ('kind', 'local_file', 'book_id', 'path', 'result')
+
+    def __init__(self, kind: str, local_file: LocalFile = None,
+                 book_id: str = None, path: str = None):
+        """
+        :kind: upload, replace or delete
+        :local_file: LocalFile to upload, None for a delete
+        :book_id: book of the cloud that is replaced or deleted
+        :path: path of the removed file of a delete
+
+        """
+        self.kind = kind
+        self.local_file = local_file
+        self.book_id = book_id
+        self.path = path if local_file is None else str(local_file.path)
+        self.result = None
+
+    @property
+    def failed(self) -> bool:
+        return isinstance(self.result, Exception)
+
+    def __str__(self):
+        if self.kind == UPLOAD:
+            return f'upload  {self.local_file.path}'
+        if self.kind == REPLACE:
+            return f'replace {self.book_id} with {self.local_file.path}'
+        return f'delete  {self.book_id} ({self.path} was removed)'
+
+
+class SyncPlan(object):
+
+    """what a sync uploads, replaces and deletes, and the files that are
+    already on the cloud
+
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.actions = []
+        # LocalFile: id of the book on the cloud
+        self.unchanged = {}
+        # files matched with a book by title, not in the upload index
+        self.adopted = []
+        # paths of the sync state to forget
+        self.forgotten = []
+
+    def add(self, kind: str, local_file=None, book_id=None, path=None):
+        self.actions.append(SyncAction(kind, local_file, book_id, path))
+
+    def count(self, kind: str) -> int:
+        return sum(1 for action in self.actions if action.kind == kind)
+
+    @property
+    def failed(self) -> list:
+        return [action for action in self.actions if action.failed]
+
+    def summary(self) -> str:
+        return (f'{self.directory}: {self.count(UPLOAD)} to upload, '
+                f'{self.count(REPLACE)} to replace, '
+                f'{self.count(DELETE)} to delete, '
+                f'{len(self.unchanged)} unchanged')
+
+    def __str__(self):
+        return '\n'.join([str(action) for action in self.actions]
+                         + [self.summary()])
+
+
+def _metadata_match(local_file: LocalFile, inventory, uploaded_ids: set,
+                    claimed: set) -> str:
+    """
+    :returns: id of the only uploaded book of the inventory whose title is
+    the file name and whose size is the size of the file, or None
+
+    """
+    books = [book for book in inventory.find_title(local_file.path.stem)
+             if get_book_id(book) in uploaded_ids
+             and get_book_id(book) not in claimed]
+    if len(books) != 1:
+        return None
+    book = books[0]
+    if isinstance(book, Book):
+        size = book.file_size
+    else:
+        size = book.get(EPUB_METADATA, {}).get('fileSize')
+    if size != local_file.size:
+        return None
+    return get_book_id(book)
+
+
+def plan_sync(directory: Path, local_files: list, missing: dict, inventory,
+              upload_index, uploaded_ids: set, delete=False) -> SyncPlan:
+    """a book is replaced or deleted only if it was uploaded (not purchased)
+    and is linked to the file by the sync state. a file is matched with a
+    book by title only if the book was uploaded and has the same size.
+
+    :directory: Path of the folder
+    :local_files: list of LocalFile of the folder
+    :missing: dict of path: state row of the synced files that were removed
+    :inventory: Inventory of the cloud
+    :upload_index: UploadIndex of the account
+    :uploaded_ids: set of the ids of the uploaded books (edata)
+    :delete: if True, the books of the removed files are deleted
+    :returns: SyncPlan
+
+    """
+    plan = SyncPlan(directory)
+    claimed = set()
+    unmatched = []
+    # first the files not changed since their sync, then the exact matches,
+    # so that their books are not taken by a weaker match
+    for local_file in local_files:
+        book_id = local_file.book_id
+        if not local_file.hashed and book_id is not None \
+                and inventory.has_book(book_id):
+            plan.unchanged[local_file] = book_id
+            claimed.add(book_id)
+        else:
+            unmatched.append(local_file)
+    candidates, unmatched = unmatched, []
+    for local_file in candidates:
+        book_id = upload_index.get(local_file.sha256)
+        if book_id is not None and inventory.has_book(book_id) \
+                and book_id not in claimed:
+            plan.unchanged[local_file] = book_id
+            claimed.add(book_id)
+        else:
+            unmatched.append(local_file)
+    for local_file in unmatched:
+        previous = local_file.book_id
+        if previous in uploaded_ids and previous not in claimed:
+            # the file at this path was synced, and changed since
+            plan.add(REPLACE, local_file, previous)
+            claimed.add(previous)
+            continue
+        book_id = _metadata_match(
+                local_file, inventory, uploaded_ids, claimed)
+        if book_id is None:
+            plan.add(UPLOAD, local_file)
+            continue
+        claimed.add(book_id)
+        plan.unchanged[local_file] = book_id
+        plan.adopted.append(local_file)
+    for path, row in missing.items():
+        book_id = row[3]
+        if book_id in uploaded_ids and book_id not in claimed:
+            if delete:
+                plan.add(DELETE, book_id=book_id, path=path)
+            # kept for a later sync with delete
+            continue
+        plan.forgotten.append(path)
+    return plan
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+
+"""
+storage of the tokens of the accounts. a store saves all the token values
+of an account in one atomic write, and has a lock so that processes
+sharing an account do not renew the token at the same time.
+"""
+
+
+import fcntl
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+
+
+from pytolino.storage import get_data_dir
+
+
+class _FileLock(object):
+
+    """exclusive lock on a file, between processes and threads"""
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._file = None
+
+    def acquire(self):
+        lock_file = open(self._path, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        self._file = lock_file
+
+    def release(self):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class TokenStore(object):
+
+    """interface of the token stores. a token is a dict of json values,
+    identified by a key (server_name.username)
+
+    """
+
+    def load(self, key: str) -> dict:
+        """
+        :key: str identifying the account
+        :returns: dict of the token, or None if nothing was saved
+
+        """
+        raise NotImplementedError
+
+    def save(self, key: str, token: dict):
+        """replace the token of an account, in one atomic write
+
+        :key: str identifying the account
+        :token: dict of json values
+
+        """
+        raise NotImplementedError
+
+    def lock(self, key: str):
+        """
+        :key: str identifying the account
+        :returns: lock (context manager) of the account, shared with the
+        other processes using the same store when possible
+
+        """
+        raise NotImplementedError
+
+
+class MemoryTokenStore(TokenStore):
+
+    """tokens kept in memory, shared by the clients of one process"""
+
+    def __init__(self):
+        self._tokens = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def load(self, key: str) -> dict:
+        token = self._tokens.get(key)
+        return None if token is None else dict(token)
+
+    def save(self, key: str, token: dict):
+        self._tokens[key] = dict(token)
+
+    def lock(self, key: str):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+
+class JsonFileTokenStore(TokenStore):
+
+    """one json file per account. the files are replaced atomically and
+    locked with flock
+
+    """
+
+    def __init__(self, directory: Path or str = None):
+        """
+        :directory: folder of the token files. if None, a folder in the
+        data folder of pytolino
+
+        """
+        if directory is None:
+            directory = get_data_dir() / 'tokens'
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self._directory / f'{key}.json'
+
+    def load(self, key: str) -> dict:
+        try:
+            with open(self._path(key), 'r') as token_file:
+                return json.load(token_file)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError:
+            return None
+
+    def save(self, key: str, token: dict):
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(
+                dir=self._directory, prefix=f'.{key}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as tmp_file:
+                json.dump(token, tmp_file)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def lock(self, key: str):
+        return _FileLock(self._directory / f'{key}.lock')
+
+
+class SqliteTokenStore(TokenStore):
+
+    """all the accounts in one sqlite table. the lock is a flock on a file
+    next to the database
+
+    """
+
+    def __init__(self, db_path: Path or str = None):
+        """
+        :db_path: path of the sqlite file. if None, a file in the data
+        folder of pytolino
+
+        """
+        if db_path is None:
+            db_path = get_data_dir() / 'tokens.sqlite'
+        self._db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+                str(self._db_path),
+                check_same_thread=False,
+                timeout=30,
+                )
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                    'CREATE TABLE IF NOT EXISTS tokens ('
+                    'key TEXT PRIMARY KEY, token TEXT NOT NULL)')
+
+    def load(self, key: str) -> dict:
+        with self._lock:
+            row = self._connection.execute(
+                    'SELECT token FROM tokens WHERE key = ?',
+                    (key,),
+                    ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def save(self, key: str, token: dict):
+        with self._lock, self._connection:
+            self._connection.execute(
+                    'INSERT OR REPLACE INTO tokens (key, token) VALUES (?, ?)',
+                    (key, json.dumps(token)),
+                    )
+
+    def lock(self, key: str):
+        return _FileLock(self._db_path.with_name(
+            f'{self._db_path.name}.{key}.lock'))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
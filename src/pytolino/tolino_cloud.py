@@ -1,26 +1,42 @@
 #!/usr/bin/env python3
 
 
+import contextlib
 import logging
 import json
+import sys
 import time
 import tomllib
 from pathlib import Path
 from urllib.parse import urlparse, parse_qs
 import warnings
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections.abc import Mapping
 
 
 import requests
-import curl_cffi
 from varboxes import VarBox
-from seleniumbase import Driver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions
-from selenium.webdriver.support.wait import WebDriverWait
-from seleniumbase import SB
 
 
 from pytolino import server_settings_keys
+from pytolino.multipart import MultipartEncoder
+from pytolino.request_log import log_request
+from pytolino.transport import Transport, AUTH, BOSH
+from pytolino.retry import RetryPolicy, rate_limiter
+from pytolino.metrics import (
+        Metrics, TOKEN_REFRESH, TOKEN_ADOPTED, BROWSER_LOGIN)
+from pytolino.upload_index import UploadIndex, file_sha256
+from pytolino.token_store import TokenStore, JsonFileTokenStore
+from pytolino.inventory import Inventory, InventoryCache, get_book_id
+from pytolino.inventory_stream import InventoryParser
+from pytolino.inventory_table import InventoryTable
+from pytolino.book import Book
+from pytolino.sync import (
+        SyncState, SyncPlan, scan_directory, plan_sync, DELETE, REPLACE)
+from pytolino.covers import (
+        CoverCache, CoverError, IMAGE_TYPES, prepare_cover, is_epub,
+        detect_file_format)
 from pytolino.requests_keys import *
 
 
@@ -45,76 +61,239 @@ scope = common_settings['scope']
 redirect_uri = common_settings['redirect_uri']
 additional_request_parameters = common_settings[
     'additional_request_parameters']
-devices_url = common_settings['devices_url']
 devices_list_headers = common_settings['headers']['devices_list']
 token_headers = common_settings['headers']['token']
 client_type = common_settings['client_type']
+transport_settings = common_settings['transport']
+retry_settings = common_settings['retry']
+rate_limit_settings = common_settings['rate_limit']
+
+# bytes of the inventory response parsed at once
+INVENTORY_CHUNK_SIZE = 64 * 1024
 
 
 def main():
-    test()
-    # print(additional_request_parameters)
-    # for partner in PARTNERS:
-        # print(partner)
-        # for key, val in servers_settings[partner].items():
-            # print(key, val)
+    from pytolino.cli import main as cli_main
+    return cli_main()
 
 
 class Client(object):
 
     """create a client to communicate with a tolino partner (login, etc..)"""
 
-    _IMPERSONATE = 'chrome'
+    # an idempotent request can be sent again if its response was lost. the
+    # others (a second upload creates a second book, a token or auth code
+    # can be used only once) are sent again only if they were rejected
+    _IDEMPOTENT_ENDPOINTS = {
+            'auth': True,
+            'token': False,
+            'devices': True,
+            'inventory': True,
+            'sync_data': False,
+            'meta': True,
+            'upload': False,
+            'delete': True,
+            'cover': True,
+            }
+
+    def _rate_limit_delay(self, url: str) -> float:
+        """
+        :returns: time in s to wait before sending a request to url, with
+        the rate limiter of its host
+
+        """
+        rate = rate_limit_settings['rate']
+        if not rate:
+            return 0.0
+        return rate_limiter(url, rate, rate_limit_settings['burst']).reserve()
+
+    def _retry_delay(self, endpoint: str, attempt: int, response=None,
+                     error: Exception = None) -> float:
+        """
+        :endpoint: name of the endpoint
+        :attempt: number of times the request was sent
+        :response: response of the last attempt
+        :error: exception raised by the last attempt
+        :returns: time in s to wait before sending the request again, or
+        None if it should not be sent again
+
+        """
+        idempotent = self._IDEMPOTENT_ENDPOINTS[endpoint]
+        if not self._retry_policy.should_retry(
+                attempt, idempotent, response=response, error=error):
+            return None
+        delay = self._retry_policy.delay(attempt, response)
+        if delay is None:
+            return None
+        reason = error if error is not None else response.status_code
+        logging.warning(
+                f'{endpoint} request failed ({reason}), attempt {attempt},'
+                f' retry in {delay:.1f}s')
+        self._metrics.observe_retry(self._server_name, endpoint)
+        return delay
+
+    @staticmethod
+    def _rewind_body(kwargs: dict):
+        """a streamed body must be read again from the start"""
+        for key in ('data', 'content'):
+            body = kwargs.get(key)
+            if hasattr(body, 'seek'):
+                body.seek(0)
+
+    def _send(self, endpoint: str, send, url: str, **kwargs):
+        """send a request with the rate limiter of the host, and send it
+        again if the retry policy allows it
+
+        :endpoint: name of the endpoint
+        :send: method of a session (get, post...)
+        :url: str
+        :kwargs: arguments of send
+        :returns: the last response
+
+        """
+        streamed = kwargs.get('stream', False)
+        attempt = 0
+        while True:
+            attempt += 1
+            delay = self._rate_limit_delay(url)
+            if delay:
+                time.sleep(delay)
+            if attempt > 1:
+                self._rewind_body(kwargs)
+            try:
+                response = send(url, **kwargs)
+                self._observe_response(response, endpoint, streamed)
+            except Exception as e:
+                delay = self._retry_delay(endpoint, attempt, error=e)
+                if delay is None:
+                    raise
+            else:
+                delay = self._retry_delay(endpoint, attempt, response)
+                if delay is None:
+                    return response
+                if streamed:
+                    response.close()
+            time.sleep(delay)
+
+    def _observe_response(self, rsp: requests.Response, endpoint: str,
+                          streamed=False):
+        """the body of a streamed response is not read yet, its size is the
+        Content-Length
 
-    def _log_request(self, rsp: requests.Response, data=None):
-        if rsp.ok:
-            log = logging.debug
+        """
+        if not self._measure_responses:
+            return
+        request = rsp.request
+        body = getattr(request, 'body', None)
+        if body is None:
+            # curl_cffi does not keep the body
+            bytes_sent = getattr(rsp, 'upload_size', 0)
+        elif isinstance(body, (bytes, str, MultipartEncoder)):
+            bytes_sent = len(body)
         else:
-            log = logging.error
-        log('=====request=======')
-        log(rsp.url)
-        log(rsp.request.method)
-        log('data:')
-        log(data)
-        log('response:')
-        log(rsp)
-        log('response text:')
-        log(rsp.text)
-        log('request header:')
-        log(rsp.request.headers)
-        log('response header:')
-        log(rsp.headers)
-        log('===================')
+            bytes_sent = 0
+        if streamed:
+            bytes_received = int(rsp.headers.get('Content-Length') or 0)
+        else:
+            bytes_received = len(rsp.content or b'')
+        self._metrics.observe_request(
+                self._server_name,
+                endpoint,
+                request.method,
+                rsp.status_code,
+                rsp.elapsed.total_seconds(),
+                bytes_sent,
+                bytes_received,
+                )
+
+    def _log_request(self, rsp: requests.Response, data=None,
+                     streamed=False):
+        """log the request in one record (see request_log) and raise if the
+        response is not ok
+
+        :rsp: response of requests or curl_cffi
+        :data: what was sent, secrets are redacted
+        :streamed: the body is read later, and not logged
+
+        """
+        log_request(rsp, data, streamed=streamed)
 
         if not rsp.ok:
-            raise PytolinoException('host response not ok')
+            raise PytolinoException(
+                    f'host response not ok: {rsp.status_code}')
+
+    _TOKEN_FIELDS = (
+            'refresh_token',
+            'access_token',
+            'hardware_id',
+            'access_expiration_time',
+            'refresh_expiration_time',
+            )
+
+    @property
+    def _token_key(self) -> str:
+        return f'{self._server_name}.{self._username}'
+
+    def _token_dict(self) -> dict:
+        return {field: getattr(self, f'_{field}')
+                for field in self._TOKEN_FIELDS}
+
+    def _set_token(self, token: dict):
+        for field in self._TOKEN_FIELDS:
+            setattr(self, f'_{field}', token[field])
 
     def _store_current_token(self):
-        """store the token with attribute of self
+        """store the token with attribute of self, and the cookies and user
+        agent of the last GUI login
 
         """
-        username = self._username
-        vb = VarBox(app_name=f'{self._server_name}.{username}')
-        vb.refresh_token = self._refresh_token
-        vb.access_token = self._access_token
-        vb.hardware_id = self._hardware_id
-        vb.access_expiration_time = self._access_expiration_time
-        vb.refresh_expiration_time = self._refresh_expiration_time
+        token = self._token_dict()
+        token['cookies'] = self._login_cookies
+        token['user_agent'] = self._user_agent
+        self._token_store.save(self._token_key, token)
+
+    def _load_legacy_token(self) -> dict:
+        """token stored by the previous versions, in a VarBox"""
+        # VarBox prints its errors (no file...) on stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            vb = VarBox(app_name=self._token_key)
+        if not hasattr(vb, 'refresh_token'):
+            return None
+        return {field: getattr(vb, field) for field in self._TOKEN_FIELDS}
 
     def _retrieve_last_token(self):
         """retrieve token that was stored with this username
 
         """
-        username = self._username
-        vb = VarBox(app_name=f'{self._server_name}.{username}')
-        if not hasattr(vb, 'refresh_token'):
+        token = self._token_store.load(self._token_key)
+        if token is None:
+            token = self._load_legacy_token()
+        if token is None:
             raise PytolinoException(
                     'there was no token stored for that name')
-        self._refresh_token = vb.refresh_token
-        self._access_token = vb.access_token
-        self._hardware_id = vb.hardware_id
-        self._access_expiration_time = vb.access_expiration_time
-        self._refresh_expiration_time = vb.refresh_expiration_time
+        self._set_token(token)
+        self._login_cookies = token.get('cookies', [])
+        self._user_agent = token.get('user_agent')
+
+    def _adopt_stored_token(self) -> bool:
+        """use the token of the store if another client (maybe in another
+        process) renewed it since we read it.
+
+        :returns: True if the stored token was newer and still valid
+
+        """
+        token = self._token_store.load(self._token_key)
+        if token is None:
+            return False
+        expiration_time = token['access_expiration_time']
+        margin = self._token_refresh_margin or 0
+        newer = expiration_time > self._access_expiration_time
+        valid = expiration_time - margin > time.time()
+        if newer and valid:
+            self._set_token(token)
+            logging.info('use the access token renewed by another client')
+            return True
+        return False
 
     def raise_for_access_expiration(self) -> bool:
         """verify if access token is expired"""
@@ -161,7 +340,31 @@ class Client(object):
             self,
             username: str,
             server_name='orellfuessli',
+            token_refresh_margin: float = None,
+            token_store: TokenStore = None,
+            metrics: Metrics = None,
+            transport_settings: dict = None,
+            retry_policy: RetryPolicy = None,
+            server_settings: dict = None,
             ):
+        """
+        :username: str
+        :server_name: tolino partner
+        :token_refresh_margin: if not None, the access token is renewed
+        before a request when it expires in less than this time (s)
+        :token_store: where the tokens are saved. if None, a
+        JsonFileTokenStore in the data folder of pytolino
+        :metrics: Metrics recording the requests and token refreshes (for
+        example an InMemoryMetrics). if None, nothing is recorded
+        :transport_settings: dict of endpoint group (auth or bosh): dict of
+        settings (impersonate, http2, pool_size, keep_alive) replacing the
+        ones of common_settings.toml
+        :retry_policy: when the failed requests are sent again. if None, a
+        RetryPolicy with the settings of common_settings.toml
+        :server_settings: dict of settings replacing the ones of the partner
+        in servers_settings.toml (for example the urls of a FakeTolinoServer)
+
+        """
 
         if server_name not in servers_settings:
             raise PytolinoException(
@@ -178,8 +381,36 @@ class Client(object):
         self._access_expiration_time = 0
         self._refresh_expiration_time = 0
         self._user_agent = None
-
-        self._server_settings = servers_settings[server_name]
+        self._login_cookies = []
+        self._upload_index = None
+        self._inventory_cache = None
+        self._sync_state = None
+        self._cover_cache = None
+        self._inventory_books = None
+        self._inventory = None
+        self._inventory_time = 0
+        self._meta_cache = {}
+        self._cloud_ids = None
+        self._cache_lock = threading.Lock()
+        self._token_refresh_margin = token_refresh_margin
+        self._token_lock = threading.Lock()
+        self._refresher_thread = None
+        self._stop_refresher = threading.Event()
+        if token_store is None:
+            token_store = JsonFileTokenStore()
+        self._token_store = token_store
+        # the responses are not measured at all without metrics
+        self._measure_responses = metrics is not None
+        if metrics is None:
+            metrics = Metrics()
+        self._metrics = metrics
+        self._transport_settings = transport_settings or {}
+        if retry_policy is None:
+            retry_policy = RetryPolicy(**retry_settings)
+        self._retry_policy = retry_policy
+
+        self._server_settings = {
+                **servers_settings[server_name], **(server_settings or {})}
         self._shadow_host_id = self._server_settings[
                 server_settings_keys.SHADOW_HOST_ID]
         self._username_field_id = self._server_settings[
@@ -214,15 +445,183 @@ class Client(object):
                 server_settings_keys.SYNC_DATA_URL]
         self._inventory_url = self._server_settings[
                 server_settings_keys.INVENTORY_URL]
+        self._devices_url = self._server_settings[
+                server_settings_keys.DEVICES_URL]
 
-        self._session = requests.Session()
-        self._session_cffi = curl_cffi.Session()
+        self._create_sessions()
         self._server_name = server_name
 
         try:
             self._retrieve_last_token()
         except PytolinoException as e:
-            print(e)
+            # not printed: the output of the programs must stay clean
+            logging.info(e)
+
+    def _groups_settings(self) -> dict:
+        """settings of the endpoint groups of the transport"""
+        return {
+                group: {**settings, **self._transport_settings.get(group, {})}
+                for group, settings in transport_settings.items()}
+
+    def _create_sessions(self):
+        """one transport with a session for BOSH requests and a session for
+        auth requests, sharing their cookies
+
+        """
+        self._transport = Transport(self._groups_settings())
+        self._session = self._transport.session(BOSH)
+        self._session_cffi = self._transport.session(AUTH)
+
+    def _ensure_pool_size(self, pool_size: int):
+        """make sure the BOSH session keeps enough connections for
+        pool_size concurrent requests
+
+        """
+        self._transport.ensure_pool_size(BOSH, pool_size)
+
+    @property
+    def upload_index(self) -> UploadIndex:
+        """local index of the files uploaded with this account"""
+        with self._cache_lock:
+            if self._upload_index is None:
+                self._upload_index = UploadIndex.for_account(
+                        self._server_name, self._username)
+        return self._upload_index
+
+    @property
+    def sync_state(self) -> SyncState:
+        """local state of the folders synced with this account"""
+        with self._cache_lock:
+            if self._sync_state is None:
+                self._sync_state = SyncState.for_account(
+                        self._server_name, self._username)
+        return self._sync_state
+
+    @property
+    def cover_cache(self) -> CoverCache:
+        """prepared covers, shared by the accounts"""
+        with self._cache_lock:
+            if self._cover_cache is None:
+                self._cover_cache = CoverCache.default()
+        return self._cover_cache
+
+    @property
+    def inventory_cache(self) -> InventoryCache:
+        """local copy of the inventory, for incremental syncs"""
+        with self._cache_lock:
+            if self._inventory_cache is None:
+                self._inventory_cache = InventoryCache.for_account(
+                        self._server_name, self._username)
+        return self._inventory_cache
+
+    @property
+    def inventory(self) -> Inventory:
+        """indexed view of the last downloaded inventory. It is built once
+        per download, and the inventory is downloaded again after an upload,
+        a delete or a metadata change made with this client.
+
+        """
+        with self._cache_lock:
+            books = self._inventory_books
+            inventory = self._inventory
+        if inventory is None:
+            if books is None:
+                books = self.get_inventory()
+            inventory = Inventory(books)
+            with self._cache_lock:
+                if self._inventory_books is books:
+                    self._inventory = inventory
+        return inventory
+
+    def _set_inventory_books(self, books: list):
+        with self._cache_lock:
+            self._inventory_books = books
+            self._inventory = None
+            self._inventory_time = time.time()
+
+    def _invalidate_inventory(self):
+        self._set_inventory_books(None)
+
+    def _get_cloud_ids(self) -> set:
+        """ids of the books on the cloud. the inventory is downloaded only
+        once, then the set is updated by the uploads and deletes of this
+        client, and by refresh_cloud_ids.
+
+        """
+        with self._cache_lock:
+            cloud_ids = self._cloud_ids
+        if cloud_ids is not None:
+            return cloud_ids
+        # the inventory takes the cache lock, so it is fetched without it
+        cloud_ids = {get_book_id(book) for book in self.get_inventory()}
+        with self._cache_lock:
+            if self._cloud_ids is None:
+                self._cloud_ids = cloud_ids
+            return self._cloud_ids
+
+    def refresh_cloud_ids(self):
+        """download the changes of the inventory, and update the ids of the
+        books on the cloud that skip_uploaded checks. a long-running client
+        should call it from time to time, so that a book deleted by another
+        device is uploaded again.
+
+        """
+        cloud_ids = {
+                get_book_id(book)
+                for book in self.get_inventory(incremental=True)}
+        with self._cache_lock:
+            self._cloud_ids = cloud_ids
+
+    def _run_concurrently(self, function, items, max_workers: int,
+                          action: str):
+        """call function on each item in a thread pool. the items are
+        submitted lazily, to keep the number of waiting futures bounded.
+
+        :function: function of one item
+        :items: iterable of items
+        :max_workers: number of threads
+        :action: description used in the log when an item fails
+        :returns: generator of (item, result or exception), in the order
+        in which they finish
+
+        """
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {}
+            while True:
+                for item in items:
+                    future = executor.submit(function, item)
+                    pending[future] = item
+                    if len(pending) >= 2 * max_workers:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logging.error(f'{action} of {item} failed: {e}')
+                        result = e
+                    yield item, result
+
+    def run_concurrently(self, function, items, max_workers=4,
+                         action='request'):
+        """call function on each item in a thread pool, with enough
+        connections for max_workers concurrent requests of this client. a
+        failed item does not stop the others.
+
+        :function: function of one item, calling the methods of this client
+        :items: iterable of items
+        :max_workers: number of threads
+        :action: description used in the log when an item fails
+        :returns: generator of (item, result or exception), in the order
+        in which they finish
+
+        """
+        self._ensure_pool_size(max_workers)
+        return self._run_concurrently(function, items, max_workers, action)
 
     def import_token(self, refresh_token: str, hardware_id: str):
         """add manually a refresh token to GUI login
@@ -235,13 +634,13 @@ class Client(object):
         self._refresh_token = refresh_token
         self._hardware_id = hardware_id
         try:
-            self._renew_access_token()
+            self._renew_access_token(adopt_stored_token=False)
         except PytolinoException as e:
             logging.error(e)
             logging.error('could not get a new access token with'
                           ' this refresh token')
 
-    def _get_auth_headers(self):
+    def _auth_headers(self) -> dict:
         headers = {
             T_AUTH_TOKEN: self.access_token,
             HARDWARE_ID: self.hardware_id,
@@ -249,110 +648,187 @@ class Client(object):
             }
         return headers
 
-    def _renew_access_token(self):
-        """get a new access and refresh tokens.
+    def _get_auth_headers(self):
+        self._refresh_token_if_expiring()
+        return self._auth_headers()
+
+    def _access_token_expiring(self) -> bool:
+        """check if the access token expires within the refresh margin"""
+        margin = self._token_refresh_margin
+        if margin is None:
+            return False
+        return self._access_expiration_time - margin < time.time()
+
+    def _refresh_token_if_expiring(self):
+        """renew the access token if it expires soon. if several threads
+        see it at the same time, only one sends the request and the others
+        wait for its result.
 
         """
+        if not self._access_token_expiring():
+            return
+        with self._token_lock:
+            # another thread may have renewed it while we were waiting
+            if self._access_token_expiring():
+                logging.info('access token expires soon, renew it...')
+                self._renew_access_token()
 
-        headers = token_headers
+    TOKEN_REFRESHER_RETRY_DELAY = 30
+
+    def _token_refresher_loop(self):
+        while not self._stop_refresher.is_set():
+            margin = self._token_refresh_margin
+            delay = self._access_expiration_time - margin - time.time()
+            if delay > 0:
+                self._stop_refresher.wait(delay)
+                continue
+            try:
+                self._refresh_token_if_expiring()
+            except Exception:
+                # a network error must not stop the refresher, retry later
+                logging.exception('background token refresh failed')
+                self._stop_refresher.wait(self.TOKEN_REFRESHER_RETRY_DELAY)
+
+    def start_token_refresher(self):
+        """renew the access token in a background thread,
+        token_refresh_margin seconds before it expires
+
+        """
+        if self._token_refresh_margin is None:
+            raise PytolinoException(
+                    'the client needs a token_refresh_margin')
+        if self._refresher_thread is not None:
+            return
+        self._stop_refresher.clear()
+        self._refresher_thread = threading.Thread(
+                target=self._token_refresher_loop,
+                name='pytolino-token-refresher',
+                daemon=True,
+                )
+        self._refresher_thread.start()
+
+    def stop_token_refresher(self):
+        """stop the background thread started by start_token_refresher"""
+        if self._refresher_thread is None:
+            return
+        self._stop_refresher.set()
+        self._refresher_thread.join()
+        self._refresher_thread = None
+
+    def _refresh_token_data(self) -> dict:
         data = dict(
                 client_id=client_id,
                 grant_type=REFRESH_TOKEN,
                 refresh_token=self.refresh_token,
                 scope=scope,
                 )
-        url = self._token_url
-        host_response = self._session_cffi.post(
-                url,
-                data=data,
-                verify=True,
-                allow_redirects=True,
-                headers=headers,
-                impersonate=self._IMPERSONATE,
-                )
-        self._log_request(host_response, data)
+        return data
 
-        self._read_and_store_token_response(host_response)
-        self._store_current_token()
+    def _log_new_token(self):
         logging.info('got a new access token!')
         logging.info(
                 f'access will expire in {self._expires_in}s')
         logging.info(
                 f'refresh will expire in {self._refresh_expires_in}s')
 
-    def _get_login_cookies(self, password):
-
-        timeout = 5
-
-        with SB(uc=True) as sb:
-            driver = sb.driver
-            driver.implicitly_wait(timeout)
-            url = self._login_url
-            driver.get(url)
-
-            # deny cookies
-            shadow_host_id = self._shadow_host_id
-            shadow_host = driver.find_element(By.ID, shadow_host_id)
-            shadow_root = shadow_host.shadow_root
-            css = self._cookie_deny_css
-            wait = WebDriverWait(shadow_root, timeout)
-            deny_button = wait.until(
-                    expected_conditions.element_to_be_clickable(
-                        (By.CSS_SELECTOR, css)))
-            deny_button.click()
-
-            # fill credentials and submit
-            username_field_id = self._username_field_id
-            username_field = driver.find_element(
-                    By.ID, username_field_id,
-                    )
-            password_field_id = self._password_field_id
-            password_field = driver.find_element(
-                    By.ID, password_field_id,
-                    )
-            css = self._submit_css
-            submit_button = driver.find_element(
-                    By.CSS_SELECTOR, css,
-                    )
-            username_field.send_keys(self._username)
-            password_field.send_keys(password)
-            wait = WebDriverWait(driver, timeout=timeout)
-            wait.until(
-                    expected_conditions.element_to_be_clickable(
-                        submit_button))
-            submit_button.click()
-
-            # get cookies
-            cookies = driver.get_cookies()
-            user_agent = driver.get_user_agent()
-            self._user_agent = user_agent
+    def _renew_access_token(self, adopt_stored_token=True):
+        """get a new access and refresh tokens. the token store is locked
+        meanwhile, so that only one process sharing the account renews it.
+
+        :adopt_stored_token: if True and another client has already renewed
+        the token, its token is used instead of sending a request
+
+        """
+        with self._token_store.lock(self._token_key):
+            if adopt_stored_token and self._adopt_stored_token():
+                self._metrics.observe_event(self._server_name, TOKEN_ADOPTED)
+                return
+
+            with self._metrics.time_event(self._server_name, TOKEN_REFRESH):
+                headers = token_headers
+                data = self._refresh_token_data()
+                url = self._token_url
+                host_response = self._send(
+                        'token',
+                        self._session_cffi.post,
+                        url,
+                        data=data,
+                        verify=True,
+                        allow_redirects=True,
+                        headers=headers,
+                        )
+                self._log_request(host_response, data)
 
+                self._read_and_store_token_response(host_response)
+            self._store_current_token()
+        self._log_new_token()
+
+    def _get_login_cookies(self, password, browser_pool=None):
+        """login with a browser and copy its cookies in the sessions.
+        selenium is imported only here, since it is slow to import and
+        not needed when a refresh token is still valid.
+
+        :browser_pool: BrowserLoginPool to use. if None, a new browser
+        is started
+
+        """
+        with self._metrics.time_event(self._server_name, BROWSER_LOGIN):
+            if browser_pool is not None:
+                cookies, user_agent = browser_pool.login(
+                        self._username, password)
+            else:
+                from pytolino import browser_login
+
+                timeout = self._server_settings[
+                        server_settings_keys.BROWSER_TIMEOUT]
+                cookies, user_agent = browser_login.get_login_cookies(
+                        self._server_settings,
+                        self._username,
+                        password,
+                        timeout=timeout,
+                        )
+        self._user_agent = user_agent
+        self._login_cookies = [
+                {key: cookie[key] for key in self._COOKIE_KEYS
+                 if key in cookie}
+                for cookie in cookies]
+        self._set_session_cookies(self._login_cookies)
+
+    _COOKIE_KEYS = ('name', 'value', 'domain', 'path', 'expiry')
+
+    def _set_session_cookies(self, cookies: list):
         for cookie in cookies:
-            self._session_cffi.cookies.set(cookie['name'], cookie['value'])
-            self._session.cookies.set(cookie['name'], cookie['value'])
+            self._transport.cookies.set(cookie['name'], cookie['value'])
 
-    def _get_auth_code(self):
+    def _valid_saved_cookies(self) -> list:
+        """
+        :returns: the saved cookies of the last GUI login that are not
+        expired (the session cookies have no expiry)
 
-        url = self._auth_url
-        LOCATION = 'location'
-        CODE = 'code'
+        """
+        now = time.time()
+        cookies = [
+                cookie for cookie in self._login_cookies
+                if cookie.get('expiry') is None or cookie['expiry'] > now]
+        return cookies
+
+    def _clear_session_cookies(self):
+        self._transport.cookies.clear()
 
+    def _auth_code_params(self) -> dict:
         params = dict(
                 client_id=client_id,
-                response_type=CODE,
+                response_type='code',
                 scope=scope,
                 redirect_uri=redirect_uri,
                 )
         params.update(additional_request_parameters)
+        return params
+
+    def _read_auth_code_response(self, host_response) -> str:
+        LOCATION = 'location'
+        CODE = 'code'
 
-        host_response = self._session_cffi.get(
-                url,
-                params=params,
-                verify=True,
-                allow_redirects=False,
-                impersonate=self._IMPERSONATE,
-                )
-        self._log_request(host_response, params)
         headers = host_response.headers
         try:
             location_url = headers[LOCATION]
@@ -363,17 +839,58 @@ class Client(object):
         else:
             query_str = urlparse(location_url).query
             location_parameters = parse_qs(query_str)
-            auth_code = location_parameters[CODE][0]
+            try:
+                auth_code = location_parameters[CODE][0]
+            except KeyError:
+                raise PytolinoException(
+                        'failed to get auth code, '
+                        'location has no code (not logged in?)')
         return auth_code
 
+    def _get_auth_code_with_saved_cookies(self) -> str:
+        """try to get an auth code with the cookies of the last GUI login,
+        to avoid starting a browser.
+
+        :returns: auth code, or None if there are no valid cookies or if
+        they were rejected
+
+        """
+        cookies = self._valid_saved_cookies()
+        if not cookies:
+            return None
+        logging.info('try to login with the saved cookies...')
+        self._set_session_cookies(cookies)
+        try:
+            return self._get_auth_code()
+        except PytolinoException as e:
+            logging.info(f'saved cookies were rejected: {e}')
+            self._clear_session_cookies()
+            self._login_cookies = []
+            return None
+
+    def _get_auth_code(self):
+
+        url = self._auth_url
+        params = self._auth_code_params()
+
+        host_response = self._send(
+                'auth',
+                self._session_cffi.get,
+                url,
+                params=params,
+                verify=True,
+                allow_redirects=False,
+                )
+        self._log_request(host_response, params)
+        return self._read_auth_code_response(host_response)
+
     def _add_user_agent(self, headers: dict) -> dict:
         if self._user_agent:
             user_agent = self._user_agent
             headers[USERAGENT] = user_agent
         return headers
 
-    def _get_token(self, auth_code: str):
-
+    def _token_data(self, auth_code: str) -> dict:
         data = dict(
                 client_id=client_id,
                 grant_type=AUTHORIZATION_CODE,
@@ -382,16 +899,21 @@ class Client(object):
                 redirect_uri=redirect_uri,
                 )
         data.update(additional_request_parameters)
+        return data
+
+    def _get_token(self, auth_code: str):
 
+        data = self._token_data(auth_code)
         headers = token_headers
         url = self._token_url
-        host_response = self._session_cffi.post(
+        host_response = self._send(
+                'token',
+                self._session_cffi.post,
                 url,
                 data=data,
                 verify=True,
                 allow_redirects=False,
                 headers=headers,
-                impersonate=self._IMPERSONATE,
                 )
         self._log_request(host_response, data)
         self._read_and_store_token_response(host_response)
@@ -399,7 +921,7 @@ class Client(object):
     def _read_and_store_token_response(self, host_response):
         try:
             data_rsp = host_response.json()
-        except requests.JSONDecodeError:
+        except json.JSONDecodeError:
             raise PytolinoException('could not read token response'
                                     ' because of json error')
         else:
@@ -416,8 +938,11 @@ class Client(object):
                 self._access_expiration_time = now + self._expires_in
                 self._refresh_expiration_time = now + self._refresh_expires_in
 
-    def _get_hardware_id(self):
-        url = devices_url
+    def _hardware_id_request(self):
+        """
+        :returns: data and headers of the devices list request
+
+        """
         account = {
                 AUTH_TOKEN: self._access_token,
                 RESELLER_ID: self._partner_id,
@@ -429,15 +954,12 @@ class Client(object):
                     }
                 }
         data = json.dumps(data_dict)
-        headers = devices_list_headers
+        headers = dict(devices_list_headers)
         headers[T_AUTH_TOKEN] = self._access_token
         headers[RESELLER_ID] = self._partner_id
-        host_response = self._session.post(
-                url,
-                data=data,
-                headers=headers,
-                )
-        self._log_request(host_response, data)
+        return data, headers
+
+    def _read_hardware_id_response(self, host_response):
         j = host_response.json()
         devices = j[DEVICE_LIST_RESPONSE][DEVICES]
         devices.sort(key=lambda el: el[DEVICE_LAST_USAGE])
@@ -445,12 +967,24 @@ class Client(object):
         hardware_id = my_dev[DEVICE_ID]
         self._hardware_id = hardware_id
 
-    def login(self, password, allow_GUI_autologin=True):
-        """login to the partner and get access token.
+    def _get_hardware_id(self):
+        url = self._devices_url
+        data, headers = self._hardware_id_request()
+        host_response = self._send(
+                'devices',
+                self._session.post,
+                url,
+                data=data,
+                headers=headers,
+                )
+        self._log_request(host_response, data)
+        self._read_hardware_id_response(host_response)
+
+    def _token_is_renewable(self) -> bool:
+        """check if the stored tokens can still be used to get a new
+        access token without GUI login
 
         """
-        username = self._username
-        logged_in = False
         try:
             self.raise_for_access_expiration()
         except ExpirationError:
@@ -462,6 +996,21 @@ class Client(object):
                 get_a_new_token = True
         else:
             get_a_new_token = True
+        return get_a_new_token
+
+    def login(self, password, allow_GUI_autologin=True, browser_pool=None):
+        """login to the partner and get access token. if the tokens are
+        expired, the cookies of the last GUI login are tried before starting
+        a browser.
+
+        :password: str
+        :allow_GUI_autologin: if False, a browser is never started
+        :browser_pool: BrowserLoginPool in which the GUI login is done.
+        if None, a new browser is started and closed
+
+        """
+        logged_in = False
+        get_a_new_token = self._token_is_renewable()
 
         if get_a_new_token:
             try:
@@ -473,13 +1022,16 @@ class Client(object):
             else:
                 logged_in = True
 
-        if not logged_in and allow_GUI_autologin:
-            self._get_login_cookies(password)
-            auth_code = self._get_auth_code()
-            self._get_token(auth_code)
-            self._get_hardware_id()
-            self._store_current_token()
-            logged_in = True
+        if not logged_in:
+            auth_code = self._get_auth_code_with_saved_cookies()
+            if auth_code is None and allow_GUI_autologin:
+                self._get_login_cookies(password, browser_pool)
+                auth_code = self._get_auth_code()
+            if auth_code is not None:
+                self._get_token(auth_code)
+                self._get_hardware_id()
+                self._store_current_token()
+                logged_in = True
         if not logged_in:
             raise PytolinoException('could not login')
 
@@ -495,125 +1047,453 @@ class Client(object):
     def unregister(self, device_id=None):
         raise NotImplementedError('unregister is not necessary with tokens')
 
-    def get_inventory(self):
-        """download a list of the books on the cloud and their information
-        :returns: list of dict describing the book, with a epubMetaData dict
+    def _inventory_params(self, incremental: bool) -> dict:
+        params = {'strip': 'true'}
+        if incremental:
+            revision = self.inventory_cache.revision
+            if revision is not None:
+                params[REVISION] = revision
+        return params
 
+    def _read_inventory_json(self, host_response) -> dict:
         """
+        :returns: the PublicationInventory dict of the response
 
+        """
+        try:
+            j = host_response.json()
+        except json.JSONDecodeError:
+            raise PytolinoException(
+                    'inventory list request failed because of json error.'
+                    )
+        try:
+            publication_inventory = j[PUBLICATION_INVENTORY]
+            publication_inventory[EDATA]
+            publication_inventory[EBOOK]
+        except (KeyError, TypeError):
+            raise PytolinoException(
+                    'inventory list request failed because'
+                    ' of key error in json.'
+                    )
+        return publication_inventory
+
+    def _request_inventory(self, params: dict, stream=False):
+        """send the inventory request
+
+        :stream: if True, the body is not read, see iter_inventory
+        :returns: the response
+
+        """
         url = self._inventory_url
         headers = self._get_auth_headers()
-        params = {'strip': 'true'}
-        host_response = self._session.get(
+        host_response = self._send(
+                'inventory',
+                self._session.get,
                 url,
                 params=params,
                 headers=headers,
+                stream=stream,
                 )
-        self._log_request(host_response, params)
+        try:
+            self._log_request(host_response, params, streamed=stream)
+        except PytolinoException:
+            if stream:
+                host_response.close()
+            raise
+        return host_response
+
+    def _inventory_chunks(self, host_response):
+        if self._transport.uses_curl(BOSH):
+            # curl_cffi chooses the size of the chunks
+            return host_response.iter_content()
+        return host_response.iter_content(INVENTORY_CHUNK_SIZE)
+
+    def _iter_inventory_response(self, host_response, parser):
+        """parse the body of the inventory response while it is downloaded
 
+        :parser: InventoryParser, with the other fields at the end
+        :returns: generator of (list name, book)
+
+        """
         try:
-            j = host_response.json()
-        except requests.JSONDecodeError:
-            raise PytolinoException(
-                    'inventory list request failed because of json error.'
-                    )
+            for chunk in self._inventory_chunks(host_response):
+                yield from parser.feed(chunk)
+            yield from parser.close()
+        except ValueError as e:
+            raise PytolinoException(f'inventory list request failed: {e}')
+        finally:
+            host_response.close()
+
+    def _read_inventory_books(self, books: dict, fields: dict, params: dict,
+                              incremental: bool) -> list:
+        """
+        :books: dict of list name (edata, ebook): list of books
+        :fields: the other fields of the PublicationInventory (revision,
+        deleted)
+        :returns: the inventory, merged with the cache if incremental
+
+        """
+        uploaded_ebooks = books[EDATA]
+        purchased_ebooks = books[EBOOK]
+        if not incremental:
+            uploaded_ebooks.extend(purchased_ebooks)
+            return uploaded_ebooks
+        revision = fields.get(REVISION)
+        cache = self.inventory_cache
+        if REVISION in params and revision is not None:
+            deleted = fields.get(DELETED) or []
+            cache.apply_delta(
+                    uploaded_ebooks, purchased_ebooks, deleted, revision)
         else:
-            try:
-                publication_inventory = j['PublicationInventory']
-                uploaded_ebooks = publication_inventory['edata']
-                purchased_ebook = publication_inventory['ebook']
-            except KeyError:
-                raise PytolinoException(
-                        'inventory list request failed because',
-                        'of key error in json.',
-                        )
-            else:
-                inventory = uploaded_ebooks + purchased_ebook
-                return inventory
+            # first sync, or the server sent the full inventory
+            cache.replace(uploaded_ebooks, purchased_ebooks, revision)
+        return cache.books()
 
-    def add_to_collection(self, book_id, collection_name):
-        """add a book to a collection on the cloud
+    def get_inventory(self, incremental=False):
+        """download a list of the books on the cloud and their information.
+        the whole response is decoded at once, which is the fastest; see
+        iter_inventory to keep only one book at a time in memory.
 
-        :book_id: identify the book on the cloud
-        :collection_name: str name
+        :incremental: if True, only the changes since the last incremental
+        call are downloaded, and merged with a local copy of the inventory
+        :returns: list of dict describing the book, with a epubMetaData dict
+
+        """
+        params = self._inventory_params(incremental)
+        host_response = self._request_inventory(params)
+        publication_inventory = self._read_inventory_json(host_response)
+        inventory = self._read_inventory_books(
+                publication_inventory, publication_inventory, params,
+                incremental)
+        self._set_inventory_books(inventory)
+        return inventory
+
+    def iter_inventory(self):
+        """download the books on the cloud one at a time: each book is
+        returned as soon as it is received, so the whole inventory is never
+        in memory. the local inventory and its cache are not updated.
+
+        :returns: generator of dict describing a book, the uploaded ones
+        first
 
         """
+        host_response = self._request_inventory(
+                self._inventory_params(incremental=False), stream=True)
+        for _, book in self._iter_inventory_response(
+                host_response, InventoryParser()):
+            yield book
 
+    def get_books(self, keep_raw=True) -> list:
+        """download the inventory as compact records, built one book at a
+        time
+
+        :keep_raw: if False, only the common fields are kept
+        :returns: list of Book, the uploaded ones first
+
+        """
+        return [Book.from_dict(book, keep_raw)
+                for book in self.iter_inventory()]
+
+    def get_inventory_table(self) -> InventoryTable:
+        """download the inventory in columns, the smallest in memory
+
+        :returns: InventoryTable
+
+        """
+        return InventoryTable(self.iter_inventory())
+
+    def _collection_patch(self, op: str, book_id, collection_name) -> dict:
+        """
+        :op: 'add' or 'remove'
+        :returns: patch of the sync-data request for one book
+
+        """
+        patch = {
+                "op": op,
+                "value": {
+                    "modified": round(time.time() * 1000),
+                    "name": collection_name,
+                    "category": "collection",
+                },
+                "path": f"/publications/{book_id}/tags"
+                }
+        return patch
+
+    def _sync_data_request(self, patches: list):
+        """
+        :returns: data and headers of the sync-data request
+
+        """
         payload = {
                 "revision": None,
-                "patches": [{
-                    "op": "add",
-                    "value": {
-                        "modified": round(time.time() * 1000),
-                        "name": collection_name,
-                        "category": "collection",
-                    },
-                    "path": f"/publications/{book_id}/tags"
-                    }]
+                "patches": patches,
                 }
         data = json.dumps(payload)
-
-        url = self._sync_data_url
         headers = self._get_auth_headers()
         headers[CONTENT_TYPE] = 'application/json'
         headers[CLIENT_TYPE] = client_type
-        host_response = self._session.patch(
+        return data, headers
+
+    def _collection_request(self, book_id, collection_name):
+        """
+        :returns: data and headers of the sync-data request
+
+        """
+        patch = self._collection_patch('add', book_id, collection_name)
+        return self._sync_data_request([patch])
+
+    def add_to_collection(self, book_id, collection_name):
+        """add a book to a collection on the cloud
+
+        :book_id: identify the book on the cloud
+        :collection_name: str name
+
+        """
+
+        data, headers = self._collection_request(book_id, collection_name)
+        url = self._sync_data_url
+        host_response = self._send(
+                'sync_data',
+                self._session.patch,
                 url,
                 data=data,
                 headers=headers,
                 )
         self._log_request(host_response, data)
 
-    def upload_metadata(self, book_id, **new_metadata):
-        """upload some metadata to a specific book on the cloud
+    MAX_PATCHES = 500
+    MAX_PATCHES_BYTES = 256 * 1024
 
-        :book_id: ref on the cloud of the book
-        :**meta_data: dict of metadata than can be changed
+    def _chunk_patches(self, patches: list, max_patches: int,
+                       max_bytes: int):
+        """split the patches in lists that are not too long or too big
+
+        :returns: generator of lists of patches
 
         """
+        chunk = []
+        chunk_bytes = 0
+        for patch in patches:
+            patch_bytes = len(json.dumps(patch))
+            too_many = len(chunk) >= max_patches
+            too_big = chunk_bytes + patch_bytes > max_bytes
+            if chunk and (too_many or too_big):
+                yield chunk
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(patch)
+            chunk_bytes += patch_bytes
+        if chunk:
+            yield chunk
+
+    def _patch_sync_data(self, patches: list):
+        """send the patches in one request. if the server finds the payload
+        too large, it is sent again in two halves.
 
-        url = self._meta_url
-        params = {DELIVERABLE_ID: book_id}
-        headers = self._get_auth_headers()
-        host_response = self._session.get(
+        """
+        data, headers = self._sync_data_request(patches)
+        url = self._sync_data_url
+        host_response = self._send(
+                'sync_data',
+                self._session.patch,
                 url,
-                params=params,
+                data=data,
                 headers=headers,
                 )
-        self._log_request(host_response, params)
+        if host_response.status_code == 413 and len(patches) > 1:
+            logging.info(
+                    f'sync-data payload of {len(patches)} patches too large,'
+                    ' split it')
+            half = len(patches) // 2
+            self._patch_sync_data(patches[:half])
+            self._patch_sync_data(patches[half:])
+        else:
+            self._log_request(host_response, data)
+
+    def _update_collections(self, op: str, items, max_patches: int,
+                            max_bytes: int):
+        patches = [
+                self._collection_patch(op, book_id, collection_name)
+                for book_id, collection_name in items]
+        for chunk in self._chunk_patches(patches, max_patches, max_bytes):
+            self._patch_sync_data(chunk)
+
+    def add_to_collection_many(self, items, max_patches=MAX_PATCHES,
+                               max_bytes=MAX_PATCHES_BYTES):
+        """add many books to collections, with few requests
 
+        :items: iterable of (book_id, collection_name)
+        :max_patches: max number of books in one request
+        :max_bytes: max size of the patches in one request
+
+        """
+        self._update_collections('add', items, max_patches, max_bytes)
+
+    def remove_from_collection_many(self, items, max_patches=MAX_PATCHES,
+                                    max_bytes=MAX_PATCHES_BYTES):
+        """remove many books from collections, with few requests
+
+        :items: iterable of (book_id, collection_name)
+        :max_patches: max number of books in one request
+        :max_bytes: max size of the patches in one request
+
+        """
+        self._update_collections('remove', items, max_patches, max_bytes)
+
+    def remove_from_collection(self, book_id, collection_name):
+        """remove a book from a collection on the cloud
+
+        :book_id: identify the book on the cloud
+        :collection_name: str name
+
+        """
+        self.remove_from_collection_many([(book_id, collection_name)])
+
+    def _read_metadata_response(self, host_response) -> dict:
+        """
+        :host_response: response of the GET meta request
+        :returns: dict of the metadata of the book
+
+        """
         try:
             book = host_response.json()
-        except requests.JSONDecodeError:
+        except json.JSONDecodeError:
             raise PytolinoException('metadata upload failed. answer not json')
         else:
-            for key, value in new_metadata.items():
-                book['metadata'][key] = value
-            payload = {
-                    UPLOAD_METADATA: book['metadata']
-                    }
-            data = json.dumps(payload)
-            headers = self._get_auth_headers()
-            headers[CONTENT_TYPE] = 'application/json'
+            try:
+                return book['metadata']
+            except KeyError:
+                raise PytolinoException(
+                        'metadata upload failed. no metadata in answer')
+
+    def _merge_metadata(self, metadata: dict, new_metadata: dict):
+        """
+        :metadata: current metadata of the book
+        :new_metadata: dict of metadata to change
+        :returns: merged metadata, and data of the PUT meta request
 
-            host_response = self._session.put(
+        """
+        metadata = dict(metadata)
+        metadata.update(new_metadata)
+        payload = {
+                UPLOAD_METADATA: metadata
+                }
+        data = json.dumps(payload)
+        return metadata, data
+
+    def _metadata_put_headers(self) -> dict:
+        headers = self._get_auth_headers()
+        headers[CONTENT_TYPE] = 'application/json'
+        return headers
+
+    META_CACHE_MAX_AGE = 60
+
+    def _cached_metadata(self, book_id) -> dict:
+        """
+        :returns: metadata of the book received by GET meta or sent by PUT
+        meta in the last META_CACHE_MAX_AGE seconds, or None
+
+        """
+        with self._cache_lock:
+            cached = self._meta_cache.get(book_id)
+        if cached is None:
+            return None
+        cache_time, metadata = cached
+        if time.time() - cache_time > self.META_CACHE_MAX_AGE:
+            return None
+        return metadata
+
+    def _cache_metadata(self, book_id, metadata: dict):
+        with self._cache_lock:
+            self._meta_cache[book_id] = (time.time(), metadata)
+
+    def _update_metadata(self, book_id, new_metadata: dict):
+        """send new metadata of a book. the current metadata is downloaded
+        first, unless it is in the cache, so that the PUT keeps all the
+        other fields of the book.
+
+        :book_id: ref on the cloud of the book
+        :new_metadata: dict of metadata to change
+
+        """
+        url = self._meta_url
+        metadata = self._cached_metadata(book_id)
+        if metadata is None:
+            params = {DELIVERABLE_ID: book_id}
+            headers = self._get_auth_headers()
+            host_response = self._send(
+                    'meta',
+                    self._session.get,
                     url,
-                    data=data,
+                    params=params,
                     headers=headers,
                     )
+            self._log_request(host_response, params)
+            metadata = self._read_metadata_response(host_response)
+            self._cache_metadata(book_id, metadata)
+
+        metadata, data = self._merge_metadata(metadata, new_metadata)
+        headers = self._metadata_put_headers()
+        host_response = self._send(
+                'meta',
+                self._session.put,
+                url,
+                data=data,
+                headers=headers,
+                )
         self._log_request(host_response, data)
+        self._cache_metadata(book_id, metadata)
+        self._invalidate_inventory()
 
-    def upload(
-            self,
-            file_path: Path or str,
-            name=None,
-            ):
-        """upload an ebook to your cloud
+    def upload_metadata(self, book_id, **new_metadata):
+        """upload some metadata to a specific book on the cloud. the
+        current metadata is downloaded first, unless this client sent or
+        received it in the last META_CACHE_MAX_AGE seconds.
 
-        :file_path: str path to the ebook to upload
-        :name: str name of book if different from filename
-        :extension: epub or pdf, if not in filename
-        :returns: epub_id on the server
+        :book_id: ref on the cloud of the book
+        :**meta_data: dict of metadata than can be changed
+
+        """
+        self._update_metadata(book_id, new_metadata)
+
+    def _merge_metadata_updates(self, updates) -> dict:
+        """
+        :updates: dict {book_id: fields} or iterable of (book_id, fields)
+        :returns: dict {book_id: fields}, with one entry per book
+
+        """
+        if isinstance(updates, Mapping):
+            updates = updates.items()
+        merged_updates = {}
+        for book_id, fields in updates:
+            merged_updates.setdefault(book_id, {}).update(fields)
+        return merged_updates
+
+    def update_metadata_many(self, updates, max_workers=4) -> dict:
+        """upload metadata of many books concurrently. the updates of a
+        book are merged in one PUT request, preceded by a GET of its current
+        metadata unless it is in the cache (see upload_metadata).
+
+        :updates: dict {book_id: dict of metadata}, or iterable of
+        (book_id, dict of metadata). several updates of the same book are
+        merged.
+        :max_workers: number of books updated at the same time
+        :returns: dict {book_id: None, or exception if the update failed}
+
+        """
+        merged_updates = self._merge_metadata_updates(updates)
+        self._ensure_pool_size(max_workers)
+
+        def update_one(book_id):
+            self._update_metadata(book_id, merged_updates[book_id])
+
+        results = dict(self._run_concurrently(
+                update_one, merged_updates, max_workers, 'metadata update'))
+        return results
+
+    def _ebook_file_info(self, file_path: Path or str, name=None):
+        """
+        :returns: file path, name and mime type of the ebook to upload
 
         """
         if isinstance(file_path, str):
@@ -629,21 +1509,12 @@ class Client(object):
         epubmime = 'application/epub+zip'
         pdfmime = 'application/pdf'
         mime = epubmime if extension == '.epub' else pdfmime
+        return file_path, name, mime
 
-        url = self._upload_url
-        headers = self._get_auth_headers()
-        with open(file_path, 'rb') as ebook_file:
-            files = [('file', (name, ebook_file, mime))]
-            host_response = self._session.post(
-                    url,
-                    files=files,
-                    headers=headers,
-                    )
-        self._log_request(host_response, files)
-
+    def _read_upload_response(self, host_response) -> str:
         try:
             j = host_response.json()
-        except requests.JSONDecodeError:
+        except json.JSONDecodeError:
             raise PytolinoException('file upload failed. answer not json')
         else:
             try:
@@ -653,6 +1524,100 @@ class Client(object):
                         'file upload failed.'
                         'no metadata or deliverableId in response')
 
+    def _record_upload(self, book_id: str, sha256: str = None, name=None):
+        """update the local state after an upload
+
+        :sha256: hash of the file, added to the upload index if not None
+
+        """
+        self._invalidate_inventory()
+        if sha256 is not None:
+            self.upload_index.add(sha256, book_id, name)
+        with self._cache_lock:
+            if self._cloud_ids is not None:
+                self._cloud_ids.add(book_id)
+
+    def _record_delete(self, book_id: str):
+        """update the local state after a delete"""
+        self._invalidate_inventory()
+        with self._cache_lock:
+            self._meta_cache.pop(book_id, None)
+            if self._cloud_ids is not None:
+                self._cloud_ids.discard(book_id)
+        if self._upload_index is not None:
+            self._upload_index.remove_book(book_id)
+
+    def upload(
+            self,
+            file_path: Path or str,
+            name=None,
+            progress=None,
+            skip_uploaded=False,
+            ):
+        """upload an ebook to your cloud. the file is streamed from the disk
+        by chunks, it is never loaded whole in memory.
+
+        :file_path: str path to the ebook to upload
+        :name: str name of book if different from filename
+        :extension: epub or pdf, if not in filename
+        :progress: function called with (bytes sent, total bytes)
+        :skip_uploaded: if True, the file is not sent when the upload index
+        shows that the same content is still on the cloud
+        :returns: epub_id on the server
+
+        """
+        file_path, name, mime = self._ebook_file_info(file_path, name)
+
+        if skip_uploaded:
+            sha256 = file_sha256(file_path)
+            book_id = self.upload_index.get(sha256)
+            if book_id is not None and book_id in self._get_cloud_ids():
+                logging.info(f'{file_path} is already on the cloud')
+                return book_id
+
+        url = self._upload_url
+        headers = self._get_auth_headers()
+        files = [('file', (name, file_path, mime))]
+        with MultipartEncoder(files=files, progress=progress) as body:
+            headers[CONTENT_TYPE] = body.content_type
+            host_response = self._send(
+                    'upload',
+                    self._session.post,
+                    url,
+                    **self._transport.body_arguments(BOSH, body),
+                    headers=headers,
+                    )
+        self._log_request(host_response, body)
+        book_id = self._read_upload_response(host_response)
+
+        self._record_upload(book_id, sha256 if skip_uploaded else None, name)
+        return book_id
+
+    def upload_many(self, file_paths, max_workers=4, name_fn=None,
+                    skip_uploaded=False):
+        """upload several ebooks concurrently. a failed upload does not
+        stop the others.
+
+        :file_paths: iterable of Path to the ebooks to upload
+        :max_workers: number of uploads running at the same time
+        :name_fn: function that gives the name of a book from its path.
+        if None, the filename is used
+        :skip_uploaded: do not send the files that are already on the cloud
+        (see upload)
+        :returns: generator of (file_path, epub_id or exception), in the
+        order in which the uploads finish
+
+        """
+        self._ensure_pool_size(max_workers)
+
+        def upload_one(file_path):
+            name = None if name_fn is None else name_fn(file_path)
+            return self.upload(
+                    file_path, name=name, skip_uploaded=skip_uploaded)
+
+        return self._run_concurrently(
+                upload_one, file_paths, max_workers, 'upload')
+
     def delete_ebook(self, ebook_id):
         """delete an ebook present on your cloud
 
@@ -663,53 +1628,155 @@ class Client(object):
         url = self._delete_url
         params = {DELIVERABLE_ID: ebook_id}
         headers = self._get_auth_headers()
-        host_response = self._session.get(
+        host_response = self._send(
+                'delete',
+                self._session.get,
                 url,
                 params=params,
                 headers=headers,
                 )
         self._log_request(host_response, params)
+        self._record_delete(ebook_id)
 
-    def add_cover(self, book_id, filepath: Path or str):
-        """upload a a cover to a book on the cloud
+    def _plan_sync(self, directory: Path, local_files: list, missing: dict,
+                   delete: bool) -> SyncPlan:
+        """plan a sync with the last incremental inventory, and keep the new
+        hashes and matches of the files that are already on the cloud
 
-        :book_id: id of the book on the serveer
-        :filepath: path to the cover file
-        :file_ext: png, jpg or jpeg. only necessary if the
-        filepath has no extension
+        """
+        plan = plan_sync(
+                directory, local_files, missing, self.inventory,
+                self.upload_index, self.inventory_cache.book_ids(EDATA),
+                delete)
+        self.sync_state.update([
+                local_file.row(book_id)
+                for local_file, book_id in plan.unchanged.items()
+                if local_file.hashed or local_file.book_id != book_id])
+        for local_file in plan.adopted:
+            self.upload_index.add(
+                    local_file.sha256,
+                    plan.unchanged[local_file],
+                    local_file.path.name,
+                    )
+        return plan
+
+    def _record_sync_upload(self, action, book_id: str):
+        local_file = action.local_file
+        self.upload_index.add(local_file.sha256, book_id, local_file.path.name)
+        self.sync_state.update([local_file.row(book_id)])
+
+    def _finish_sync(self, plan: SyncPlan):
+        """forget the removed files whose book is not on the cloud anymore"""
+        forgotten = list(plan.forgotten)
+        for action in plan.actions:
+            if action.kind == DELETE and not action.failed:
+                forgotten.append(action.path)
+        self.sync_state.remove(forgotten)
+        failed = plan.failed
+        if failed:
+            logging.error(f'{len(failed)} operations of the sync failed')
+
+    def _run_sync_action(self, action):
+        if action.kind == DELETE:
+            self.delete_ebook(action.book_id)
+            return None
+        book_id = self.upload(action.local_file.path)
+        self._record_sync_upload(action, book_id)
+        if action.kind == REPLACE:
+            # deleted after the upload, so that the book is never missing
+            self.delete_ebook(action.book_id)
+        return book_id
+
+    def sync_directory(self, directory: Path or str, delete=False,
+                       dry_run=False, max_workers=4) -> SyncPlan:
+        """mirror a folder of ebooks (and its subfolders) on the cloud: the
+        new files are uploaded, and the changed files replace their book.
+        the files are matched with the books by content hash, by path (the
+        file synced before at the same path) or by title and size (uploaded
+        books only, a purchased book is never replaced or deleted). the
+        hashes are cached, an unchanged folder is not read again and costs
+        one incremental inventory request.
+
+        :directory: folder of the epub and pdf files
+        :delete: if True, the books whose file was removed from the folder
+        since the last sync are deleted from the cloud
+        :dry_run: if True, the plan is returned without being run
+        :max_workers: number of files hashed, and of operations sent, at the
+        same time
+        :returns: SyncPlan (print it to see the operations). after a run,
+        the result of each action is the id of the uploaded book, or the
+        exception if it failed
 
         """
-        FILENAME = '1092560016'  # example from tolino api doc. different?
+        directory = Path(directory).resolve()
+        local_files, missing = scan_directory(
+                directory, self.sync_state, max_workers)
+        self.get_inventory(incremental=True)
+        plan = self._plan_sync(directory, local_files, missing, delete)
+        if dry_run:
+            return plan
+        self._ensure_pool_size(max_workers)
+        for action, result in self._run_concurrently(
+                self._run_sync_action, plan.actions, max_workers, 'sync'):
+            action.result = result
+        self._finish_sync(plan)
+        return plan
+
+    def _cover_file_info(self, filepath: Path or str, prepare=False):
+        """
+        :prepare: if True, the image is downscaled and recompressed (see
+        covers.prepare_cover). the cover of an epub is always extracted
+        :returns: file path, file name and mime type of the cover to upload
 
+        """
         if isinstance(filepath, str):
             filepath = Path(filepath)
             warnings.warn(
                     'file_path arg should better be a Path object',
                     DeprecationWarning,)
 
-        ext = filepath.suffix
+        if prepare or is_epub(filepath):
+            try:
+                filepath = prepare_cover(filepath, self.cover_cache)
+            except CoverError as e:
+                raise PytolinoException(f'cover of {filepath}: {e}')
+        image_format = detect_file_format(filepath)
+        if image_format is None:
+            raise PytolinoException(f'{filepath} is not a known image')
+        extension, mime = IMAGE_TYPES[image_format]
+        return filepath, filepath.stem + extension, mime
+
+    def add_cover(self, book_id, filepath: Path or str, progress=None,
+                  prepare=False):
+        """upload a a cover to a book on the cloud
 
-        mime = {
-                '.png': 'image/png',
-                '.jpeg': 'image/jpeg',
-                '.jpg': 'image/jpeg'
-                }.get(ext.lower(), 'application/jpeg')
+        :book_id: id of the book on the serveer
+        :filepath: path to the cover file (jpeg or png), or to an epub
+        whose cover is uploaded
+        :progress: function called with (bytes sent, total bytes)
+        :prepare: if True, a big image is downscaled and recompressed first.
+        the prepared covers are cached by content hash
+
+        """
+        filepath, filename, mime = self._cover_file_info(filepath, prepare)
 
         url = self._cover_url
         data = {DELIVERABLE_ID: book_id}
         headers = self._get_auth_headers()
-        with open(filepath, 'rb') as cover_file:
-            files = [('file', (FILENAME, cover_file, mime))]
-            host_response = self._session.post(
+        files = [('file', (filename, filepath, mime))]
+        with MultipartEncoder(
+                fields=data, files=files, progress=progress) as body:
+            headers[CONTENT_TYPE] = body.content_type
+            host_response = self._send(
+                    'cover',
+                    self._session.post,
                     url,
-                    files=files,
-                    data=data,
+                    **self._transport.body_arguments(BOSH, body),
                     headers=headers,
                     )
         self._log_request(host_response, data)
 
 
 
-
 if __name__ == '__main__':
-    main()
+    raise SystemExit(main())
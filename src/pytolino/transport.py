@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+
+"""
+http sessions of a client. the endpoints are split in groups (the auth
+server of the partner, and the BOSH api of the tolino cloud), each with its
+own settings: browser impersonation, HTTP/2, connection pool size and tcp
+keep-alive. all the sessions share one cookie jar, so the cookies of a login
+are set only once.
+"""
+
+
+import socket
+
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+import curl_cffi
+
+
+AUTH = 'auth'
+BOSH = 'bosh'
+
+IMPERSONATE = 'impersonate'
+HTTP2 = 'http2'
+POOL_SIZE = 'pool_size'
+KEEP_ALIVE = 'keep_alive'
+
+DEFAULT_GROUP_SETTINGS = {
+        IMPERSONATE: '',
+        HTTP2: False,
+        POOL_SIZE: 10,
+        KEEP_ALIVE: 60,
+        }
+
+
+def _keep_alive_socket_options(keep_alive: int) -> list:
+    """options of the sockets of requests, to keep idle connections open
+    (through NAT and proxies) for keep_alive s
+
+    """
+    options = list(HTTPConnection.default_socket_options)
+    if not keep_alive:
+        return options
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, keep_alive))
+    return options
+
+
+class _TunedAdapter(HTTPAdapter):
+
+    """requests adapter with a pool size and tcp keep-alive"""
+
+    def __init__(self, pool_size: int, keep_alive: int):
+        self._socket_options = _keep_alive_socket_options(keep_alive)
+        super().__init__(pool_connections=2, pool_maxsize=pool_size)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self._socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _curl_options(settings: dict) -> dict:
+    options = {curl_cffi.CurlOpt.MAXCONNECTS: settings[POOL_SIZE]}
+    if settings[KEEP_ALIVE]:
+        options[curl_cffi.CurlOpt.TCP_KEEPALIVE] = 1
+        options[curl_cffi.CurlOpt.TCP_KEEPIDLE] = settings[KEEP_ALIVE]
+    return options
+
+
+def uses_curl(settings: dict) -> bool:
+    """requests can neither impersonate a browser nor use HTTP/2"""
+    return bool(settings[IMPERSONATE] or settings[HTTP2])
+
+
+class Transport(object):
+
+    """one session per endpoint group, sharing one cookie jar. a group that
+    impersonates a browser or uses HTTP/2 is sent with curl_cffi, the others
+    with requests.
+
+    """
+
+    def __init__(self, groups_settings: dict, asynchronous=False):
+        """
+        :groups_settings: dict of group name: dict of settings (impersonate,
+        http2, pool_size, keep_alive). missing settings have default values
+        :asynchronous: if True, all the groups use curl_cffi async sessions,
+        with pool_size concurrent requests
+
+        """
+        self._cookies = requests.cookies.RequestsCookieJar()
+        self._asynchronous = asynchronous
+        self._settings = {}
+        self._sessions = {}
+        for group, settings in groups_settings.items():
+            settings = {**DEFAULT_GROUP_SETTINGS, **settings}
+            self._settings[group] = settings
+            self._sessions[group] = self._new_session(settings)
+
+    def _new_session(self, settings: dict):
+        if self._asynchronous or uses_curl(settings):
+            kwargs = dict(
+                    cookies=self._cookies,
+                    curl_options=_curl_options(settings),
+                    )
+            if settings[IMPERSONATE]:
+                kwargs['impersonate'] = settings[IMPERSONATE]
+            if settings[HTTP2]:
+                kwargs['http_version'] = curl_cffi.CurlHttpVersion.V2TLS
+            if self._asynchronous:
+                return curl_cffi.AsyncSession(
+                        max_clients=settings[POOL_SIZE], **kwargs)
+            return curl_cffi.Session(**kwargs)
+
+        session = requests.Session()
+        session.cookies = self._cookies
+        self._mount_adapter(session, settings)
+        return session
+
+    @staticmethod
+    def _mount_adapter(session: requests.Session, settings: dict):
+        adapter = _TunedAdapter(settings[POOL_SIZE], settings[KEEP_ALIVE])
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+    def session(self, group: str):
+        """
+        :group: name of the endpoint group
+        :returns: requests or curl_cffi session of the group
+
+        """
+        return self._sessions[group]
+
+    def settings(self, group: str) -> dict:
+        return dict(self._settings[group])
+
+    def uses_curl(self, group: str) -> bool:
+        return self._asynchronous or uses_curl(self._settings[group])
+
+    def body_arguments(self, group: str, body) -> dict:
+        """keyword arguments to send a file-like body, that requests takes as
+        data and curl_cffi as content
+
+        """
+        if self.uses_curl(group):
+            return {'content': body}
+        return {'data': body}
+
+    def ensure_pool_size(self, group: str, pool_size: int):
+        """make sure the session of the group keeps enough connections for
+        pool_size concurrent requests. the curl_cffi sessions have a
+        connection cache per thread, and are not changed.
+
+        """
+        settings = self._settings[group]
+        if pool_size <= settings[POOL_SIZE] or self.uses_curl(group):
+            return
+        settings[POOL_SIZE] = pool_size
+        self._mount_adapter(self._sessions[group], settings)
+
+    @property
+    def cookies(self) -> requests.cookies.RequestsCookieJar:
+        """cookie jar of all the sessions"""
+        return self._cookies
+
+    def sessions(self) -> list:
+        return list(self._sessions.values())
+
+    def close(self):
+        """close the sessions (not for the async sessions, that must be
+        awaited)
+
+        """
+        for session in self._sessions.values():
+            session.close()
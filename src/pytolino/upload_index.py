@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+
+"""
+local index of the ebooks uploaded on the cloud, by content hash. it is
+used to avoid uploading the same file twice.
+"""
+
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+from pytolino.storage import get_account_path
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: Path or str, chunk_size=CHUNK_SIZE) -> str:
+    """compute the sha256 of a file, reading it by chunks
+
+    :file_path: Path of the file
+    :chunk_size: size in bytes of the chunks
+    :returns: hex digest
+
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class UploadIndex(object):
+
+    """sqlite table content hash -> deliverableId of the uploaded ebooks.
+    it can be shared between the threads of a client.
+
+    """
+
+    def __init__(self, db_path: Path or str):
+        """
+        :db_path: path of the sqlite file (or ':memory:')
+
+        """
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+                str(db_path),
+                check_same_thread=False,
+                timeout=30,
+                )
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                    'CREATE TABLE IF NOT EXISTS uploads ('
+                    'sha256 TEXT PRIMARY KEY, '
+                    'deliverable_id TEXT NOT NULL, '
+                    'filename TEXT, '
+                    'uploaded REAL)')
+            self._connection.execute(
+                    'CREATE INDEX IF NOT EXISTS uploads_deliverable_id '
+                    'ON uploads (deliverable_id)')
+
+    @classmethod
+    def for_account(cls, server_name: str, username: str):
+        """open the index of an account, in the data folder of pytolino
+
+        :server_name: tolino partner
+        :username: str
+        :returns: UploadIndex
+
+        """
+        db_path = get_account_path(server_name, username, '.uploads.sqlite')
+        return cls(db_path)
+
+    def get(self, sha256: str) -> str:
+        """
+        :sha256: content hash of a file
+        :returns: deliverableId of the uploaded file or None
+
+        """
+        with self._lock:
+            row = self._connection.execute(
+                    'SELECT deliverable_id FROM uploads WHERE sha256 = ?',
+                    (sha256,),
+                    ).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def add(self, sha256: str, deliverable_id: str, filename: str = None):
+        """record an uploaded file
+
+        :sha256: content hash of the file
+        :deliverable_id: id of the book on the cloud
+        :filename: name of the uploaded file
+
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                    'INSERT OR REPLACE INTO uploads '
+                    '(sha256, deliverable_id, filename, uploaded) '
+                    'VALUES (?, ?, ?, ?)',
+                    (sha256, deliverable_id, filename, time.time()),
+                    )
+
+    def remove_book(self, deliverable_id: str):
+        """forget a book (for example because it was deleted)
+
+        :deliverable_id: id of the book on the cloud
+
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                    'DELETE FROM uploads WHERE deliverable_id = ?',
+                    (deliverable_id,),
+                    )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
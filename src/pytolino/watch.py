@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+
+
+"""
+watch a spool folder and upload the ebooks that are dropped in it. the
+folder is watched with linux inotify (through ctypes), or scanned every
+poll_interval when inotify is not available. a file is uploaded once it is
+complete: closed by its writer (inotify) and unchanged for settle seconds.
+the files that are ready within debounce seconds of each other are uploaded
+in one concurrent batch, with the token of one client. the uploaded files
+are moved to a folder, or renamed with a label.
+
+    python -m pytolino.watch SPOOL --username USERNAME --done-dir DONE
+"""
+
+
+import argparse
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+
+
+from pytolino.sync import EBOOK_SUFFIXES
+
+
+UPLOADED_LABEL = '.uploaded'
+FAILED_LABEL = '.failed'
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+_EVENT = struct.Struct('iIII')
+
+
+class InotifySource(object):
+
+    """changes of the files of a folder, from inotify"""
+
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, directory: Path):
+        """
+        :raises: OSError if inotify is not available
+
+        """
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError('no libc')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('no inotify')
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        watch = libc.inotify_add_watch(
+                self._fd, os.fsencode(directory), self.MASK)
+        if watch < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, os.strerror(errno), str(directory))
+
+    def wait(self, timeout: float):
+        """
+        :timeout: max time in s to wait for a change
+        :returns: dict of file name: True if it was closed or moved in
+        (complete), False if it is being written. None if the events were
+        lost, and the folder must be scanned
+
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        changes = {}
+        if not readable:
+            return changes
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return changes
+            position = 0
+            while position < len(data):
+                _, mask, _, length = _EVENT.unpack_from(data, position)
+                position += _EVENT.size
+                name = data[position:position + length].rstrip(b'\0')
+                position += length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if mask & IN_ISDIR or not name:
+                    continue
+                name = os.fsdecode(name)
+                closed = bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))
+                changes[name] = closed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingSource(object):
+
+    """changes of the files of a folder, by scanning it"""
+
+    def __init__(self, directory: Path, poll_interval: float):
+        self._poll_interval = poll_interval
+
+    def wait(self, timeout: float):
+        """
+        :returns: None, the folder must be scanned
+
+        """
+        time.sleep(min(timeout, self._poll_interval))
+        return None
+
+    def close(self):
+        pass
+
+
+class _Pending(object):
+
+    """a file that is not uploaded yet"""
+
+    __slots__ = ('size', 'mtime_ns', 'changed', 'closed')
+
+    def __init__(self, stat, now: float, closed: bool):
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.changed = now
+        self.closed = closed
+
+
+class FolderWatcher(object):
+
+    """upload the ebooks dropped in a folder, until stopped"""
+
+    def __init__(
+            self,
+            client,
+            directory: Path or str,
+            done_dir: Path or str = None,
+            failed_dir: Path or str = None,
+            settle: float = 2.0,
+            debounce: float = 1.0,
+            max_batch: int = 100,
+            max_workers: int = 4,
+            poll_interval: float = 1.0,
+            use_inotify=True,
+            suffixes=EBOOK_SUFFIXES,
+            ):
+        """
+        :client: Client, logged in
+        :directory: folder that is watched (not its subfolders)
+        :done_dir: folder where the uploaded files are moved. if None, they
+        are renamed with the .uploaded label
+        :failed_dir: folder where the files that failed are moved. if None,
+        they are renamed with the .failed label
+        :settle: time in s a complete file must stay unchanged
+        :debounce: a batch is uploaded when no file was ready for debounce s
+        :max_batch: a batch is uploaded when it has max_batch files
+        :max_workers: number of uploads running at the same time
+        :poll_interval: time in s between two scans, without inotify
+        :use_inotify: if False, the folder is always scanned
+        :suffixes: extensions of the uploaded files (case is ignored)
+
+        """
+        self.client = client
+        self.directory = Path(directory)
+        self.done_dir = None if done_dir is None else Path(done_dir)
+        self.failed_dir = None if failed_dir is None else Path(failed_dir)
+        self.settle = settle
+        self.debounce = debounce
+        self.max_batch = max_batch
+        self.max_workers = max_workers
+        self.suffixes = tuple(suffix.lower() for suffix in suffixes)
+        self._pending = {}
+        self._batch = []
+        self._last_ready = None
+        self._stop_event = threading.Event()
+
+        self._source = None
+        if use_inotify:
+            try:
+                self._source = InotifySource(self.directory)
+            except OSError as e:
+                logging.warning(f'inotify not available ({e}), polling')
+        if self._source is None:
+            self._source = PollingSource(self.directory, poll_interval)
+        # the files that were dropped before the start
+        self._scan(time.monotonic())
+
+    @property
+    def uses_inotify(self) -> bool:
+        return isinstance(self._source, InotifySource)
+
+    def _is_ebook(self, name: str) -> bool:
+        return (not name.startswith('.')
+                and name.lower().endswith(self.suffixes))
+
+    def _touch(self, name: str, now: float, closed: bool):
+        path = self.directory / name
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self._pending.pop(path, None)
+            return
+        pending = self._pending.get(path)
+        if pending is None:
+            self._pending[path] = _Pending(stat, now, closed)
+            return
+        if (stat.st_size, stat.st_mtime_ns) != (
+                pending.size, pending.mtime_ns):
+            self._pending[path] = _Pending(stat, now, closed)
+        elif closed:
+            pending.closed = True
+
+    def _scan(self, now: float):
+        with os.scandir(self.directory) as entries:
+            names = [entry.name for entry in entries
+                     if entry.is_file() and self._is_ebook(entry.name)]
+        for path in list(self._pending):
+            if path.name not in names:
+                del self._pending[path]
+        for name in names:
+            # without inotify, a file is complete when it stops changing
+            self._touch(name, now, closed=True)
+
+    def _collect_ready(self, now: float):
+        for path, pending in list(self._pending.items()):
+            if not pending.closed or now - pending.changed < self.settle:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (
+                    pending.size, pending.mtime_ns):
+                self._pending[path] = _Pending(stat, now, pending.closed)
+                continue
+            del self._pending[path]
+            self._batch.append(path)
+            self._last_ready = now
+
+    def _batch_due(self, now: float) -> bool:
+        if not self._batch:
+            return False
+        return (len(self._batch) >= self.max_batch
+                or now - self._last_ready >= self.debounce)
+
+    @staticmethod
+    def _free_path(path: Path) -> Path:
+        candidate = path
+        number = 1
+        while candidate.exists():
+            candidate = path.with_name(f'{path.stem}.{number}{path.suffix}')
+            number += 1
+        return candidate
+
+    def _set_aside(self, path: Path, folder: Path, label: str):
+        if folder is None:
+            target = path.with_name(path.name + label)
+        else:
+            folder.mkdir(parents=True, exist_ok=True)
+            target = folder / path.name
+        os.replace(path, self._free_path(target))
+
+    def upload_batch(self) -> list:
+        """upload the ready files now, and move or label them
+
+        :returns: list of (path, book id or exception)
+
+        """
+        batch, self._batch = self._batch, []
+        if not batch:
+            return []
+        logging.info(f'uploading {len(batch)} files')
+        try:
+            # a book deleted on the cloud since the last batch is uploaded
+            # again
+            self.client.refresh_cloud_ids()
+        except Exception as e:
+            logging.warning(f'the inventory could not be refreshed: {e}')
+        results = list(self.client.upload_many(
+                batch, max_workers=self.max_workers, skip_uploaded=True))
+        for path, result in results:
+            if isinstance(result, Exception):
+                self._set_aside(path, self.failed_dir, FAILED_LABEL)
+            else:
+                self._set_aside(path, self.done_dir, UPLOADED_LABEL)
+        return results
+
+    def _wait_time(self) -> float:
+        times = [self.settle, self.debounce]
+        now = time.monotonic()
+        for pending in self._pending.values():
+            if pending.closed:
+                times.append(pending.changed + self.settle - now)
+        if self._batch:
+            times.append(self._last_ready + self.debounce - now)
+        return max(0.01, min(times))
+
+    def step(self) -> list:
+        """wait for changes, and upload a batch if one is due
+
+        :returns: list of (path, book id or exception) of the batch
+
+        """
+        changes = self._source.wait(self._wait_time())
+        now = time.monotonic()
+        if changes is None:
+            self._scan(now)
+        else:
+            for name, closed in changes.items():
+                if self._is_ebook(name):
+                    self._touch(name, now, closed)
+        self._collect_ready(now)
+        if self._batch_due(now):
+            return self.upload_batch()
+        return []
+
+    def run(self):
+        """upload the files until stop is called. the client should have a
+        token_refresh_margin, so that its access token is renewed when it
+        expires
+
+        """
+        try:
+            while not self._stop_event.is_set():
+                self.step()
+            self.upload_batch()
+        finally:
+            self._source.close()
+
+    def stop(self):
+        """stop run, after the current step (and the last batch)"""
+        self._stop_event.set()
+
+
+def main(argv=None):
+    from pytolino.tolino_cloud import Client
+
+    parser = argparse.ArgumentParser(
+            description='upload the ebooks dropped in a folder, with the'
+            ' stored token of an account')
+    parser.add_argument('directory', type=Path)
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--partner', default='orellfuessli')
+    parser.add_argument('--done-dir', type=Path)
+    parser.add_argument('--failed-dir', type=Path)
+    parser.add_argument('--settle', type=float, default=2.0)
+    parser.add_argument('--debounce', type=float, default=1.0)
+    parser.add_argument('--jobs', type=int, default=4)
+    parser.add_argument('--poll', action='store_true',
+                        help='scan the folder instead of using inotify')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    client = Client(
+            args.username, server_name=args.partner, token_refresh_margin=60)
+    watcher = FolderWatcher(
+            client,
+            args.directory,
+            done_dir=args.done_dir,
+            failed_dir=args.failed_dir,
+            settle=args.settle,
+            debounce=args.debounce,
+            max_workers=args.jobs,
+            use_inotify=not args.poll,
+            )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+
+"""
+test the asyncio client
+"""
+
+import unittest
+import asyncio
+import inspect
+import time
+
+
+from pytolino.tolino_cloud import PytolinoException
+from pytolino.async_tolino_cloud import AsyncClient
+
+
+class TestAsyncClient(unittest.TestCase):
+
+    """all test concerning the AsyncClient class. """
+
+    def test_init_nopartner(self):
+        with self.assertRaises(PytolinoException):
+            AsyncClient(server_name='this tolino partner does not exists',
+                        username='username')
+
+    def test_requests_are_coroutines(self):
+        methods = (
+                'login',
+                'import_token',
+                'get_inventory',
+                'upload',
+                'upload_many',
+                'upload_metadata',
+                'add_cover',
+                'delete_ebook',
+                'add_to_collection',
+                '_renew_access_token',
+                )
+        for method in methods:
+            self.assertTrue(
+                    inspect.iscoroutinefunction(getattr(AsyncClient, method)))
+
+    def test_close(self):
+        async def open_and_close():
+            async with AsyncClient('username') as client:
+                pass
+            return client
+        client = asyncio.run(open_and_close())
+        self.assertTrue(client._session._closed)
+
+    def test_single_flight_token_refresh(self):
+        renewals = []
+
+        async def refresh_many():
+            client = AsyncClient('username', token_refresh_margin=60)
+            client._access_expiration_time = time.time() + 10
+
+            async def renew():
+                renewals.append(time.time())
+                await asyncio.sleep(0.05)
+                client._access_expiration_time = time.time() + 3600
+
+            client._renew_access_token = renew
+            await asyncio.gather(*(
+                client._refresh_token_if_expiring() for _ in range(10)))
+            await client.close()
+
+        asyncio.run(refresh_many())
+        self.assertEqual(len(renewals), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
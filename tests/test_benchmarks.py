@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+
+"""
+test the comparison of the benchmark results with the baseline
+"""
+
+import unittest
+
+
+from pytolino.benchmarks import (
+        compare, missing_from_baseline, environment_differences)
+
+
+class TestCompare(unittest.TestCase):
+
+    def test_regressions(self):
+        baseline = {
+                'upload': {'upload_1024k_x4_mb_per_s': 100.0},
+                'inventory': {
+                    'inventory_1k_s': 0.01,
+                    'inventory_1k_peak_mb': 2.0,
+                    },
+                }
+        results = {
+                'upload': {'upload_1024k_x4_mb_per_s': 60.0},
+                'inventory': {
+                    'inventory_1k_s': 0.011,
+                    'inventory_1k_peak_mb': 4.0,
+                    'inventory_10k_s': 1.0,
+                    },
+                }
+        regressions = compare(results, baseline, tolerance=0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith(
+            'upload.upload_1024k_x4_mb_per_s'))
+        self.assertTrue(regressions[1].startswith(
+            'inventory.inventory_1k_peak_mb'))
+
+    def test_missing_from_baseline(self):
+        baseline = {'inventory': {'inventory_1k_s': 0.01}}
+        results = {
+                'inventory': {
+                    'inventory_1k_s': 0.011,
+                    'inventory_1k_table_mb': 0.3,
+                    },
+                'sync': {'sync_unchanged_s': 0.6},
+                }
+        self.assertEqual(
+                missing_from_baseline(results, baseline),
+                ['inventory.inventory_1k_table_mb: 0.3',
+                 'sync.sync_unchanged_s: 0.6'])
+
+    def test_environment_differences(self):
+        baseline = {'python': '3.11.7', 'machine': 'x86_64',
+                    'system': 'Linux', 'cpus': 1, 'commit': 'abc'}
+        same = dict(baseline, python='3.11.9', commit='def')
+        self.assertEqual(environment_differences(same, baseline), [])
+        other = dict(baseline, python='3.12.1', cpus=8)
+        self.assertEqual(
+                environment_differences(other, baseline),
+                ['python: 3.12 (baseline 3.11)', 'cpus: 8 (baseline 1)'])
+        self.assertEqual(len(environment_differences(same, {})), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+
+"""
+test the pool of browsers for the GUI logins, with fake drivers
+"""
+
+import unittest
+import threading
+import time
+from unittest import mock
+
+
+from pytolino.browser_pool import BrowserLoginPool, login_many
+from pytolino.tolino_cloud import PytolinoException
+
+
+class FakeDriver(object):
+
+    def __init__(self):
+        self.quitted = False
+        self.cookies_cleared = 0
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.cookies_cleared += 1
+
+    def get_cookies(self):
+        return [{'name': 'session', 'value': 'abc'}]
+
+    def get_user_agent(self):
+        return 'agent'
+
+    def quit(self):
+        self.quitted = True
+
+
+class TestBrowserLoginPool(unittest.TestCase):
+
+    """reuse of the browsers and concurrency limit"""
+
+    def setUp(self):
+        self.drivers = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+        def driver_factory():
+            driver = FakeDriver()
+            self.drivers.append(driver)
+            return driver
+
+        def fill_login_form(driver, settings, username, password, timeout):
+            with self.lock:
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+            time.sleep(0.02)
+            with self.lock:
+                self.running -= 1
+            if password == 'wrong':
+                raise PytolinoException('login failed')
+
+        patcher = mock.patch(
+                'pytolino.browser_pool.fill_login_form', fill_login_form)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = BrowserLoginPool(size=2, driver_factory=driver_factory)
+
+    def test_settings(self):
+        pool = BrowserLoginPool()
+        self.assertEqual(pool.size, 2)
+
+    def test_reuse_and_limit(self):
+        threads = [
+                threading.Thread(
+                    target=self.pool.login, args=(f'user{i}', 'password'))
+                for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.drivers), 2)
+        self.assertEqual(self.max_running, 2)
+        for driver in self.drivers:
+            self.assertGreater(driver.cookies_cleared, 0)
+        self.pool.close()
+        self.assertTrue(all(driver.quitted for driver in self.drivers))
+
+    def test_failed_login_quits_browser(self):
+        with self.assertRaises(PytolinoException):
+            self.pool.login('user', 'wrong')
+        self.assertTrue(self.drivers[0].quitted)
+        cookies, user_agent = self.pool.login('user', 'password')
+        self.assertEqual(len(self.drivers), 2)
+        self.assertEqual(user_agent, 'agent')
+
+    def test_login_many(self):
+        clients = [mock.Mock() for _ in range(5)]
+        clients[0].login.side_effect = PytolinoException('failed')
+        results = login_many(
+                [(client, 'password') for client in clients], self.pool)
+        self.assertIsInstance(results[0][1], PytolinoException)
+        self.assertEqual([error for _, error in results[1:]], [None] * 4)
+        clients[1].login.assert_called_once_with(
+                'password', allow_GUI_autologin=True, browser_pool=self.pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+
+"""
+test the command line interface against the fake server
+"""
+
+import unittest
+import contextlib
+import io
+import json
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+
+from pytolino.fake_server import FakeTolinoServer
+from pytolino.tolino_cloud import Client
+from pytolino.token_store import MemoryTokenStore
+from pytolino.retry import RetryPolicy
+from pytolino import cli
+
+
+TEST_EPUB = Path(__file__).parent / 'basic-v3plus2.epub'
+TEST_COVER = Path(__file__).parent / 'test_cover.png'
+
+
+class TestCli(unittest.TestCase):
+
+    """run the commands with one client logged in the fake server"""
+
+    def setUp(self):
+        data_home = tempfile.TemporaryDirectory()
+        self.addCleanup(data_home.cleanup)
+        patcher = mock.patch.dict(os.environ, XDG_DATA_HOME=data_home.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server = FakeTolinoServer(seed=0).start()
+        self.addCleanup(self.server.stop)
+        self.book_ids = self.server.library.add_random_books(3)
+        self.client = Client(
+                'username',
+                token_store=MemoryTokenStore(),
+                server_settings=self.server.server_settings(),
+                retry_policy=RetryPolicy(backoff=0),
+                )
+        self.client.import_token(
+                self.server.new_refresh_token(), self.server.hardware_id)
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = Path(folder.name)
+
+    def run_cli(self, *args) -> tuple:
+        """
+        :returns: exit code, list of the json objects printed
+
+        """
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            code = cli.main(
+                    ['--username', 'username', *args],
+                    client_factory=lambda args: self.client,
+                    )
+        lines = stdout.getvalue().splitlines()
+        return code, [json.loads(line) for line in lines]
+
+    def write_jsonl(self, name: str, items: list) -> str:
+        path = self.folder / name
+        path.write_text(''.join(json.dumps(item) + '\n' for item in items))
+        return str(path)
+
+    def test_login_with_token(self):
+        def new_client(args):
+            # no token is stored yet, nothing must be printed about it
+            return Client(
+                    'username',
+                    token_store=MemoryTokenStore(),
+                    server_settings=self.server.server_settings(),
+                    )
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            code = cli.main(
+                    ['--username', 'username', 'login', '--json',
+                     '--refresh-token', self.server.new_refresh_token(),
+                     '--hardware-id', self.server.hardware_id],
+                    client_factory=new_client,
+                    )
+        self.assertEqual(code, 0)
+        self.assertEqual(
+                json.loads(stdout.getvalue())['hardware_id'],
+                self.server.hardware_id)
+
+    def test_inventory(self):
+        code, books = self.run_cli('inventory', '--json')
+        self.assertEqual(code, 0)
+        self.assertEqual(
+                sorted(book['book_id'] for book in books),
+                sorted(self.book_ids))
+
+    def test_upload(self):
+        for name in ('a.epub', 'b.epub'):
+            (self.folder / name).write_bytes(TEST_EPUB.read_bytes())
+        jsonl = self.write_jsonl(
+                'upload.jsonl', [{'path': str(TEST_EPUB), 'name': 'c.epub'}])
+        code, results = self.run_cli(
+                'upload', str(self.folder / '*.epub'), '--from', jsonl,
+                '--jobs', '3', '--json')
+        self.assertEqual(code, 0)
+        self.assertEqual(len(results), 3)
+        for result in results:
+            self.assertIn(result['book_id'], self.server.library.books)
+
+    def test_meta_cover_collection_delete(self):
+        book_id = self.book_ids[0]
+        jsonl = self.write_jsonl(
+                'meta.jsonl', [{'book_id': self.book_ids[1], 'title': 'b'}])
+        code, _ = self.run_cli(
+                'meta', book_id, '--set', 'title=a', '--set',
+                'author=["x", "y"]', '--from', jsonl, '--json')
+        self.assertEqual(code, 0)
+        metadata = self.server.library.books[book_id]['epubMetaData']
+        self.assertEqual(metadata['title'], 'a')
+        self.assertEqual(metadata['author'], ['x', 'y'])
+
+        code, _ = self.run_cli('cover', book_id, str(TEST_COVER), '--json')
+        self.assertEqual(code, 0)
+        self.assertIn(book_id, self.server.library.covers)
+
+        code, _ = self.run_cli(
+                'collection', 'add', 'shelf', *self.book_ids, '--json')
+        self.assertEqual(code, 0)
+
+        code, results = self.run_cli(
+                'delete', *self.book_ids[:2], '--json')
+        self.assertEqual(code, 0)
+        self.assertEqual(list(self.server.library.books), self.book_ids[2:])
+
+    def test_failure(self):
+        code, results = self.run_cli('delete', 'unknown', '--json')
+        self.assertEqual(code, cli.FAILED)
+        self.assertIn('error', results[0])
+
+    def test_bad_arguments(self):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr), \
+                self.assertRaises(SystemExit) as context:
+            self.run_cli('upload', str(self.folder / 'missing.epub'))
+        self.assertEqual(context.exception.code, 2)
+        self.assertIn('no file matches', stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+
+"""
+test the extraction, processing and cache of the covers
+"""
+
+import unittest
+import io
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+
+from pytolino import covers
+from pytolino.covers import (
+        CoverCache, CoverError, detect_image_format, extract_epub_cover,
+        find_cover_href, prepare_cover, process_cover)
+from pytolino.fake_server import FakeTolinoServer
+from pytolino.tolino_cloud import Client
+from pytolino.token_store import MemoryTokenStore
+
+
+TEST_EPUB = Path(__file__).parent / 'basic-v3plus2.epub'
+TEST_COVER = Path(__file__).parent / 'test_cover.png'
+Image = covers._load_pillow()
+
+EPUB2_OPF = b"""<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="2.0">
+  <metadata><meta name="cover" content="img1"/></metadata>
+  <manifest>
+    <item id="text" href="text.xhtml" media-type="application/xhtml+xml"/>
+    <item id="img1" href="../Images/front%20page.png" media-type="image/png"/>
+  </manifest>
+</package>
+"""
+
+
+def image_bytes(size, image_format='PNG', mode='RGB') -> bytes:
+    output = io.BytesIO()
+    image = Image.effect_noise(size, 64).convert(mode)
+    image.save(output, image_format)
+    return output.getvalue()
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestCovers(unittest.TestCase):
+
+    """find, convert and cache the covers"""
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.folder = Path(tmp_dir.name)
+        self.cache = CoverCache(self.folder / 'covers')
+
+    def test_detect_image_format(self):
+        self.assertEqual(detect_image_format(TEST_COVER.read_bytes()), 'png')
+        self.assertEqual(
+                detect_image_format(image_bytes((8, 8), 'JPEG')), 'jpeg')
+        self.assertEqual(
+                detect_image_format(image_bytes((8, 8), 'GIF', 'L')), 'gif')
+        self.assertEqual(
+                detect_image_format(image_bytes((8, 8), 'WEBP')), 'webp')
+        self.assertIsNone(detect_image_format(b'not an image'))
+
+    def test_extract_epub3_cover(self):
+        data = extract_epub_cover(TEST_EPUB)
+        self.assertEqual(detect_image_format(data), 'jpeg')
+
+    def test_extract_epub2_cover(self):
+        self.assertEqual(
+                find_cover_href(EPUB2_OPF), '../Images/front%20page.png')
+        epub_path = self.folder / 'book.epub'
+        with zipfile.ZipFile(epub_path, 'w') as epub:
+            epub.writestr('mimetype', 'application/epub+zip')
+            epub.writestr(
+                    'META-INF/container.xml',
+                    '<container xmlns="urn:oasis:names:tc:opendocument:xmlns:'
+                    'container"><rootfiles><rootfile full-path="OEBPS/c.opf"'
+                    '/></rootfiles></container>')
+            epub.writestr('OEBPS/c.opf', EPUB2_OPF)
+            epub.writestr('Images/front page.png', TEST_COVER.read_bytes())
+        self.assertEqual(
+                extract_epub_cover(epub_path), TEST_COVER.read_bytes())
+
+    def test_no_cover(self):
+        epub_path = self.folder / 'book.epub'
+        with zipfile.ZipFile(epub_path, 'w') as epub:
+            epub.writestr('mimetype', 'application/epub+zip')
+        with self.assertRaises(CoverError):
+            extract_epub_cover(epub_path)
+
+    def test_small_image_unchanged(self):
+        data = TEST_COVER.read_bytes()
+        self.assertIs(process_cover(data), data)
+
+    def test_downscale(self):
+        data = image_bytes((600, 900))
+        result = process_cover(data, max_size=(300, 400), max_bytes=20_000)
+        self.assertEqual(detect_image_format(result), 'jpeg')
+        self.assertLessEqual(len(result), 20_000)
+        image = Image.open(io.BytesIO(result))
+        self.assertLessEqual(image.width, 300)
+        self.assertLessEqual(image.height, 400)
+
+    def test_convert_transparent_webp(self):
+        data = image_bytes((100, 100), 'WEBP', 'RGBA')
+        result = process_cover(data)
+        self.assertEqual(detect_image_format(result), 'jpeg')
+
+    def test_without_pillow(self):
+        data = image_bytes((2000, 10))
+        with mock.patch.object(covers, '_load_pillow', return_value=None), \
+                self.assertLogs(level='WARNING'):
+            self.assertIs(process_cover(data), data)
+
+    def test_prepare_cached(self):
+        path = prepare_cover(
+                TEST_EPUB, self.cache, max_size=(300, 400), max_bytes=None)
+        self.assertEqual(path.parent, self.cache.directory)
+        self.assertEqual(path.suffix, '.jpg')
+        with mock.patch.object(covers, 'process_cover') as process:
+            again = prepare_cover(
+                    TEST_EPUB, self.cache, max_size=(300, 400),
+                    max_bytes=None)
+        process.assert_not_called()
+        self.assertEqual(again, path)
+        other = prepare_cover(TEST_EPUB, self.cache, max_size=(200, 300))
+        self.assertNotEqual(other, path)
+        self.assertEqual(
+                sorted(os.listdir(self.cache.directory)),
+                sorted([path.name, other.name]))
+
+
+class TestClientCover(unittest.TestCase):
+
+    """upload the covers to the fake server"""
+
+    def setUp(self):
+        data_home = tempfile.TemporaryDirectory()
+        self.addCleanup(data_home.cleanup)
+        patcher = mock.patch.dict(os.environ, XDG_DATA_HOME=data_home.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server = FakeTolinoServer(seed=0).start()
+        self.addCleanup(self.server.stop)
+        self.book_id, = self.server.library.add_random_books(1)
+        self.client = Client(
+                'username',
+                token_store=MemoryTokenStore(),
+                server_settings=self.server.server_settings(),
+                )
+        self.client.import_token(
+                self.server.new_refresh_token(), self.server.hardware_id)
+        self.folder = Path(data_home.name)
+
+    def test_format_from_content(self):
+        misnamed = self.folder / 'cover.jpg'
+        misnamed.write_bytes(TEST_COVER.read_bytes())
+        _, filename, mime = self.client._cover_file_info(misnamed)
+        self.assertEqual((filename, mime), ('cover.png', 'image/png'))
+
+    def test_add_epub_cover(self):
+        self.client.add_cover(self.book_id, TEST_EPUB)
+        cover = self.server.library.covers[self.book_id]
+        self.assertEqual(detect_image_format(cover), 'jpeg')
+        self.assertLess(len(cover), TEST_EPUB.stat().st_size)
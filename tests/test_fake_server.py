@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+
+"""
+test the clients against the local fake server
+"""
+
+import unittest
+import asyncio
+import os
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
+
+
+from pytolino.fake_server import FakeTolinoServer
+from pytolino.tolino_cloud import Client, PytolinoException
+from pytolino.async_tolino_cloud import AsyncClient
+from pytolino.token_store import MemoryTokenStore
+from pytolino.retry import RetryPolicy
+from pytolino.inventory import get_book_id
+from pytolino.upload_index import file_sha256
+
+
+TEST_EPUB = Path(__file__).parent / 'basic-v3plus2.epub'
+TEST_COVER = Path(__file__).parent / 'test_cover.png'
+
+
+class TestFakeServer(unittest.TestCase):
+
+    """the client works with the fake server as with the cloud"""
+
+    def setUp(self):
+        data_home = tempfile.TemporaryDirectory()
+        self.addCleanup(data_home.cleanup)
+        patcher = mock.patch.dict(os.environ, XDG_DATA_HOME=data_home.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server = FakeTolinoServer(seed=0).start()
+        self.addCleanup(self.server.stop)
+        self.server.library.add_random_books(5)
+
+    def new_client(self, **kwargs):
+        return Client(
+                'username',
+                token_store=MemoryTokenStore(),
+                server_settings=self.server.server_settings(),
+                retry_policy=RetryPolicy(backoff=0),
+                **kwargs)
+
+    def test_login_with_cookies(self):
+        client = self.new_client()
+        client._login_cookies = self.server.login_cookies()
+        client.login('password', allow_GUI_autologin=False)
+        self.assertEqual(client.hardware_id, self.server.hardware_id)
+        self.assertEqual(len(client.get_inventory()), 5)
+
+    def test_not_logged_in(self):
+        client = self.new_client()
+        client._login_cookies = [{'name': 'other', 'value': 'cookie'}]
+        with self.assertRaises(PytolinoException):
+            client.login('password', allow_GUI_autologin=False)
+
+    def test_library(self):
+        client = self.new_client()
+        client.import_token(
+                self.server.new_refresh_token(), self.server.hardware_id)
+        book_id = client.upload(TEST_EPUB)
+        self.assertIn(book_id, self.server.library.books)
+        client.upload_metadata(book_id, title='new title')
+        client.add_to_collection(book_id, 'collection')
+        client.add_cover(book_id, TEST_COVER)
+        self.assertEqual(
+                self.server.library.covers[book_id], TEST_COVER.read_bytes())
+
+        client.get_inventory(incremental=True)
+        book = client.inventory.get(book_id)
+        self.assertEqual(book['epubMetaData']['title'], 'new title')
+        self.assertEqual(book['tags'][0]['name'], 'collection')
+
+        client.delete_ebook(book_id)
+        books = client.get_inventory(incremental=True)
+        self.assertEqual(len(books), 5)
+        self.assertNotIn(book_id, [get_book_id(book) for book in books])
+
+    def test_skip_uploaded(self):
+        client = self.new_client()
+        client.import_token(
+                self.server.new_refresh_token(), self.server.hardware_id)
+        book_ids = []
+
+        def upload_twice():
+            for _ in range(2):
+                book_ids.append(client.upload(TEST_EPUB, skip_uploaded=True))
+
+        # the second upload fetches the inventory to check the indexed book
+        thread = threading.Thread(target=upload_twice, daemon=True)
+        thread.start()
+        thread.join(timeout=10)
+        self.assertFalse(thread.is_alive(), 'the upload is blocked')
+        self.assertEqual(len(book_ids), 2)
+        self.assertEqual(book_ids[0], book_ids[1])
+        self.assertEqual(len(self.server.library.books), 6)
+
+    def test_refresh_token_used_once(self):
+        client = self.new_client()
+        refresh_token = self.server.new_refresh_token()
+        client.import_token(refresh_token, self.server.hardware_id)
+        other = self.new_client()
+        other._hardware_id = self.server.hardware_id
+        other._refresh_token = refresh_token
+        with self.assertRaises(PytolinoException):
+            other._renew_access_token(adopt_stored_token=False)
+
+    def test_injected_errors(self):
+        client = self.new_client()
+        client.import_token(
+                self.server.new_refresh_token(), self.server.hardware_id)
+        self.server.fail_next('inventory', 502, 503)
+        self.assertEqual(len(client.get_inventory()), 5)
+        self.server.fail_next('upload', 502)
+        with self.assertRaises(PytolinoException):
+            client.upload(TEST_EPUB)
+        self.server.fail_next('upload', 429, retry_after=0)
+        book_id = client.upload(TEST_EPUB)
+        self.assertIn(book_id, self.server.library.books)
+
+    def test_iter_inventory(self):
+        client = self.new_client()
+        client.import_token(
+                self.server.new_refresh_token(), self.server.hardware_id)
+        self.server.fail_next('inventory', 503)
+        books = list(client.iter_inventory())
+        self.assertEqual(books, client.get_inventory())
+        self.assertEqual(len(books), 5)
+        ids = [get_book_id(book) for book in books]
+        self.assertEqual([book.book_id for book in client.get_books()], ids)
+        self.assertEqual(client.get_inventory_table().column('book_id'), ids)
+
+    def test_metadata_cache(self):
+        client = self.new_client()
+        client.import_token(
+                self.server.new_refresh_token(), self.server.hardware_id)
+        book_ids = [get_book_id(book) for book in client.get_inventory()]
+
+        def meta_gets():
+            return [request for request in self.server.requests
+                    if request[:2] == ('meta', 'GET')]
+
+        results = client.update_metadata_many(
+                [(book_id, {'publisher': 'first'}) for book_id in book_ids])
+        self.assertEqual(list(results.values()), [None] * 5)
+        self.assertEqual(len(meta_gets()), 5)
+
+        # the books were seen recently, the second batch skips the GETs
+        results = client.update_metadata_many(
+                [(book_id, {'title': 'second'}) for book_id in book_ids])
+        client.upload_metadata(book_ids[0], author='third')
+        self.assertEqual(list(results.values()), [None] * 5)
+        self.assertEqual(len(meta_gets()), 5)
+        for book_id in book_ids:
+            metadata = self.server.library.metadata(book_id)
+            self.assertEqual(metadata['publisher'], 'first')
+            self.assertEqual(metadata['title'], 'second')
+        self.assertEqual(
+                self.server.library.metadata(book_ids[0])['author'], 'third')
+
+    def test_async_client(self):
+        async def run():
+            async with AsyncClient(
+                    'username',
+                    token_store=MemoryTokenStore(),
+                    server_settings=self.server.server_settings(),
+                    ) as client:
+                await client.import_token(
+                        self.server.new_refresh_token(),
+                        self.server.hardware_id)
+                book_id = await client.upload(TEST_EPUB)
+                await client.upload_metadata(book_id, title='async')
+                books = await client.get_inventory()
+                streamed = [book async for book in client.iter_inventory()]
+                self.assertEqual(streamed, books)
+                return book_id, books
+
+        book_id, books = asyncio.run(run())
+        self.assertEqual(len(books), 6)
+        self.assertEqual(
+                self.server.library.books[book_id]['epubMetaData']['title'],
+                'async')
+
+    def test_async_upload_retry(self):
+        async def run():
+            async with AsyncClient(
+                    'username',
+                    token_store=MemoryTokenStore(),
+                    server_settings=self.server.server_settings(),
+                    retry_policy=RetryPolicy(backoff=0),
+                    ) as client:
+                await client.import_token(
+                        self.server.new_refresh_token(),
+                        self.server.hardware_id)
+                self.server.fail_next('upload', 429, retry_after=0)
+                return await client.upload(
+                        TEST_EPUB, progress=lambda sent, total: None)
+
+        book_id = asyncio.run(run())
+        self.assertIn(book_id, self.server.library.books)
+        uploads = [request for request in self.server.requests
+                   if request[0] == 'upload']
+        self.assertEqual(len(uploads), 2)
+        # the retry sends the whole body again
+        self.assertEqual(uploads[0][2], uploads[1][2])
+
+    def test_async_upload_many(self):
+        async def run(client):
+            await client.import_token(
+                    self.server.new_refresh_token(), self.server.hardware_id)
+            progress = []
+            first = await client.upload(
+                    TEST_EPUB, skip_uploaded=True,
+                    progress=lambda sent, total: progress.append(
+                        (sent, total)))
+            sent, total = progress[-1]
+            self.assertEqual(sent, total)
+            self.assertGreater(total, TEST_EPUB.stat().st_size)
+            results = await client.upload_many(
+                    [TEST_EPUB, TEST_EPUB, Path('missing.epub')],
+                    max_workers=2, skip_uploaded=True)
+            await client.delete_ebook(first)
+            return first, results
+
+        client = AsyncClient(
+                'username',
+                token_store=MemoryTokenStore(),
+                server_settings=self.server.server_settings(),
+                )
+
+        async def run_and_close():
+            async with client:
+                return await run(client)
+
+        first, results = asyncio.run(run_and_close())
+        self.assertEqual(
+                [path for path, _ in results],
+                [TEST_EPUB, TEST_EPUB, Path('missing.epub')])
+        self.assertEqual([result for _, result in results[:2]], [first] * 2)
+        self.assertIsInstance(results[2][1], Exception)
+        self.assertNotIn(first, self.server.library.books)
+        # the delete updates the state shared with the sync methods
+        self.assertNotIn(first, client._cloud_ids)
+        self.assertIsNone(
+                client.upload_index.get(file_sha256(TEST_EPUB)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+
+"""
+benchmark the import of the client: the token-only path must not load
+selenium, which is only needed for a GUI login
+"""
+
+import unittest
+import subprocess
+import sys
+import json
+
+
+HEAVY_MODULES = ('selenium', 'seleniumbase', 'pytolino.browser_login')
+IMPORT_TIME_BUDGET = 1.0  # s, selenium alone takes more than that on CI
+
+IMPORT_SCRIPT = """
+import json
+import sys
+import time
+t0 = time.perf_counter()
+from pytolino.tolino_cloud import Client
+import_time = time.perf_counter() - t0
+Client('username')
+print(json.dumps(dict(
+        import_time=import_time,
+        modules=sorted(sys.modules),
+        )))
+"""
+
+
+class TestImportTime(unittest.TestCase):
+
+    """import the client in a fresh interpreter and inspect sys.modules"""
+
+    @classmethod
+    def setUpClass(cls):
+        process = subprocess.run(
+                [sys.executable, '-c', IMPORT_SCRIPT],
+                capture_output=True,
+                text=True,
+                check=True,
+                )
+        last_line = process.stdout.strip().splitlines()[-1]
+        cls.result = json.loads(last_line)
+
+    def test_selenium_not_imported(self):
+        modules = self.result['modules']
+        for heavy_module in HEAVY_MODULES:
+            self.assertNotIn(heavy_module, modules)
+
+    def test_import_time(self):
+        self.assertLess(self.result['import_time'], IMPORT_TIME_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+
+"""
+test the local inventory cache and the incremental sync
+"""
+
+import unittest
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+
+from pytolino.inventory import Inventory, InventoryCache
+from pytolino.tolino_cloud import Client
+
+
+def make_book(book_id, title='title', **metadata):
+    metadata.update(identifier=book_id, title=title)
+    return {'epubMetaData': metadata}
+
+
+def make_response(uploaded, purchased, revision=None, deleted=None):
+    publication_inventory = {'edata': uploaded, 'ebook': purchased}
+    if revision is not None:
+        publication_inventory['revision'] = revision
+    if deleted is not None:
+        publication_inventory['deleted'] = deleted
+    response = mock.Mock(ok=True)
+    response.json.return_value = {
+            'PublicationInventory': publication_inventory}
+    return response
+
+
+class TestInventoryCache(unittest.TestCase):
+
+    """replace and apply deltas to the cache"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp_dir.name) / 'inventory.sqlite'
+        self.cache = InventoryCache(self.db_path)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_replace(self):
+        self.assertIsNone(self.cache.revision)
+        self.cache.replace([make_book('a')], [make_book('b')], revision=1)
+        self.assertEqual(self.cache.revision, 1)
+        self.assertEqual(
+                self.cache.books(), [make_book('a'), make_book('b')])
+
+    def test_apply_delta(self):
+        self.cache.replace([make_book('a'), make_book('b')], [], revision=1)
+        self.cache.apply_delta(
+                [make_book('a', 'new title'), make_book('c')],
+                [],
+                ['b'],
+                revision=2,
+                )
+        self.assertEqual(self.cache.revision, 2)
+        self.assertEqual(
+                self.cache.books(),
+                [make_book('a', 'new title'), make_book('c')])
+
+    def test_persistent(self):
+        self.cache.replace([make_book('a')], [], revision='rev')
+        other_cache = InventoryCache(self.db_path)
+        self.assertEqual(other_cache.revision, 'rev')
+        self.assertEqual(other_cache.books(), [make_book('a')])
+        other_cache.close()
+
+
+class TestInventory(unittest.TestCase):
+
+    """lookups and search in the indexed inventory"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.books = [
+                make_book('a', 'Le Petit Prince', isbn='978-3-16-148410-0',
+                          author='Antoine de Saint-Exupéry'),
+                make_book('b', 'Dune', author=['Frank Herbert']),
+                make_book('c', 'Dune Messiah', author='Frank  Herbert'),
+                ]
+        cls.inventory = Inventory(cls.books)
+
+    def test_sequence(self):
+        self.assertEqual(len(self.inventory), 3)
+        self.assertEqual(list(self.inventory), self.books)
+
+    def test_get(self):
+        self.assertEqual(self.inventory.get('b'), self.books[1])
+        self.assertIsNone(self.inventory.get('d'))
+        self.assertTrue(self.inventory.has_book('a'))
+
+    def test_find(self):
+        self.assertEqual(
+                self.inventory.find_isbn('9783161484100'), [self.books[0]])
+        self.assertEqual(
+                self.inventory.find_title('le petit  PRINCE'),
+                [self.books[0]])
+        self.assertEqual(
+                self.inventory.find_author('antoine de saint-exupery'),
+                [self.books[0]])
+        self.assertEqual(
+                self.inventory.find_author('Frank Herbert'),
+                self.books[1:])
+
+    def test_search_title(self):
+        self.assertEqual(
+                self.inventory.search_title('dune', prefix=True),
+                self.books[1:])
+        self.assertEqual(
+                self.inventory.search_title('MESS'), [self.books[2]])
+        self.assertEqual(
+                self.inventory.search_title('e'),
+                self.books[1:] + self.books[:1])
+        self.assertEqual(
+                self.inventory.search_title('prince', prefix=True), [])
+
+
+class TestIncrementalInventory(unittest.TestCase):
+
+    """incremental get_inventory of the client"""
+
+    def test_incremental(self):
+        client = Client('username')
+        client._inventory_cache = InventoryCache(':memory:')
+        responses = [
+                make_response([make_book('a')], [], revision=1),
+                make_response([make_book('b')], [], revision=2,
+                              deleted=['a']),
+                ]
+        with mock.patch.object(
+                client._session, 'get', side_effect=responses) as get:
+            client.get_inventory(incremental=True)
+            inventory = client.get_inventory(incremental=True)
+        first_params = get.call_args_list[0].kwargs['params']
+        second_params = get.call_args_list[1].kwargs['params']
+        self.assertNotIn('revision', first_params)
+        self.assertEqual(second_params['revision'], 1)
+        self.assertEqual(inventory, [make_book('b')])
+        self.assertEqual(client.inventory.get('b'), make_book('b'))
+
+    def test_invalidation(self):
+        client = Client('username')
+        responses = [
+                make_response([make_book('a')], []),
+                mock.Mock(ok=True),  # delete
+                make_response([make_book('a'), make_book('b')], []),
+                ]
+        with mock.patch.object(client._session, 'get', side_effect=responses):
+            self.assertIsNone(client.inventory.get('b'))
+            self.assertIs(client.inventory, client.inventory)
+            client.delete_ebook('c')
+            self.assertIsNotNone(client.inventory.get('b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
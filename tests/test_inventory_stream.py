@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+
+"""
+test the incremental parser of the inventory response
+"""
+
+import unittest
+import json
+
+
+from pytolino.inventory_stream import InventoryParser, iter_inventory_books
+
+
+def make_body(uploaded, purchased, **fields):
+    publication_inventory = {'edata': uploaded, 'ebook': purchased, **fields}
+    return json.dumps(
+            {'PublicationInventory': publication_inventory},
+            ensure_ascii=False,
+            ).encode()
+
+
+def split(body: bytes, size: int) -> list:
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def parse(chunks) -> tuple:
+    """
+    :returns: list of (list name, book), fields
+
+    """
+    parser = InventoryParser()
+    items = []
+    for chunk in chunks:
+        items += parser.feed(chunk)
+    items += parser.close()
+    return items, parser.fields
+
+
+class TestInventoryParser(unittest.TestCase):
+
+    """books are returned as soon as they are complete"""
+
+    def setUp(self):
+        self.uploaded = [
+                {'epubMetaData': {'identifier': str(i), 'title': 'é"}]' * i}}
+                for i in range(20)]
+        self.purchased = [{'epubMetaData': {'identifier': 'p', 'size': 1.5}}]
+        self.body = make_body(
+                self.uploaded, self.purchased, revision=12, deleted=['x'])
+
+    def test_chunk_sizes(self):
+        expected = ([('edata', book) for book in self.uploaded]
+                    + [('ebook', book) for book in self.purchased])
+        for size in (1, 2, 3, 64, len(self.body)):
+            items, fields = parse(split(self.body, size))
+            self.assertEqual(items, expected)
+            self.assertEqual(fields, {'revision': 12, 'deleted': ['x']})
+
+    def test_incremental(self):
+        parser = InventoryParser()
+        first_book_end = self.body.index(b'}}') + 2
+        self.assertEqual(parser.feed(self.body[:first_book_end - 1]), [])
+        self.assertEqual(
+                parser.feed(self.body[first_book_end - 1:first_book_end]),
+                [('edata', self.uploaded[0])])
+
+    def test_number_split(self):
+        body = make_body([], [], revision=-12345.5e2)
+        self.assertEqual(parse(split(body, 1))[1], {'revision': -1234550.0})
+
+    def test_other_fields(self):
+        body = json.dumps({
+            'other': {'edata': [1]},
+            'PublicationInventory': {'ebook': [], 'edata': [{'a': 1}]},
+            }).encode()
+        self.assertEqual(parse([body])[0], [('edata', {'a': 1})])
+
+    def test_invalid(self):
+        for body in (
+                b'',
+                b'<html>',
+                b'{"other": 1}',
+                b'{"PublicationInventory": {"edata": []}}',
+                b'{"PublicationInventory": {"edata": [1 2], "ebook": []}}',
+                b'{"PublicationInventory": {"edata": [], "ebook": [',
+                b'{"PublicationInventory": {"edata": [], "ebook": []}} x',
+                ):
+            with self.assertRaises(ValueError, msg=body):
+                parse([body])
+
+    def test_generator(self):
+        books = iter_inventory_books(split(self.body, 100))
+        self.assertEqual(next(books), ('edata', self.uploaded[0]))
+        self.assertEqual(len(list(books)), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+
+"""
+test the compact Book records and the columnar inventory
+"""
+
+import unittest
+import pickle
+
+
+from pytolino.book import Book
+from pytolino.inventory import Inventory, get_book_id
+from pytolino.inventory_table import InventoryTable
+
+
+def make_entry(book_id, title='title', **metadata):
+    metadata.update(identifier=book_id, title=title)
+    return {'epubMetaData': metadata, 'tags': [], 'creationDate': 1}
+
+
+class TestBook(unittest.TestCase):
+
+    """common fields in slots, raw entry decoded when asked"""
+
+    def setUp(self):
+        self.entry = make_entry(
+                'a', 'Le Petit Prince', author='Antoine de Saint-Exupéry',
+                isbn='978-3-16-148410-0', fileSize=1234, format='EPUB')
+
+    def test_from_dict(self):
+        book = Book.from_dict(self.entry)
+        self.assertEqual(book.book_id, 'a')
+        self.assertEqual(book.authors, ('Antoine de Saint-Exupéry',))
+        self.assertEqual(book.file_size, 1234)
+        self.assertIsNone(book.language)
+        self.assertEqual(book.raw, self.entry)
+        self.assertFalse(hasattr(book, '__dict__'))
+
+    def test_without_raw(self):
+        book = Book.from_dict(self.entry, keep_raw=False)
+        self.assertFalse(book.has_raw)
+        self.assertEqual(
+                Book.from_dict(book.raw, keep_raw=False), book)
+        self.assertEqual(book.raw['epubMetaData']['fileSize'], 1234)
+
+    def test_pickle(self):
+        book = Book.from_dict(self.entry)
+        self.assertEqual(pickle.loads(pickle.dumps(book)), book)
+
+    def test_inventory(self):
+        books = [Book.from_dict(self.entry),
+                 Book.from_dict(make_entry('b', 'Dune'))]
+        inventory = Inventory(books)
+        self.assertIs(inventory.get('b'), books[1])
+        self.assertEqual(
+                inventory.find_author('antoine de saint-exupery'),
+                books[:1])
+        self.assertEqual(inventory.find_isbn('9783161484100'), books[:1])
+        self.assertEqual(get_book_id(books[1]), 'b')
+
+
+class TestInventoryTable(unittest.TestCase):
+
+    """books stored by column"""
+
+    def setUp(self):
+        self.entries = [
+                make_entry(f'id{i}', f'title {i}', author=[f'author {i % 3}'],
+                           language='de' if i % 2 else 'fr',
+                           fileSize=i * 100, format='EPUB')
+                for i in range(2500)]
+        self.entries.append(make_entry('no-metadata', ''))
+        self.table = InventoryTable(self.entries)
+
+    def test_rows(self):
+        self.assertEqual(len(self.table), 2501)
+        for index in (0, 1, 1023, 1024, 2048, 2499, -2):
+            self.assertEqual(
+                    self.table[index],
+                    Book.from_dict(self.entries[index], keep_raw=False))
+        last = self.table[-1]
+        self.assertIsNone(last.title)
+        self.assertIsNone(last.file_size)
+        self.assertEqual(last.authors, ())
+        with self.assertRaises(IndexError):
+            self.table[2501]
+
+    def test_column(self):
+        self.assertEqual(
+                self.table.column('book_id', [0, 2000]), ['id0', 'id2000'])
+        self.assertEqual(
+                self.table.column('language')[:3], ['fr', 'de', 'fr'])
+
+    def test_where(self):
+        rows = self.table.where(
+                language='de',
+                authors=lambda authors: 'author 1' in authors,
+                file_size=lambda size: size is not None and size < 1000,
+                )
+        self.assertEqual(rows, [1, 7])
+        self.assertEqual(self.table.where(language='en'), [])
+        self.assertEqual(self.table.where(book_id='id42'), [42])
+        self.assertEqual(len(self.table.where()), 2501)
+
+    def test_filter(self):
+        table = self.table.filter(title='title 3')
+        self.assertEqual(len(table), 1)
+        self.assertEqual(table[0].book_id, 'id3')
+
+    def test_append_book(self):
+        table = InventoryTable()
+        book = Book.from_dict(self.entries[0])
+        table.append(book)
+        self.assertEqual(table[0], Book.from_dict(
+            self.entries[0], keep_raw=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+
+"""
+test the metrics collector, its prometheus export and the client hook
+"""
+
+import unittest
+import datetime
+from unittest import mock
+
+import requests
+
+
+from pytolino.metrics import InMemoryMetrics, TOKEN_REFRESH
+from pytolino.tolino_cloud import Client, PytolinoException
+from pytolino.token_store import MemoryTokenStore
+from pytolino.retry import RetryPolicy
+
+
+def make_response(status, content=b'', method='GET'):
+    request = requests.Request(
+            method, 'https://example.com/delete').prepare()
+    rsp = requests.Response()
+    rsp.status_code = status
+    rsp.url = request.url
+    rsp.request = request
+    rsp._content = content
+    rsp.elapsed = datetime.timedelta(seconds=0.3)
+    return rsp
+
+
+class TestInMemoryMetrics(unittest.TestCase):
+
+    """collect and export the metrics"""
+
+    def test_prometheus(self):
+        metrics = InMemoryMetrics(buckets=(0.1, 1.0))
+        metrics.observe_request(
+                'partner', 'upload', 'POST', 200, 0.5, 1000, 20)
+        metrics.observe_request(
+                'partner', 'upload', 'POST', 200, 2.0, 1000, 20)
+        metrics.observe_retry('partner', 'upload')
+        with self.assertRaises(ValueError):
+            with metrics.time_event('partner', TOKEN_REFRESH):
+                raise ValueError
+        text = metrics.to_prometheus()
+        lines = text.splitlines()
+        labels = 'partner="partner",endpoint="upload",method="POST"'
+        name = 'pytolino_request_duration_seconds'
+        self.assertIn(
+                f'{name}_bucket{{{labels},le="0.1"}} 0',
+                lines)
+        self.assertIn(
+                f'{name}_bucket{{{labels},le="1.0"}} 1',
+                lines)
+        self.assertIn(
+                f'{name}_bucket{{{labels},le="+Inf"}} 2',
+                lines)
+        self.assertIn(
+                f'{name}_count{{{labels}}} 2',
+                lines)
+        self.assertIn(
+                'pytolino_requests_total{partner="partner",endpoint="upload",'
+                'status="200"} 2',
+                lines)
+        self.assertIn(
+                'pytolino_request_bytes_sent_total{partner="partner",'
+                'endpoint="upload"} 2000',
+                lines)
+        self.assertIn(
+                'pytolino_events_total{partner="partner",'
+                'event="token_refresh",outcome="error"} 1',
+                lines)
+
+    def test_client_hook(self):
+        metrics = InMemoryMetrics()
+        client = Client(
+                'username',
+                token_store=MemoryTokenStore(),
+                metrics=metrics,
+                retry_policy=RetryPolicy(max_attempts=2, backoff=0),
+                )
+        client._access_token = 'token'
+        client._hardware_id = 'hardware_id'
+        with mock.patch.object(client._session, 'get') as get:
+            get.return_value = make_response(200, b'{}')
+            client.delete_ebook('a')
+            get.return_value = make_response(500, b'error')
+            with self.assertRaises(PytolinoException):
+                client.delete_ebook('b')
+        snapshot = metrics.snapshot()
+        key = ('orellfuessli', 'delete', 'GET')
+        self.assertEqual(snapshot['latencies'][key][0], 3)
+        self.assertAlmostEqual(snapshot['latencies'][key][1], 0.9)
+        self.assertEqual(
+                snapshot['statuses'][('orellfuessli', 'delete', 500)], 2)
+        self.assertEqual(
+                snapshot['retries'][('orellfuessli', 'delete')], 1)
+        self.assertEqual(
+                snapshot['bytes_sent'][('orellfuessli', 'delete')], 0)
+        self.assertEqual(
+                snapshot['bytes_received'][('orellfuessli', 'delete')], 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+
+"""
+test the streaming multipart encoder
+"""
+
+import unittest
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+
+from urllib3.filepost import encode_multipart_formdata
+
+
+from pytolino.multipart import MultipartEncoder
+
+
+TEST_EPUB = Path(__file__).parent / 'basic-v3plus2.epub'
+BOUNDARY = 'pytolinoboundary'
+
+
+class TestMultipartEncoder(unittest.TestCase):
+
+    """compare the encoder with urllib3 (used by requests)"""
+
+    def setUp(self):
+        self.fields = {'deliverableId': 'my_id'}
+        self.files = [
+                ('file', ('book.epub', TEST_EPUB, 'application/epub+zip'))]
+        self.encoder = MultipartEncoder(
+                fields=self.fields,
+                files=self.files,
+                boundary=BOUNDARY,
+                )
+
+    def tearDown(self):
+        self.encoder.close()
+
+    def test_same_body_as_urllib3(self):
+        fields = list(self.fields.items())
+        fields.append(('file', (
+            'book.epub', TEST_EPUB.read_bytes(), 'application/epub+zip')))
+        expected_body, content_type = encode_multipart_formdata(
+                fields, boundary=BOUNDARY)
+        self.assertEqual(self.encoder.read(), expected_body)
+        self.assertEqual(len(self.encoder), len(expected_body))
+        self.assertEqual(self.encoder.content_type, content_type)
+
+    def test_chunks_and_progress(self):
+        progress = []
+        encoder = MultipartEncoder(
+                files=self.files,
+                progress=lambda sent, total: progress.append((sent, total)),
+                chunk_size=1000,
+                )
+        with encoder:
+            chunks = list(encoder)
+        self.assertTrue(all(len(chunk) <= 1000 for chunk in chunks))
+        self.assertEqual(sum(len(chunk) for chunk in chunks), len(encoder))
+        self.assertEqual(progress[-1], (len(encoder), len(encoder)))
+
+    def test_seek(self):
+        start = self.encoder.read(5000)
+        self.encoder.seek(0)
+        self.assertEqual(self.encoder.tell(), 0)
+        self.assertEqual(self.encoder.read(5000), start)
+        closing = f'--{BOUNDARY}--\r\n'.encode()
+        self.encoder.seek(-len(closing), 2)
+        self.assertEqual(self.encoder.read(), closing)
+
+    def test_constant_memory(self):
+        file_size = 50 * 1024 * 1024
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            big_file = Path(tmp_dir) / 'big.pdf'
+            with open(big_file, 'wb') as f:
+                f.truncate(file_size)
+            files = [('file', ('big.pdf', big_file, 'application/pdf'))]
+            tracemalloc.start()
+            with MultipartEncoder(files=files) as encoder:
+                sent = sum(len(chunk) for chunk in encoder)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        self.assertGreater(sent, file_size)
+        self.assertLess(peak, file_size / 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
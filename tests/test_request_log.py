@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+
+"""
+test the log records of the requests
+"""
+
+import unittest
+import logging
+import json
+from unittest import mock
+
+import requests
+
+
+from pytolino import request_log
+from pytolino.request_log import log_request, redact, REDACTED
+from pytolino.tolino_cloud import Client
+
+
+def make_response(status=200, content=b'', headers=None):
+    request = requests.Request(
+            'POST',
+            'https://example.com/token?code=SECRETCODE',
+            headers={'t_auth_token': 'SECRETACCESS', 'Accept': '*/*'},
+            ).prepare()
+    rsp = requests.Response()
+    rsp.status_code = status
+    rsp.url = request.url
+    rsp.request = request
+    rsp._content = content
+    rsp.headers.update(headers or {})
+    return rsp
+
+
+class TestRequestLog(unittest.TestCase):
+
+    """one bounded record, secrets redacted, nothing done when disabled"""
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_request_log')
+        self.logger.propagate = False
+        self.records = []
+        handler = logging.Handler()
+        handler.emit = self.records.append
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+
+    def test_disabled_level(self):
+        self.logger.setLevel(logging.INFO)
+        rsp = make_response()
+        with mock.patch.object(request_log, 'request_record') as record:
+            log_request(rsp, {'a': 1}, logger=self.logger)
+        record.assert_not_called()
+        self.assertEqual(self.records, [])
+
+    def test_one_redacted_record(self):
+        self.logger.setLevel(logging.DEBUG)
+        body = json.dumps({
+            'access_token': 'SECRETACCESS',
+            'refresh_token': 'SECRETREFRESH',
+            'expires_in': 3600,
+            }).encode()
+        rsp = make_response(content=body)
+        data = {'refresh_token': 'SECRETREFRESH', 'grant_type': 'refresh'}
+        log_request(rsp, data, logger=self.logger)
+        self.assertEqual(len(self.records), 1)
+        record = self.records[0]
+        self.assertEqual(record.levelno, logging.DEBUG)
+        message = record.getMessage()
+        for secret in ('SECRETCODE', 'SECRETACCESS', 'SECRETREFRESH'):
+            self.assertNotIn(secret, message)
+        self.assertIn('expires_in', message)
+        self.assertEqual(record.request['data']['grant_type'], 'refresh')
+        self.assertEqual(record.request['data']['refresh_token'], REDACTED)
+
+    def test_error_and_size_cap(self):
+        self.logger.setLevel(logging.DEBUG)
+        rsp = make_response(status=500, content=b'x' * 10**6)
+        log_request(rsp, 'y' * 10**6, logger=self.logger)
+        record = self.records[0]
+        self.assertEqual(record.levelno, logging.ERROR)
+        self.assertLessEqual(
+                len(record.getMessage()), request_log.RECORD_MAX_CHARS + 100)
+        self.assertIn('more bytes', record.request['body'])
+
+    def test_redact_text(self):
+        text = 'refresh_token=abc&x=1; "access_token": "def"'
+        self.assertEqual(
+                redact(text),
+                'refresh_token=***&x=1; "access_token": "***"')
+
+
+    def test_redact_devices_request(self):
+        client = Client('username')
+        client._access_token = 'SECRETACCESS'
+        data, headers = client._hardware_id_request()
+        self.assertNotIn('SECRETACCESS', str(redact(data)))
+        self.assertNotIn('SECRETACCESS', str(redact(json.loads(data))))
+        self.assertNotIn('SECRETACCESS', str(redact(headers)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+
+"""
+test the retry policy and the rate limiter
+"""
+
+import unittest
+import email.utils
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+
+from pytolino.retry import (
+        RetryPolicy, TokenBucket, parse_retry_after, rate_limiter)
+from pytolino.tolino_cloud import Client, PytolinoException
+from pytolino.token_store import MemoryTokenStore
+
+
+TEST_EPUB = Path(__file__).parent / 'basic-v3plus2.epub'
+
+
+def make_response(status, headers=None, content=b'{}'):
+    return mock.Mock(
+            ok=status < 400,
+            status_code=status,
+            headers=headers or {},
+            content=content,
+            url='https://example.com',
+            request=mock.Mock(method='GET', headers={}),
+            **{'json.return_value': {'metadata': {'deliverableId': 'id'}}})
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    """decisions and delays of the retries"""
+
+    def setUp(self):
+        self.policy = RetryPolicy(max_attempts=3, backoff=1, max_backoff=4)
+
+    def test_should_retry(self):
+        bad_gateway = make_response(502)
+        too_many = make_response(429)
+        self.assertTrue(self.policy.should_retry(1, True, bad_gateway))
+        self.assertFalse(self.policy.should_retry(1, False, bad_gateway))
+        self.assertTrue(self.policy.should_retry(1, False, too_many))
+        self.assertFalse(self.policy.should_retry(3, True, too_many))
+        self.assertFalse(self.policy.should_retry(1, True, make_response(404)))
+
+    def test_errors(self):
+        not_sent = requests.exceptions.ConnectTimeout()
+        lost = requests.exceptions.ReadTimeout()
+        self.assertTrue(self.policy.should_retry(1, False, error=not_sent))
+        self.assertTrue(self.policy.should_retry(1, True, error=lost))
+        self.assertFalse(self.policy.should_retry(1, False, error=lost))
+        self.assertFalse(
+                self.policy.should_retry(1, True, error=ValueError()))
+
+    def test_delay(self):
+        for attempt in range(1, 6):
+            delay = self.policy.delay(attempt)
+            self.assertLessEqual(delay, min(4, 2 ** (attempt - 1)))
+        response = make_response(429, {'Retry-After': '7'})
+        self.assertEqual(self.policy.delay(1, response), 7)
+        response = make_response(429, {'Retry-After': '3600'})
+        self.assertIsNone(self.policy.delay(1, response))
+
+    def test_parse_retry_after(self):
+        date = email.utils.formatdate(1000, usegmt=True)
+        self.assertEqual(parse_retry_after(date, now=990), 10)
+        self.assertIsNone(parse_retry_after('soon'))
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_reserve(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, places=2)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, places=2)
+
+    def test_shared_by_host(self):
+        bucket = rate_limiter('https://host.example/a', 10, 2)
+        self.assertIs(rate_limiter('https://host.example/b', 5, 1), bucket)
+        self.assertIsNot(rate_limiter('https://other.example/', 10, 2), bucket)
+
+
+class TestClientRetries(unittest.TestCase):
+
+    """idempotent and non idempotent requests of the client"""
+
+    def setUp(self):
+        self.client = Client(
+                'username',
+                token_store=MemoryTokenStore(),
+                retry_policy=RetryPolicy(max_attempts=3, backoff=0),
+                )
+        self.client._access_token = 'token'
+        self.client._hardware_id = 'hardware_id'
+
+    def test_delete_retried(self):
+        responses = [make_response(502), make_response(503),
+                     make_response(200)]
+        with mock.patch.object(self.client._session, 'get',
+                               side_effect=responses) as get:
+            self.client.delete_ebook('id')
+        self.assertEqual(get.call_count, 3)
+
+    def test_upload_not_retried(self):
+        with mock.patch.object(self.client._session, 'post',
+                               return_value=make_response(502)) as post:
+            with self.assertRaises(PytolinoException):
+                self.client.upload(TEST_EPUB)
+        self.assertEqual(post.call_count, 1)
+
+    def test_upload_rejected(self):
+        bodies = []
+
+        def fake_post(url, data, headers):
+            bodies.append(data.read())
+            if len(bodies) == 1:
+                return make_response(429, {'Retry-After': '0'})
+            return make_response(200)
+
+        with mock.patch.object(self.client._session, 'post', fake_post):
+            book_id = self.client.upload(TEST_EPUB)
+        self.assertEqual(book_id, 'id')
+        self.assertEqual(len(bodies), 2)
+        self.assertEqual(bodies[0], bodies[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
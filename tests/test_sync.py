@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+
+"""
+test the mirror of a local folder on the cloud, against the fake server
+"""
+
+import unittest
+import asyncio
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+
+from pytolino.fake_server import FakeTolinoServer
+from pytolino.tolino_cloud import Client
+from pytolino.async_tolino_cloud import AsyncClient
+from pytolino.token_store import MemoryTokenStore
+from pytolino.retry import RetryPolicy
+from pytolino.metrics import InMemoryMetrics
+from pytolino.sync import UPLOAD, REPLACE, DELETE, list_ebooks
+
+
+class TestSyncDirectory(unittest.TestCase):
+
+    """plan and run the sync of a folder"""
+
+    def setUp(self):
+        data_home = tempfile.TemporaryDirectory()
+        self.addCleanup(data_home.cleanup)
+        patcher = mock.patch.dict(os.environ, XDG_DATA_HOME=data_home.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server = FakeTolinoServer(seed=0).start()
+        self.addCleanup(self.server.stop)
+        self.server.library.add_random_books(3)
+
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = Path(folder.name)
+        (self.folder / 'sub').mkdir()
+        (self.folder / '.hidden').mkdir()
+        self.write('a.epub', b'a')
+        self.write('sub/b.pdf', b'b')
+        self.write('notes.txt', b'not an ebook')
+        self.write('.hidden/c.epub', b'c')
+
+        self.metrics = InMemoryMetrics()
+        self.client = Client(
+                'username',
+                token_store=MemoryTokenStore(),
+                server_settings=self.server.server_settings(),
+                retry_policy=RetryPolicy(backoff=0),
+                metrics=self.metrics,
+                )
+        self.client.import_token(
+                self.server.new_refresh_token(), self.server.hardware_id)
+
+    def write(self, name: str, content: bytes):
+        path = self.folder / name
+        path.write_bytes(content)
+        return path
+
+    def kinds(self, plan) -> list:
+        return sorted(action.kind for action in plan.actions)
+
+    def requests(self) -> int:
+        return sum(self.metrics.snapshot()['statuses'].values())
+
+    def test_list_ebooks(self):
+        self.assertEqual(
+                list_ebooks(self.folder),
+                [self.folder / 'a.epub', self.folder / 'sub' / 'b.pdf'])
+
+    def test_dry_run(self):
+        plan = self.client.sync_directory(self.folder, dry_run=True)
+        self.assertEqual(self.kinds(plan), [UPLOAD, UPLOAD])
+        self.assertIn('2 to upload', str(plan))
+        self.assertEqual(len(self.server.library.books), 3)
+
+    def test_sync(self):
+        plan = self.client.sync_directory(self.folder)
+        self.assertEqual(plan.failed, [])
+        book_ids = {action.result for action in plan.actions}
+        self.assertTrue(book_ids <= set(self.server.library.books))
+        self.assertEqual(len(self.server.library.books), 5)
+
+        # unchanged: no file is read, one inventory request
+        requests = self.requests()
+        with mock.patch('pytolino.sync.file_sha256') as file_sha256:
+            plan = self.client.sync_directory(self.folder)
+        file_sha256.assert_not_called()
+        self.assertEqual(plan.actions, [])
+        self.assertEqual(len(plan.unchanged), 2)
+        self.assertEqual(self.requests() - requests, 1)
+
+    def test_replace_and_delete(self):
+        self.client.sync_directory(self.folder)
+        old_ids = set(self.server.library.books)
+        self.write('a.epub', b'new a')
+        os.remove(self.folder / 'sub' / 'b.pdf')
+
+        plan = self.client.sync_directory(self.folder)
+        self.assertEqual(self.kinds(plan), [REPLACE])
+        replaced = plan.actions[0].book_id
+        self.assertNotIn(replaced, self.server.library.books)
+        self.assertIn(plan.actions[0].result, self.server.library.books)
+
+        plan = self.client.sync_directory(self.folder, delete=True)
+        self.assertEqual(self.kinds(plan), [DELETE])
+        self.assertEqual(len(self.server.library.books), 4)
+        self.assertEqual(
+                len(set(self.server.library.books) & old_ids), 3)
+        plan = self.client.sync_directory(self.folder, delete=True)
+        self.assertEqual(plan.actions, [])
+
+    def test_metadata_match(self):
+        # uploaded by another device: not in the upload index
+        self.server.library.upload('a.epub', 1)
+        plan = self.client.sync_directory(self.folder, dry_run=True)
+        self.assertEqual(self.kinds(plan), [UPLOAD])
+        self.assertEqual(
+                [local_file.path.name for local_file in plan.adopted],
+                ['a.epub'])
+
+    def test_metadata_mismatch(self):
+        # same title, other size or no size: a new book
+        other_size = self.server.library.upload('a.epub', 2)
+        no_size = self.server.library.upload('b.pdf', 1)
+        del self.server.library.books[
+                no_size['identifier']]['epubMetaData']['fileSize']
+        plan = self.client.sync_directory(self.folder)
+        self.assertEqual(self.kinds(plan), [UPLOAD, UPLOAD])
+        self.assertEqual(plan.adopted, [])
+        self.assertIn(other_size['identifier'], self.server.library.books)
+        self.assertIn(no_size['identifier'], self.server.library.books)
+
+    def test_purchased_same_title(self):
+        book_id, = self.server.library.add_random_books(1, purchased=True)
+        metadata = self.server.library.books[book_id]['epubMetaData']
+        self.write(metadata['title'] + '.epub', b'same title')
+        metadata['fileSize'] = len(b'same title')
+        plan = self.client.sync_directory(self.folder, delete=True)
+        self.assertEqual(self.kinds(plan), [UPLOAD, UPLOAD, UPLOAD])
+        self.assertEqual(plan.adopted, [])
+        self.assertIn(book_id, self.server.library.books)
+
+        os.remove(self.folder / (metadata['title'] + '.epub'))
+        plan = self.client.sync_directory(self.folder, delete=True)
+        self.assertEqual(self.kinds(plan), [DELETE])
+        self.assertIn(book_id, self.server.library.books)
+
+    def test_same_content(self):
+        self.write('copy.epub', b'a')
+        plan = self.client.sync_directory(self.folder)
+        self.assertEqual(self.kinds(plan), [UPLOAD, UPLOAD, UPLOAD])
+        plan = self.client.sync_directory(self.folder)
+        self.assertEqual(plan.actions, [])
+
+    def test_async(self):
+        async def run():
+            async with AsyncClient(
+                    'username',
+                    token_store=MemoryTokenStore(),
+                    server_settings=self.server.server_settings(),
+                    ) as client:
+                await client.import_token(
+                        self.server.new_refresh_token(),
+                        self.server.hardware_id)
+                first = await client.sync_directory(self.folder)
+                second = await client.sync_directory(self.folder)
+                return first, second
+
+        first, second = asyncio.run(run())
+        self.assertEqual(self.kinds(first), [UPLOAD, UPLOAD])
+        self.assertEqual(second.actions, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
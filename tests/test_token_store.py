@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+
+"""
+test the token stores
+"""
+
+import unittest
+import tempfile
+import time
+import threading
+from pathlib import Path
+from unittest import mock
+
+
+from pytolino.token_store import (
+        MemoryTokenStore,
+        JsonFileTokenStore,
+        SqliteTokenStore,
+        )
+from pytolino.tolino_cloud import Client
+
+
+TOKEN = dict(
+        refresh_token='refresh',
+        access_token='access',
+        hardware_id='hardware',
+        access_expiration_time=1.0,
+        refresh_expiration_time=2.0,
+        )
+
+
+class StoreTests(object):
+
+    """tests common to all the stores"""
+
+    def test_load_save(self):
+        self.assertIsNone(self.store.load('server.user'))
+        self.store.save('server.user', TOKEN)
+        self.assertEqual(self.store.load('server.user'), TOKEN)
+        self.store.save('server.user', dict(TOKEN, access_token='new'))
+        self.assertEqual(self.store.load('server.user')['access_token'], 'new')
+
+    def test_lock(self):
+        events = []
+
+        def locked_append(name):
+            with self.store.lock('server.user'):
+                events.append(f'{name} start')
+                time.sleep(0.02)
+                events.append(f'{name} end')
+
+        threads = [threading.Thread(target=locked_append, args=(i,))
+                   for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(0, len(events), 2):
+            self.assertEqual(
+                    events[i].split()[0], events[i + 1].split()[0])
+
+
+class TestMemoryTokenStore(StoreTests, unittest.TestCase):
+
+    def setUp(self):
+        self.store = MemoryTokenStore()
+
+
+class TestJsonFileTokenStore(StoreTests, unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = JsonFileTokenStore(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_no_temporary_file_left(self):
+        self.store.save('server.user', TOKEN)
+        names = [path.name for path in Path(self.tmp_dir.name).iterdir()]
+        self.assertEqual(names, ['server.user.json'])
+
+
+class TestSqliteTokenStore(StoreTests, unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = SqliteTokenStore(Path(self.tmp_dir.name) / 'tokens.db')
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+
+class TestSharedToken(unittest.TestCase):
+
+    """clients sharing a store renew the token only once"""
+
+    def test_adopt_renewed_token(self):
+        store = MemoryTokenStore()
+        client_a = Client('username', token_store=store)
+        client_b = Client('username', token_store=store)
+        token_response = mock.Mock(ok=True, **{'json.return_value': dict(
+            access_token='new_access',
+            refresh_token='new_refresh',
+            expires_in=3600,
+            refresh_expires_in=36000,
+            )})
+        with mock.patch.object(
+                client_a._session_cffi, 'post',
+                return_value=token_response), \
+                mock.patch.object(client_b._session_cffi, 'post') as post_b:
+            client_a._renew_access_token()
+            client_b._renew_access_token()
+        post_b.assert_not_called()
+        self.assertEqual(client_b.access_token, 'new_access')
+        self.assertEqual(client_b.refresh_token, 'new_refresh')
+
+
+class TestSavedCookies(unittest.TestCase):
+
+    """the cookies of the last GUI login are tried before a browser"""
+
+    def setUp(self):
+        self.store = MemoryTokenStore()
+        token = dict(TOKEN, cookies=[
+            {'name': 'session', 'value': 'abc'},
+            {'name': 'expired', 'value': 'x', 'expiry': 1},
+            ], user_agent='my agent')
+        self.store.save('orellfuessli.username', token)
+        self.client = Client('username', token_store=self.store)
+
+    def login(self, *auth_responses):
+        client = self.client
+        with mock.patch.object(
+                client._session_cffi, 'get',
+                side_effect=auth_responses), \
+                mock.patch.object(client, '_get_login_cookies') as gui, \
+                mock.patch.object(client, '_get_token'), \
+                mock.patch.object(client, '_get_hardware_id'):
+            client.login('password', allow_GUI_autologin=True)
+        return gui
+
+    def test_saved_cookies_accepted(self):
+        self.assertEqual(self.client._user_agent, 'my agent')
+        auth_response = mock.Mock(ok=True, headers={
+            'location': 'https://webreader.mytolino.com/library/?code=123'})
+        gui = self.login(auth_response)
+        gui.assert_not_called()
+        self.assertEqual(self.client._session.cookies['session'], 'abc')
+        self.assertNotIn('expired', self.client._session.cookies)
+
+    def test_saved_cookies_rejected(self):
+        rejected = mock.Mock(ok=True, headers={
+            'location': 'https://www.orellfuessli.ch/login'})
+        accepted = mock.Mock(ok=True, headers={
+            'location': 'https://webreader.mytolino.com/library/?code=123'})
+        gui = self.login(rejected, accepted)
+        gui.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
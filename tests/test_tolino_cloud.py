@@ -7,15 +7,20 @@ test all the tools in tolino cloud
 
 import unittest
 import logging
+import json
+import threading
 import time
 from pathlib import Path
 import datetime
+from unittest import mock
 
 
+import requests
 from varboxes import VarBox
 
 
 from pytolino.tolino_cloud import Client, PytolinoException
+from pytolino.upload_index import UploadIndex, file_sha256
 
 
 TEST_EPUB = 'basic-v3plus2.epub'
@@ -37,6 +42,189 @@ class TestClient(unittest.TestCase):
             Client(server_name='this tolino partner does not exists',
                    username='username')
 
+    def test_upload_many(self):
+        def fake_upload(file_path, name=None, skip_uploaded=False):
+            if file_path.stem == 'bad':
+                raise PytolinoException('upload failed')
+            return name
+
+        file_paths = [Path(f'book{i}.epub') for i in range(20)]
+        file_paths.append(Path('bad.epub'))
+        with mock.patch.object(self.client, 'upload', fake_upload):
+            results = dict(self.client.upload_many(
+                    file_paths,
+                    max_workers=3,
+                    name_fn=lambda path: path.stem,
+                    ))
+        self.assertEqual(len(results), len(file_paths))
+        self.assertIsInstance(results.pop(Path('bad.epub')), PytolinoException)
+        for file_path, name in results.items():
+            self.assertEqual(file_path.stem, name)
+
+    def test_add_to_collection_many(self):
+        items = [(f'book{i}', 'collection') for i in range(25)]
+        with mock.patch.object(self.client._session, 'patch') as patch:
+            patch.return_value = mock.Mock(ok=True, status_code=200)
+            self.client.add_to_collection_many(items, max_patches=10)
+        self.assertEqual(patch.call_count, 3)
+        data = json.loads(patch.call_args_list[0].kwargs['data'])
+        self.assertEqual(len(data['patches']), 10)
+        self.assertEqual(data['patches'][0]['op'], 'add')
+        self.assertEqual(
+                data['patches'][0]['path'], '/publications/book0/tags')
+
+    def test_collection_payload_too_large(self):
+        items = [(f'book{i}', 'collection') for i in range(4)]
+        too_large = mock.Mock(ok=False, status_code=413)
+        ok = mock.Mock(ok=True, status_code=200)
+        with mock.patch.object(self.client._session, 'patch') as patch:
+            patch.side_effect = [too_large, ok, ok]
+            self.client.remove_from_collection_many(items)
+        self.assertEqual(patch.call_count, 3)
+        data = json.loads(patch.call_args_list[-1].kwargs['data'])
+        self.assertEqual(len(data['patches']), 2)
+        self.assertEqual(data['patches'][0]['op'], 'remove')
+
+    def test_update_metadata_many(self):
+        client = Client('username')
+        inventory = {'PublicationInventory': {
+            'edata': [{'epubMetaData': {'identifier': 'a', 'title': 'stale'}}],
+            'ebook': [],
+            }}
+        server_metadata = {
+                'a': {'title': 'old', 'publisher': 'p'},
+                'b': {'title': 'old'},
+                }
+        meta_gets = []
+
+        def fake_get(url, params=None, headers=None, stream=False):
+            if url == client._inventory_url:
+                return mock.Mock(ok=True, **{'json.return_value': inventory})
+            book_id = params['deliverableId']
+            meta_gets.append(book_id)
+            if book_id in server_metadata:
+                metadata = {'metadata': server_metadata[book_id]}
+                return mock.Mock(ok=True, **{'json.return_value': metadata})
+            return mock.Mock(
+                    ok=False, status_code=404, url=url, content=b'',
+                    headers={}, request=mock.Mock(method='GET', headers={}))
+
+        updates = [
+                ('a', {'title': 'new'}),
+                ('b', {'title': 'new'}),
+                ('a', {'author': 'me'}),
+                ('c', {'title': 'new'}),
+                ]
+        with mock.patch.object(client._session, 'get', fake_get), \
+                mock.patch.object(client._session, 'put') as put:
+            put.return_value = mock.Mock(ok=True)
+            client.get_inventory()
+            results = client.update_metadata_many(updates, max_workers=2)
+            self.assertEqual(put.call_count, 2)
+            self.assertIsNone(results['a'])
+            self.assertIsNone(results['b'])
+            self.assertIsInstance(results['c'], PytolinoException)
+            put_data = [json.loads(call.kwargs['data'])['uploadMetaData']
+                        for call in put.call_args_list]
+            # built from the meta response, not from the inventory
+            self.assertIn(
+                    {'title': 'new', 'author': 'me', 'publisher': 'p'},
+                    put_data)
+
+            # the metadata sent is cached, no GET for the next update
+            client.upload_metadata('b', author='me')
+            put_data = json.loads(put.call_args.kwargs['data'])
+            self.assertEqual(
+                    put_data['uploadMetaData'],
+                    {'title': 'new', 'author': 'me'})
+
+            # the cache expires
+            client.META_CACHE_MAX_AGE = -1
+            server_metadata['b'] = {'title': 'changed elsewhere'}
+            client.upload_metadata('b', author='me')
+            put_data = json.loads(put.call_args.kwargs['data'])
+            self.assertEqual(
+                    put_data['uploadMetaData'],
+                    {'title': 'changed elsewhere', 'author': 'me'})
+        self.assertCountEqual(meta_gets, ['a', 'b', 'c', 'b'])
+
+    def _fake_renew(self, client, renewals):
+        def renew():
+            renewals.append(time.time())
+            time.sleep(0.05)
+            client._access_expiration_time = time.time() + 3600
+        return renew
+
+    def test_single_flight_token_refresh(self):
+        client = Client('username', token_refresh_margin=60)
+        client._access_expiration_time = time.time() + 10
+        renewals = []
+        with mock.patch.object(
+                client, '_renew_access_token',
+                self._fake_renew(client, renewals)):
+            threads = [
+                    threading.Thread(target=client._get_auth_headers)
+                    for _ in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(renewals), 1)
+
+    def test_token_refresher(self):
+        client = Client('username', token_refresh_margin=60)
+        client._access_expiration_time = time.time() + 60.1
+        renewals = []
+        with mock.patch.object(
+                client, '_renew_access_token',
+                self._fake_renew(client, renewals)):
+            client.start_token_refresher()
+            time.sleep(0.5)
+            client.stop_token_refresher()
+        self.assertEqual(len(renewals), 1)
+
+    def test_token_refresher_error(self):
+        client = Client('username', token_refresh_margin=60)
+        client.TOKEN_REFRESHER_RETRY_DELAY = 0.05
+        client._access_expiration_time = time.time() + 60.1
+        renewals = []
+        fake_renew = self._fake_renew(client, renewals)
+        errors = [requests.ConnectionError('network down')]
+
+        def failing_renew(*args, **kwargs):
+            if errors:
+                raise errors.pop()
+            fake_renew(*args, **kwargs)
+
+        with mock.patch.object(client, '_renew_access_token', failing_renew), \
+                self.assertLogs(level='ERROR') as logs:
+            client.start_token_refresher()
+            time.sleep(0.5)
+            self.assertTrue(client._refresher_thread.is_alive())
+            client.stop_token_refresher()
+        self.assertEqual(len(renewals), 1)
+        self.assertIn('ConnectionError', logs.output[0])
+
+    def test_skip_uploaded(self):
+        epub_fp = Path(__file__).parent / TEST_EPUB
+        client = Client('username')
+        client._upload_index = UploadIndex(':memory:')
+        client._upload_index.add(file_sha256(epub_fp), 'book_id')
+        inventory = {'PublicationInventory': {
+            'edata': [{'epubMetaData': {'identifier': 'book_id'}}],
+            'ebook': [],
+            }}
+        inventory_response = mock.Mock(
+                ok=True, **{'json.return_value': inventory})
+        with mock.patch.object(client._session, 'get') as get, \
+                mock.patch.object(client._session, 'post') as post:
+            get.return_value = inventory_response
+            book_id = client.upload(epub_fp, skip_uploaded=True)
+        # the inventory is downloaded to check that the book is still there
+        self.assertEqual(get.call_args.args[0], client._inventory_url)
+        post.assert_not_called()
+        self.assertEqual(book_id, 'book_id')
+
 
 def upload_test():
 
@@ -108,10 +296,7 @@ def metadata_test():
 
     client.upload_metadata(ebook_id, **metadata)
 
-    inventory = client.get_inventory()
-    book = [
-            el for el in inventory if el[
-                'epubMetaData']['identifier'] == ebook_id][0]
+    book = client.inventory.get(ebook_id)
     online_metadata = book['epubMetaData']
     for key in metadata:
         print(key, online_metadata[key])
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+
+"""
+test the sessions of the endpoint groups
+"""
+
+import unittest
+import socket
+
+import requests
+import curl_cffi
+
+
+from pytolino.transport import Transport, AUTH, BOSH
+from pytolino.tolino_cloud import Client
+from pytolino.token_store import MemoryTokenStore
+
+
+class TestTransport(unittest.TestCase):
+
+    """one session per group, sharing the cookies"""
+
+    def setUp(self):
+        self.transport = Transport({
+            AUTH: {'impersonate': 'chrome'},
+            BOSH: {'pool_size': 4, 'keep_alive': 30},
+            })
+        self.addCleanup(self.transport.close)
+
+    def test_backends(self):
+        self.assertIsInstance(self.transport.session(AUTH), curl_cffi.Session)
+        self.assertIsInstance(self.transport.session(BOSH), requests.Session)
+        self.assertEqual(
+                self.transport.body_arguments(BOSH, b'body'),
+                {'data': b'body'})
+        self.assertEqual(
+                self.transport.body_arguments(AUTH, b'body'),
+                {'content': b'body'})
+
+    def test_shared_cookies(self):
+        self.transport.cookies.set('session', 'abc')
+        self.assertEqual(
+                self.transport.session(AUTH).cookies.get('session'), 'abc')
+        self.assertEqual(
+                self.transport.session(BOSH).cookies.get('session'), 'abc')
+        self.transport.cookies.clear()
+        self.assertIsNone(self.transport.session(AUTH).cookies.get('session'))
+
+    def test_pool_and_keep_alive(self):
+        session = self.transport.session(BOSH)
+        adapter = session.get_adapter('https://bosh.pageplace.de')
+        self.assertEqual(adapter._pool_maxsize, 4)
+        options = adapter.poolmanager.connection_pool_kw['socket_options']
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), options)
+        self.transport.ensure_pool_size(BOSH, 16)
+        adapter = session.get_adapter('https://bosh.pageplace.de')
+        self.assertEqual(adapter._pool_maxsize, 16)
+
+    def test_http2(self):
+        transport = Transport({BOSH: {'http2': True}})
+        self.addCleanup(transport.close)
+        self.assertIsInstance(transport.session(BOSH), curl_cffi.Session)
+        self.assertEqual(
+                transport.body_arguments(BOSH, b'body'), {'content': b'body'})
+
+    def test_client_settings(self):
+        client = Client(
+                'username',
+                token_store=MemoryTokenStore(),
+                transport_settings={BOSH: {'http2': True}},
+                )
+        self.assertIsInstance(client._session, curl_cffi.Session)
+        self.assertEqual(
+                client._transport.settings(AUTH)['impersonate'], 'chrome')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+
+"""
+test the local index of uploaded files
+"""
+
+import unittest
+import hashlib
+import tempfile
+from pathlib import Path
+
+
+from pytolino.upload_index import UploadIndex, file_sha256
+
+
+TEST_EPUB = Path(__file__).parent / 'basic-v3plus2.epub'
+
+
+class TestUploadIndex(unittest.TestCase):
+
+    """add, get and remove books from the index"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp_dir.name) / 'uploads.sqlite'
+        self.index = UploadIndex(self.db_path)
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp_dir.cleanup()
+
+    def test_file_sha256(self):
+        expected = hashlib.sha256(TEST_EPUB.read_bytes()).hexdigest()
+        self.assertEqual(file_sha256(TEST_EPUB, chunk_size=1000), expected)
+
+    def test_add_get_remove(self):
+        self.assertIsNone(self.index.get('sha'))
+        self.index.add('sha', 'book_id', 'book.epub')
+        self.assertEqual(self.index.get('sha'), 'book_id')
+        self.index.remove_book('book_id')
+        self.assertIsNone(self.index.get('sha'))
+
+    def test_persistent(self):
+        self.index.add('sha', 'book_id')
+        other_index = UploadIndex(self.db_path)
+        self.assertEqual(other_index.get('sha'), 'book_id')
+        other_index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
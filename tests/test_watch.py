@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+
+"""
+test the watch folder against the fake server
+"""
+
+import unittest
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+
+from pytolino.fake_server import FakeTolinoServer
+from pytolino.tolino_cloud import Client
+from pytolino.token_store import MemoryTokenStore
+from pytolino.retry import RetryPolicy
+from pytolino.watch import FolderWatcher
+
+
+class TestFolderWatcher(unittest.TestCase):
+
+    """files are uploaded once complete, and set aside"""
+
+    def setUp(self):
+        data_home = tempfile.TemporaryDirectory()
+        self.addCleanup(data_home.cleanup)
+        patcher = mock.patch.dict(os.environ, XDG_DATA_HOME=data_home.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server = FakeTolinoServer(seed=0).start()
+        self.addCleanup(self.server.stop)
+        self.client = Client(
+                'username',
+                token_store=MemoryTokenStore(),
+                server_settings=self.server.server_settings(),
+                retry_policy=RetryPolicy(backoff=0),
+                )
+        self.client.import_token(
+                self.server.new_refresh_token(), self.server.hardware_id)
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.spool = Path(folder.name) / 'spool'
+        self.spool.mkdir()
+        self.done = Path(folder.name) / 'done'
+
+    def new_watcher(self, **kwargs):
+        kwargs = dict(settle=0.05, debounce=0.05, poll_interval=0.02,
+                      **kwargs)
+        return FolderWatcher(self.client, self.spool, **kwargs)
+
+    def step_until_batch(self, watcher, timeout=5) -> list:
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            results = watcher.step()
+            if results:
+                return results
+        self.fail('no batch was uploaded')
+
+    def test_polling(self):
+        (self.spool / 'a.epub').write_bytes(b'a')
+        (self.spool / 'b.PDF').write_bytes(b'b')
+        (self.spool / 'notes.txt').write_bytes(b'notes')
+        watcher = self.new_watcher(use_inotify=False, done_dir=self.done)
+        self.assertFalse(watcher.uses_inotify)
+        results = self.step_until_batch(watcher)
+        self.assertEqual(
+                sorted(path.name for path, _ in results), ['a.epub', 'b.PDF'])
+        for _, book_id in results:
+            self.assertIn(book_id, self.server.library.books)
+        self.assertEqual(
+                sorted(path.name for path in self.done.iterdir()),
+                ['a.epub', 'b.PDF'])
+        self.assertEqual(
+                [path.name for path in self.spool.iterdir()], ['notes.txt'])
+
+    def test_inotify_waits_for_close(self):
+        watcher = self.new_watcher()
+        if not watcher.uses_inotify:
+            self.skipTest('no inotify')
+        with open(self.spool / 'slow.epub', 'wb') as f:
+            f.write(b'first part')
+            f.flush()
+            end = time.monotonic() + 0.3
+            while time.monotonic() < end:
+                self.assertEqual(watcher.step(), [])
+            f.write(b'second part')
+        results = self.step_until_batch(watcher)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(
+                [path.name for path in self.spool.iterdir()],
+                ['slow.epub.uploaded'])
+
+    def test_same_content_twice(self):
+        watcher = self.new_watcher(done_dir=self.done)
+        (self.spool / 'a.epub').write_bytes(b'a')
+        (first_path, first_id), = self.step_until_batch(watcher)
+        (self.spool / 'a.epub').write_bytes(b'a')
+        (second_path, second_id), = self.step_until_batch(watcher)
+        # the second file is in the upload index, it is not sent again
+        self.assertEqual(second_id, first_id)
+        self.assertEqual(list(self.server.library.books), [first_id])
+        self.assertEqual(
+                sorted(path.name for path in self.done.iterdir()),
+                ['a.1.epub', 'a.epub'])
+
+    def test_deleted_on_cloud(self):
+        watcher = self.new_watcher(done_dir=self.done)
+        (self.spool / 'a.epub').write_bytes(b'a')
+        (_, first_id), = self.step_until_batch(watcher)
+        (self.spool / 'a.epub').write_bytes(b'a')
+        (_, same_id), = self.step_until_batch(watcher)
+        self.assertEqual(same_id, first_id)
+        # another device deletes the book, the same file is dropped again
+        self.server.library.delete(first_id)
+        (self.spool / 'a.epub').write_bytes(b'a')
+        (_, second_id), = self.step_until_batch(watcher)
+        self.assertNotEqual(second_id, first_id)
+        self.assertEqual(list(self.server.library.books), [second_id])
+
+    def test_failed(self):
+        (self.spool / 'a.epub').write_bytes(b'a')
+        watcher = self.new_watcher()
+        self.server.fail_next('upload', 502)
+        results = self.step_until_batch(watcher)
+        self.assertIsInstance(results[0][1], Exception)
+        self.assertEqual(
+                [path.name for path in self.spool.iterdir()],
+                ['a.epub.failed'])
+
+    def test_run(self):
+        watcher = self.new_watcher(done_dir=self.done)
+        thread = threading.Thread(target=watcher.run)
+        thread.start()
+        try:
+            (self.spool / 'a.epub').write_bytes(b'a')
+            end = time.monotonic() + 5
+            while not (self.done / 'a.epub').exists():
+                self.assertLess(time.monotonic(), end)
+                time.sleep(0.01)
+        finally:
+            watcher.stop()
+            thread.join()
+        self.assertEqual(len(self.server.library.books), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()